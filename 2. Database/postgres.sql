@@ -15,7 +15,14 @@ CREATE TABLE orders (
   id BIGSERIAL PRIMARY KEY,
   user_id BIGINT NOT NULL REFERENCES users(id),
   status TEXT NOT NULL CHECK (status IN ('pending','paid','shipped','cancelled')),
-  created_at TIMESTAMPTZ DEFAULT now()
+  created_at TIMESTAMPTZ DEFAULT now(),
+  -- Set on every status change; clients send back the value they saw to detect
+  -- concurrent changes (see db_operations.transition_order_status)
+  updated_at TIMESTAMPTZ,
+  -- Denormalized totals of the order's items (written together with the items,
+  -- so order lists don't have to read order_items)
+  total_amount_cents BIGINT NOT NULL DEFAULT 0,
+  total_quantity INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE order_items (
@@ -26,9 +33,48 @@ CREATE TABLE order_items (
   price_cents_at_purchase INTEGER NOT NULL
 );
 
--- Helpful indexes
-CREATE INDEX idx_orders_user_id ON orders(user_id);
-CREATE INDEX idx_order_items_order_id ON order_items(order_id);
+-- Idempotency-Key header of POST /orders -> the order that request created,
+-- so a retried request gets the same response instead of a second order
+-- (see db_operations.create_order_idempotent). Rows past expires_at are
+-- deleted by "python maintenance.py gc-idempotency-keys"
+CREATE TABLE idempotency_keys (
+  key TEXT PRIMARY KEY,
+  request_hash TEXT NOT NULL,
+  expires_at TIMESTAMPTZ NOT NULL,
+  response JSONB,
+  created_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Change counter per table (users, products): bumped in the same transaction
+-- as every insert, so "has the list changed?" is one primary key lookup
+-- (ETag / If-None-Match of GET /users and GET /products, see
+-- db_operations.get_table_version)
+CREATE TABLE table_versions (
+  table_name TEXT PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  changed_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Helpful indexes (one per access path; check them with explain_check.py)
+-- A user's orders, paged by ID (list_orders) / by date (order history, last order date)
+CREATE INDEX idx_orders_user_id_id ON orders(user_id, id);
+CREATE INDEX idx_orders_user_id_created_at ON orders(user_id, created_at);
+-- Fulfillment backlog: orders still to be processed, oldest first. Partial index:
+-- shipped/cancelled orders (most of the table, growing forever) are not in it
+CREATE INDEX idx_orders_open_status_created_at ON orders(status, created_at, id)
+  WHERE status IN ('pending', 'paid');
+-- Items of an order (list_orders, exports); also serves "does order X contain product Y"
+CREATE INDEX idx_order_items_order_id_product_id ON order_items(order_id, product_id);
+-- Orders containing a product (reverse lookup), and the foreign key check
+-- when a product is deleted (without it both scan all of order_items)
+CREATE INDEX idx_order_items_product_id_order_id ON order_items(product_id, order_id);
+-- Login looks users up by exact full name or case-insensitive email
+CREATE INDEX idx_users_full_name ON users(full_name);
+-- text_pattern_ops indexes serve both "lower(x) = ?" and prefix searches "lower(x) LIKE 'abc%'"
+CREATE INDEX idx_users_lower_email ON users(lower(email) text_pattern_ops);
+CREATE INDEX idx_users_lower_full_name ON users(lower(full_name) text_pattern_ops);
+-- Expired idempotency keys, oldest first (gc-idempotency-keys deletes them in batches)
+CREATE INDEX idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
 
 
 -- 示例数据插入脚本
@@ -212,6 +258,31 @@ INSERT INTO order_items (order_id, product_id, quantity, price_cents_at_purchase
 (27, 1, 1, 249999), -- MacBook Pro
 (27, 8, 1, 159999); -- Studio Display
 
+-- 5. 计算订单汇总 (orders.total_amount_cents / total_quantity)
+UPDATE orders o
+SET total_amount_cents = t.total_amount_cents,
+    total_quantity = t.total_quantity
+FROM (
+  SELECT order_id, SUM(price_cents_at_purchase) AS total_amount_cents, SUM(quantity) AS total_quantity
+  FROM order_items
+  GROUP BY order_id
+) t
+WHERE t.order_id = o.id;
+
+-- Per-user order summary for account dashboards (read by db_operations.user_order_summary
+-- with ORDER_SUMMARY_SOURCE=view). Refresh with: python maintenance.py refresh-order-summary
+-- The unique index is required by REFRESH MATERIALIZED VIEW CONCURRENTLY.
+CREATE MATERIALIZED VIEW user_order_summary AS
+SELECT u.id AS user_id,
+       COUNT(o.id) AS order_count,
+       COALESCE(SUM(o.total_amount_cents) FILTER (WHERE o.status <> 'cancelled'), 0)::bigint AS lifetime_spend_cents,
+       MAX(o.created_at) AS last_order_at,
+       now() AS refreshed_at
+FROM users u
+LEFT JOIN orders o ON o.user_id = u.id
+GROUP BY u.id;
+CREATE UNIQUE INDEX idx_user_order_summary_user_id ON user_order_summary(user_id);
+
 -- 验证数据
 SELECT 'Users count:' as table_name, COUNT(*) as count FROM users
 UNION ALL
@@ -0,0 +1,233 @@
+"""
+Benchmark: sync API (order_api.py) vs async API (order_api_async.py) at equal memory
+
+Starts each server as a subprocess, sends it the same read-heavy request mix
+from many concurrent clients, and reports throughput and latency next to the
+memory (RSS) the server used:
+
+- async: hypercorn order_api_async:app with --async-workers processes
+- sync:  gunicorn order_api:app with --threads threads per worker; the number
+  of workers is chosen so the sync server uses about as much memory as the
+  async one (unless --sync-workers is given)
+
+Request mix (per client, in a loop until --duration runs out):
+- GET /orders?user_id=X&limit=20   (50%)
+- GET /products?limit=100          (25%)
+- GET /users/search?q=XY           (25%)
+
+Usage:
+    python bench_async_api.py
+    python bench_async_api.py --concurrency 200 --duration 30 --async-workers 2 --threads 8
+
+Note: needs gunicorn and hypercorn (see requirements.txt), Linux (memory is
+read from /proc), and at least a few users with orders in the database
+configured in .env - point DATABASE_URL at a development database.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+
+from bench_common import summarize
+from db_operations import list_users
+
+HOST = "127.0.0.1"
+
+
+# ============================================================================
+# Server processes
+# ============================================================================
+
+def start_server(kind: str, port: int, workers: int, threads: int) -> subprocess.Popen:
+    """Start the sync (gunicorn) or async (hypercorn) server and wait until it answers."""
+    bind = f"{HOST}:{port}"
+    if kind == "async":
+        command = ["hypercorn", "order_api_async:app", "--bind", bind, "--workers", str(workers)]
+    else:
+        command = ["gunicorn", "order_api:app", "--bind", bind, "--workers", str(workers),
+                   "--threads", str(threads), "--worker-class", "gthread"]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://{bind}/admin/product-cache", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{kind} server did not start: {' '.join(command)}")
+
+
+def stop_server(process: subprocess.Popen):
+    """Stop a server started by start_server()."""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def tree_rss_mb(pid: int) -> float:
+    """Resident memory (MB) of a process and all its children (Linux /proc)."""
+    total_kb = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as children:
+                    pids.extend(int(child) for child in children.read().split())
+        except FileNotFoundError:
+            continue  # process exited meanwhile
+    return total_kb / 1024
+
+
+# ============================================================================
+# Load generator (a minimal HTTP/1.1 keep-alive client on asyncio streams)
+# ============================================================================
+
+async def http_get(conn: dict, port: int, path: str) -> int:
+    """
+    GET `path` over the client's keep-alive connection (reconnecting if needed).
+
+    Returns:
+        The HTTP status code
+    """
+    if conn.get("writer") is None:
+        conn["reader"], conn["writer"] = await asyncio.open_connection(HOST, port)
+    reader, writer = conn["reader"], conn["writer"]
+
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {HOST}\r\nConnection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+        elif name.lower() == "connection" and value.strip().lower() == "close":
+            keep_alive = False
+    await reader.readexactly(length)
+
+    if not keep_alive:
+        writer.close()
+        conn["writer"] = None
+    return status
+
+
+def next_path(user_ids: list, rng: random.Random) -> str:
+    """Pick the next request of the mix."""
+    roll = rng.random()
+    if roll < 0.5:
+        return f"/orders?user_id={rng.choice(user_ids)}&limit=20"
+    if roll < 0.75:
+        return "/products?limit=100"
+    return "/users/search?q=" + rng.choice("abcdefghijklmnopqrstuvwxyz") + rng.choice("aeiou")
+
+
+async def client(port: int, user_ids: list, stop_at: float, seed: int, timings_ms: list, errors: list):
+    """One simulated client: send requests back to back until stop_at."""
+    rng = random.Random(seed)
+    conn = {}
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            status = await http_get(conn, port, next_path(user_ids, rng))
+            if status != 200:
+                errors.append(status)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+            errors.append(e.__class__.__name__)
+            if conn.get("writer") is not None:
+                conn["writer"].close()  # otherwise every failed request leaks a socket
+            conn["writer"] = None
+            continue
+        timings_ms.append((time.perf_counter() - start) * 1000)
+    if conn.get("writer") is not None:
+        conn["writer"].close()
+
+
+async def run_load(port: int, user_ids: list, concurrency: int, duration: float) -> dict:
+    """Run `concurrency` clients for `duration` seconds and collect latencies."""
+    timings_ms = []
+    errors = []
+    stop_at = time.monotonic() + duration
+    await asyncio.gather(*(
+        client(port, user_ids, stop_at, seed, timings_ms, errors)
+        for seed in range(concurrency)
+    ))
+    return {
+        "requests": len(timings_ms),
+        "errors": len(errors),
+        "rps": len(timings_ms) / duration,
+        **summarize(timings_ms)
+    }
+
+
+def benchmark(kind: str, port: int, workers: int, threads: int, user_ids: list, args) -> dict:
+    """Start one server, warm it up, load it, and return throughput/latency/memory."""
+    process = start_server(kind, port, workers, threads)
+    try:
+        asyncio.run(run_load(port, user_ids, min(args.concurrency, 10), args.warmup))
+        result = asyncio.run(run_load(port, user_ids, args.concurrency, args.duration))
+        result["rss_mb"] = tree_rss_mb(process.pid)
+    finally:
+        stop_server(process)
+    result["server"] = f"{kind} ({workers} worker{'s' if workers > 1 else ''}" + \
+        (f" x {threads} threads)" if kind == "sync" else ")")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare order_api.py and order_api_async.py at equal memory")
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per server")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of light load before measuring")
+    parser.add_argument("--async-workers", type=int, default=1, help="hypercorn worker processes")
+    parser.add_argument("--sync-workers", type=int, default=None,
+                        help="gunicorn worker processes (default: match the async server's memory)")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker")
+    parser.add_argument("--port", type=int, default=8090, help="Port the servers listen on")
+    args = parser.parse_args()
+
+    user_ids = [user["id"] for user in list_users(limit=100)["users"]]
+    if not user_ids:
+        sys.exit("No users in the database - create some users and orders first")
+
+    results = [benchmark("async", args.port, args.async_workers, 1, user_ids, args)]
+
+    sync_workers = args.sync_workers
+    if sync_workers is None:
+        # Measure one idle sync worker, then run as many as fit in the async server's memory
+        probe = start_server("sync", args.port, 1, args.threads)
+        try:
+            urllib.request.urlopen(f"http://{HOST}:{args.port}/orders?user_id={user_ids[0]}").read()
+            per_worker_mb = tree_rss_mb(probe.pid)
+        finally:
+            stop_server(probe)
+        sync_workers = max(1, round(results[0]["rss_mb"] / per_worker_mb))
+    results.append(benchmark("sync", args.port, sync_workers, args.threads, user_ids, args))
+
+    print(f"{'server':<30}{'RSS MB':>8}{'req/s':>9}{'req/s/100MB':>13}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'errors':>8}")
+    for row in results:
+        print(f"{row['server']:<30}{row['rss_mb']:>8.0f}{row['rps']:>9.0f}{row['rps'] / row['rss_mb'] * 100:>13.0f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark Helpers
+
+Small helpers shared by the bench_*.py scripts:
+- StatementCounter: counts the round trips a block of code makes to PostgreSQL
+- percentile: nearest-rank percentile of a list of timings
+- summarize: p50/p95/p99/max of a list of timings in milliseconds
+"""
+import math
+
+from sqlalchemy import event
+
+from database import engine, pool_telemetry
+
+
+class StatementCounter:
+    """
+    Count database round trips made while the `with` block is running.
+
+    Usage:
+        with StatementCounter() as counter:
+            create_order(1, "pending", items)
+        print(counter.round_trips)
+
+    What is counted:
+    - statements: SQL statements sent through a cursor (a batched multi-row
+      INSERT counts once per batch, because it is one statement on the wire)
+    - transactions: BEGIN / COMMIT / ROLLBACK issued by SQLAlchemy
+    - checkouts: connections taken from the pool (free unless pinged)
+    - pings: pre-ping round trips sent on checkout (see DB_PRE_PING in database.py)
+    """
+
+    def __init__(self, target_engine=engine):
+        self.engine = target_engine
+        self.statements = 0
+        self.transactions = 0
+        self.checkouts = 0
+        self.pings = 0
+        self._pings_at_start = 0
+
+    @property
+    def round_trips(self) -> int:
+        """Total number of round trips (statements + transaction control + pings)."""
+        return self.statements + self.transactions + self.pings
+
+    def _on_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    def _on_transaction(self, conn, *args):
+        self.transactions += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_statement)
+        event.listen(self.engine, "begin", self._on_transaction)
+        event.listen(self.engine, "commit", self._on_transaction)
+        event.listen(self.engine, "rollback", self._on_transaction)
+        event.listen(self.engine, "checkout", self._on_checkout)
+        self._pings_at_start = pool_telemetry.snapshot()["pre_pings"]
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, "before_cursor_execute", self._on_statement)
+        event.remove(self.engine, "begin", self._on_transaction)
+        event.remove(self.engine, "commit", self._on_transaction)
+        event.remove(self.engine, "rollback", self._on_transaction)
+        event.remove(self.engine, "checkout", self._on_checkout)
+        self.pings = pool_telemetry.snapshot()["pre_pings"] - self._pings_at_start
+        return False
+
+
+def percentile(values: list, pct: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values: List of numbers (does not need to be sorted)
+        pct: Percentile between 0 and 100 (e.g., 95 for p95)
+
+    Returns:
+        The value at that percentile, or 0.0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(timings_ms: list) -> dict:
+    """Return p50/p95/p99/max (all in milliseconds) for a list of timings."""
+    return {
+        "p50_ms": round(percentile(timings_ms, 50), 3),
+        "p95_ms": round(percentile(timings_ms, 95), 3),
+        "p99_ms": round(percentile(timings_ms, 99), 3),
+        "max_ms": round(max(timings_ms), 3) if timings_ms else 0.0
+    }
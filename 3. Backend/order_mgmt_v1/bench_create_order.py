@@ -0,0 +1,127 @@
+"""
+Benchmark: create_order round trips
+
+Compares the current create_order() (one product query + one multi-row item
+insert) with the previous implementation, which ran one SELECT per line item
+and re-read the order after committing.
+
+For each cart size it reports:
+- round trips per order (statements + BEGIN/COMMIT + pool pre-pings)
+- p50/p95 latency per order
+
+Usage:
+    python bench_create_order.py
+    python bench_create_order.py --items 1,10,30,80 --repeat 20
+
+Note: this script writes a test user, test products and orders into the
+database configured in .env - point DATABASE_URL at a development database.
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+
+from bench_common import StatementCounter, summarize
+from database import get_db
+from db_operations import create_user, create_product, create_order
+from models import Products, Orders, OrderItems
+
+
+def create_order_per_item(user_id: int, status: str, items: list) -> dict:
+    """
+    The previous create_order() implementation, kept here as the baseline.
+
+    One SELECT per line item, then refresh + re-query of the order to pick up
+    the item IDs.
+    """
+    db = get_db()
+    try:
+        new_order = Orders(user_id=user_id, status=status, created_at=datetime.now(timezone.utc))
+        db.add(new_order)
+        db.flush()
+
+        total_amount = 0
+        total_quantity = 0
+        items_list = []
+        for item_data in items:
+            product = db.query(Products).filter(Products.id == item_data["product_id"]).first()
+            price_at_purchase = product.price_cents * item_data["quantity"]
+            order_item = OrderItems(
+                order_id=new_order.id,
+                product_id=item_data["product_id"],
+                quantity=item_data["quantity"],
+                price_cents_at_purchase=price_at_purchase
+            )
+            db.add(order_item)
+            total_amount += price_at_purchase
+            total_quantity += item_data["quantity"]
+            items_list.append({
+                "product_id": order_item.product_id,
+                "quantity": order_item.quantity,
+                "price_cents_at_purchase": order_item.price_cents_at_purchase,
+                "product_name": product.name if product else None
+            })
+
+        db.commit()
+        db.refresh(new_order)
+        new_order = db.query(Orders).filter(Orders.id == new_order.id).first()
+        for i, db_item in enumerate(new_order.order_items):
+            items_list[i]["id"] = db_item.id
+
+        return {
+            "id": new_order.id,
+            "user_id": new_order.user_id,
+            "status": new_order.status,
+            "created_at": new_order.created_at.isoformat() if new_order.created_at else None,
+            "items": items_list,
+            "total_amount_cents": total_amount,
+            "total_quantity": total_quantity
+        }
+    finally:
+        db.close()
+
+
+def run(label: str, create_fn, user_id: int, items: list, repeat: int) -> dict:
+    """Create `repeat` orders with `create_fn` and collect round trips and latency."""
+    round_trips = []
+    timings_ms = []
+    for _ in range(repeat):
+        with StatementCounter() as counter:
+            start = time.perf_counter()
+            create_fn(user_id, "pending", items)
+            timings_ms.append((time.perf_counter() - start) * 1000)
+        round_trips.append(counter.round_trips)
+
+    return {
+        "implementation": label,
+        "items": len(items),
+        "round_trips_per_order": sum(round_trips) / len(round_trips),
+        **summarize(timings_ms)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare create_order round trips before/after batching")
+    parser.add_argument("--items", default="1,10,30,80", help="Comma-separated cart sizes to test")
+    parser.add_argument("--repeat", type=int, default=20, help="Orders to create per cart size and implementation")
+    args = parser.parse_args()
+    cart_sizes = [int(n) for n in args.items.split(",")]
+
+    # Set up one user and enough products for the largest cart
+    stamp = int(time.time())
+    user = create_user(f"bench-{stamp}@example.com", "Benchmark User")
+    product_ids = [
+        create_product(f"Benchmark Product {i}", 100 + i)["id"]
+        for i in range(max(cart_sizes))
+    ]
+
+    print(f"{'implementation':<16}{'items':>7}{'round trips':>14}{'p50 ms':>10}{'p95 ms':>10}")
+    for size in cart_sizes:
+        items = [{"product_id": product_id, "quantity": 1} for product_id in product_ids[:size]]
+        for label, create_fn in (("per-item (old)", create_order_per_item), ("batched", create_order)):
+            row = run(label, create_fn, user["id"], items, args.repeat)
+            print(f"{row['implementation']:<16}{row['items']:>7}{row['round_trips_per_order']:>14.1f}"
+                  f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark: JSON serialization of the API responses
+
+Compares the ways a response body can be produced from the dictionaries the
+db_operations functions return:
+- isoformat + json (old): every timestamp turned into a string in Python
+  (one .isoformat() call per row, as db_operations used to do), then Flask's
+  default provider (json module)
+- stdlib: datetimes left in the dictionaries, serialized by StdlibJSONProvider
+- orjson: datetimes left in the dictionaries, serialized by OrjsonJSONProvider
+  (skipped if orjson is not installed)
+
+Payload shapes (built in memory, no database reads):
+- list_orders: one page of GET /orders, for different items-per-order fan-outs
+- create_order: the POST /orders response
+
+For each shape it reports p50/p95 of building the dictionaries (like the
+db_operations loops do) plus jsonify(), and the body size. All serializers
+produce the same body.
+
+Usage:
+    python bench_json.py
+    python bench_json.py --orders 500 --items 1,5,20 --repeat 200
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, jsonify
+
+from bench_common import summarize
+from json_provider import JSON_PROVIDERS, orjson
+
+
+def order_dict(order_id: int, items_per_order: int, created_at: datetime, isoformat: bool) -> dict:
+    """One order as list_orders() returns it (timestamps as strings if isoformat, like the old code)."""
+    updated_at = created_at + timedelta(minutes=5)
+    items = [
+        {
+            "id": order_id * 100 + i,
+            "product_id": i + 1,
+            "quantity": 1 + i % 3,
+            "price_cents_at_purchase": 1999 + i,
+            "product_name": f"Benchmark Product {i}"
+        }
+        for i in range(items_per_order)
+    ]
+    return {
+        "id": order_id,
+        "user_id": 1,
+        "user_name": "Benchmark User",
+        "status": "paid",
+        "created_at": created_at.isoformat() if isoformat else created_at,
+        "updated_at": updated_at.isoformat() if isoformat else updated_at,
+        "items": items,
+        "total_amount_cents": sum(item["price_cents_at_purchase"] for item in items),
+        "total_quantity": sum(item["quantity"] for item in items)
+    }
+
+
+def list_orders_payload(orders: int, items_per_order: int, isoformat: bool) -> dict:
+    """One page of GET /orders."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return {
+        "orders": [
+            order_dict(n + 1, items_per_order, start + timedelta(seconds=n, microseconds=n), isoformat)
+            for n in range(orders)
+        ],
+        "next_cursor": orders
+    }
+
+
+def create_order_payload(items_per_order: int, isoformat: bool) -> dict:
+    """The POST /orders response."""
+    order = order_dict(1, items_per_order, datetime(2024, 1, 1, tzinfo=timezone.utc), isoformat)
+    return {key: order[key] for key in ("id", "user_id", "status", "created_at", "items")}
+
+
+def make_app(serializer: str) -> Flask:
+    app = Flask(__name__)
+    app.json = JSON_PROVIDERS[serializer](app)
+    return app
+
+
+def run(app: Flask, build_body, repeat: int) -> dict:
+    """Time `repeat` runs of build_body() + jsonify()."""
+    with app.app_context():
+        body = jsonify(build_body()).get_data()  # warm-up
+        timings_ms = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            jsonify(build_body())
+            timings_ms.append((time.perf_counter() - start) * 1000)
+    return {"kb": len(body) / 1024, **summarize(timings_ms)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON serializers on the orders response shapes")
+    parser.add_argument("--orders", type=int, default=500, help="Orders in the list_orders page")
+    parser.add_argument("--items", default="1,5,20", help="Comma-separated items-per-order fan-outs to test")
+    parser.add_argument("--repeat", type=int, default=100, help="Timed runs per shape and serializer")
+    args = parser.parse_args()
+    fan_outs = [int(n) for n in args.items.split(",")]
+
+    # (label, app, call .isoformat() while building the dictionaries?)
+    candidates = [
+        ("isoformat + json (old)", make_app("stdlib"), True),
+        ("stdlib", make_app("stdlib"), False),
+    ]
+    if orjson is not None:
+        candidates.append(("orjson", make_app("orjson"), False))
+    else:
+        print("orjson is not installed (pip install orjson) - skipping it\n")
+
+    # (name, build(isoformat) -> payload)
+    shapes = [
+        (f"list_orders x{n}", lambda isoformat, n=n: list_orders_payload(args.orders, n, isoformat))
+        for n in fan_outs
+    ]
+    shapes.append(("create_order", lambda isoformat: create_order_payload(max(fan_outs), isoformat)))
+
+    print(f"{'shape':<18}{'serializer':<24}{'p50 ms':>10}{'p95 ms':>10}{'body KB':>10}")
+    for shape_name, build in shapes:
+        for label, app, isoformat in candidates:
+            row = run(app, lambda: build(isoformat), args.repeat)
+            print(f"{shape_name:<18}{label:<24}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['kb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: list_orders read path
+
+Compares the current list_orders() (order headers + one IN query for the items,
+plain rows) with the previous implementation (joinedload of user, items and
+products into full ORM objects), across different order/item fan-outs.
+
+For each fan-out it reports, for one page of orders:
+- p50/p95 wall time
+- peak Python memory (tracemalloc) while building the page
+- round trips (statements + BEGIN/COMMIT + pool pre-pings)
+
+Usage:
+    python bench_list_orders.py
+    python bench_list_orders.py --orders 500 --items 1,5,20,80 --repeat 10
+
+Note: this script writes test users, products and orders into the database
+configured in .env - point DATABASE_URL at a development database.
+"""
+import argparse
+import time
+import tracemalloc
+
+from sqlalchemy.orm import joinedload
+
+from bench_common import StatementCounter, summarize
+from database import get_db
+from db_operations import create_user, create_product, create_orders_bulk, list_orders, MAX_PAGE_SIZE
+from models import Orders, OrderItems
+
+
+def list_orders_joinedload(user_id: int, limit: int = MAX_PAGE_SIZE) -> dict:
+    """
+    The previous list_orders() implementation, kept here as the baseline.
+
+    One query with joinedload(user) + joinedload(order_items -> product),
+    hydrated into ORM objects and then converted to dictionaries.
+    """
+    db = get_db()
+    try:
+        orders = db.query(Orders).options(
+            joinedload(Orders.user),
+            joinedload(Orders.order_items).joinedload(OrderItems.product)
+        ).filter(Orders.user_id == user_id).order_by(Orders.id).limit(limit).all()
+
+        orders_list = []
+        for order in orders:
+            items = [
+                {
+                    "id": item.id,
+                    "product_id": item.product_id,
+                    "quantity": item.quantity,
+                    "price_cents_at_purchase": item.price_cents_at_purchase,
+                    "product_name": item.product.name if item.product else None
+                }
+                for item in order.order_items
+            ]
+            orders_list.append({
+                "id": order.id,
+                "user_id": order.user_id,
+                "user_name": order.user.full_name if order.user else None,
+                "status": order.status,
+                "created_at": order.created_at.isoformat() if order.created_at else None,
+                "items": items,
+                "total_amount_cents": sum(item["price_cents_at_purchase"] for item in items),
+                "total_quantity": sum(item["quantity"] for item in items)
+            })
+        return {"orders": orders_list, "total": len(orders_list)}
+    finally:
+        db.close()
+
+
+def list_orders_current(user_id: int, limit: int = MAX_PAGE_SIZE) -> dict:
+    """The current list_orders(), reading the same page size as the baseline."""
+    return list_orders(user_id, limit=limit)
+
+
+def seed_user(product_ids: list, orders: int, items_per_order: int) -> int:
+    """Create a user with `orders` orders of `items_per_order` items each; return the user ID."""
+    stamp = time.time_ns()
+    user = create_user(f"bench-list-{stamp}@example.com", f"Benchmark User {items_per_order}")
+    create_orders_bulk([
+        {
+            "user_id": user["id"],
+            "status": "paid",
+            "items": [
+                {"product_id": product_ids[(n + i) % len(product_ids)], "quantity": 1}
+                for i in range(items_per_order)
+            ]
+        }
+        for n in range(orders)
+    ])
+    return user["id"]
+
+
+def run(label: str, list_fn, user_id: int, repeat: int) -> dict:
+    """Call `list_fn` `repeat` times for timing, then once more under tracemalloc for peak memory."""
+    list_fn(user_id)  # warm-up (connection, statement caches)
+
+    timings_ms = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        list_fn(user_id)
+        timings_ms.append((time.perf_counter() - start) * 1000)
+
+    with StatementCounter() as counter:
+        tracemalloc.start()
+        list_fn(user_id)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "implementation": label,
+        "peak_kb": peak / 1024,
+        "round_trips": counter.round_trips,
+        **summarize(timings_ms)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare list_orders against the joinedload implementation")
+    parser.add_argument("--orders", type=int, default=MAX_PAGE_SIZE, help="Orders per test user (one page is read)")
+    parser.add_argument("--items", default="1,5,20,80", help="Comma-separated items-per-order fan-outs to test")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per fan-out and implementation")
+    args = parser.parse_args()
+    fan_outs = [int(n) for n in args.items.split(",")]
+
+    product_ids = [
+        create_product(f"Benchmark Product {i}", 100 + i)["id"]
+        for i in range(max(fan_outs))
+    ]
+
+    print(f"{'implementation':<16}{'orders':>8}{'items/order':>13}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'peak KB':>11}{'round trips':>13}")
+    for items_per_order in fan_outs:
+        user_id = seed_user(product_ids, args.orders, items_per_order)
+        for label, list_fn in (("joinedload (old)", list_orders_joinedload), ("column rows", list_orders_current)):
+            row = run(label, list_fn, user_id, args.repeat)
+            print(f"{row['implementation']:<16}{args.orders:>8}{items_per_order:>13}{row['p50_ms']:>10.2f}"
+                  f"{row['p95_ms']:>10.2f}{row['peak_kb']:>11.0f}{row['round_trips']:>13}")
+
+
+if __name__ == "__main__":
+    main()
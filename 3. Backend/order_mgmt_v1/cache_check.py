@@ -0,0 +1,165 @@
+"""
+Product cache check: LRU/TTL eviction and invalidation of product_cache.py
+
+Runs ProductCache and LocalCacheBackend against a fake clock and fake loaders
+(no database needed) and fails if the cache could serve a product after it
+should have been dropped:
+- LRU: the least recently used entry is evicted once max_entries is reached
+- TTL: an entry expires after its TTL (fake clock, no waiting)
+- invalidate(): the next read calls the loader again
+- stale loads: a load that overlaps an invalidate() (a product created while
+  get_or_load / get_many read the database) is not served afterwards
+- disabled (TTL 0): every read goes to the loader
+- CacheBackend: a backend missing a method fails when it is created
+
+Usage:
+    python cache_check.py
+
+Exit code 1 if any check fails. Run it after changing product_cache.py.
+"""
+import sys
+
+from product_cache import CacheBackend, LocalCacheBackend, ProductCache
+
+
+class FakeClock:
+    """A clock for LocalCacheBackend that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingLoader:
+    """Loader for get_many(): returns {id: {"id": id, "version": version}} and counts its calls."""
+
+    def __init__(self, version: int = 1, during_load=None):
+        self.version = version
+        self.during_load = during_load  # called while "reading the database"
+        self.calls = 0
+
+    def __call__(self, product_ids: set) -> dict:
+        self.calls += 1
+        rows = {product_id: {"id": product_id, "version": self.version} for product_id in product_ids}
+        if self.during_load is not None:
+            self.during_load()
+        return rows
+
+
+def check_lru_eviction():
+    backend = LocalCacheBackend(max_entries=2, clock=FakeClock())
+    backend.set("a", 1, ttl=60)
+    backend.set("b", 2, ttl=60)
+    backend.get("a")  # "a" is now the most recently used
+    backend.set("c", 3, ttl=60)
+    assert backend.get("b") is None, "least recently used entry was not evicted"
+    assert backend.get("a") == 1 and backend.get("c") == 3, "recently used entries were evicted"
+    assert len(backend) == 2, f"expected 2 entries, got {len(backend)}"
+
+
+def check_ttl_expiry():
+    clock = FakeClock()
+    backend = LocalCacheBackend(clock=clock)
+    backend.set("a", 1, ttl=10)
+    clock.now += 9
+    assert backend.get("a") == 1, "entry expired before its TTL"
+    clock.now += 2
+    assert backend.get("a") is None, "entry was served after its TTL"
+    assert len(backend) == 0, "expired entry was not removed"
+
+
+def check_invalidate():
+    cache = ProductCache(LocalCacheBackend(clock=FakeClock()), ttl=60)
+    loader = CountingLoader()
+    cache.get_many([1, 2], loader)
+    cache.get_many([1, 2], loader)
+    assert loader.calls == 1, f"second read was not a hit ({loader.calls} loads)"
+
+    cache.invalidate()
+    loader.version = 2
+    products = cache.get_many([1, 2], loader)
+    assert loader.calls == 2, "read after invalidate() did not call the loader"
+    assert products[1]["version"] == 2, "read after invalidate() returned the old product"
+
+
+def check_stale_get_many():
+    cache = ProductCache(LocalCacheBackend(clock=FakeClock()), ttl=60)
+    # The load reads version 1, then the product is changed and the cache invalidated
+    stale_loader = CountingLoader(version=1, during_load=cache.invalidate)
+    cache.get_many([1], stale_loader)
+
+    fresh_loader = CountingLoader(version=2)
+    products = cache.get_many([1], fresh_loader)
+    assert fresh_loader.calls == 1, "rows loaded before invalidate() were served afterwards"
+    assert products[1]["version"] == 2, "stale product returned"
+
+
+def check_stale_get_or_load():
+    cache = ProductCache(LocalCacheBackend(clock=FakeClock()), ttl=60)
+
+    def stale_page():
+        cache.invalidate()
+        return ["version 1"]
+
+    cache.get_or_load(("page", 0, 100), stale_page)
+    page = cache.get_or_load(("page", 0, 100), lambda: ["version 2"])
+    assert page == ["version 2"], "page loaded before invalidate() was served afterwards"
+
+
+def check_disabled():
+    cache = ProductCache(LocalCacheBackend(clock=FakeClock()), ttl=0)
+    loader = CountingLoader()
+    cache.get_many([1], loader)
+    cache.get_many([1], loader)
+    assert loader.calls == 2, "TTL 0 still cached"
+
+
+def check_incomplete_backend():
+    class NoClear(CacheBackend):
+        def get(self, key):
+            return None
+
+        def set(self, key, value, ttl):
+            pass
+
+        def delete(self, key):
+            pass
+
+    try:
+        NoClear()
+    except TypeError:
+        return
+    raise AssertionError("a backend without clear() could be created")
+
+
+CHECKS = [
+    check_lru_eviction,
+    check_ttl_expiry,
+    check_invalidate,
+    check_stale_get_many,
+    check_stale_get_or_load,
+    check_disabled,
+    check_incomplete_backend,
+]
+
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f"OK    {check.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL  {check.__name__}: {e}")
+
+    if failed:
+        print(f"\n{failed} of {len(CHECKS)} checks failed")
+        sys.exit(1)
+    print(f"\nAll {len(CHECKS)} checks passed")
+
+
+if __name__ == "__main__":
+    main()
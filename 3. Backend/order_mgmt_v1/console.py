@@ -31,6 +31,17 @@ def print_menu():
     print("="*50)
 
 
+def ask_next_page(next_cursor) -> bool:
+    """
+    Ask whether to show the next page of a list.
+    
+    List functions return one page at a time; next_cursor is None on the last page.
+    """
+    if next_cursor is None:
+        return False
+    return input("\nShow next page? (y/N): ").strip().lower() == "y"
+
+
 def handle_create_user():
     """
     Handle user creation from console input.
@@ -51,7 +62,7 @@ def handle_create_user():
     print(f"   ID: {result['id']}")
     print(f"   Email: {result['email']}")
     print(f"   Full Name: {result['full_name']}")
-    print(f"   Created At: {result['created_at']}")
+    print(f"   Created At: {result['created_at'].isoformat()}")
 
 
 def handle_create_product():
@@ -135,7 +146,7 @@ def handle_create_order():
     print(f"   Order ID: {result['id']}")
     print(f"   User ID: {result['user_id']}")
     print(f"   Status: {result['status']}")
-    print(f"   Created At: {result['created_at']}")
+    print(f"   Created At: {result['created_at'].isoformat()}")
     print(f"   Total Amount: ${result['total_amount_cents'] / 100:.2f}")
     print(f"   Total Quantity: {result['total_quantity']}")
     print("\n   Items:")
@@ -158,26 +169,33 @@ def handle_list_orders():
         print("❌ Invalid user ID. Please enter a number.")
         return
     
-    # Call database operation function
-    result = list_orders(user_id)
+    # Call database operation function (first page, with the total count)
+    result = list_orders(user_id, count="exact")
     
     # Display result
     print(f"\n📋 Found {result['total']} order(s) for user {user_id}:")
     
     if result['total'] == 0:
         print("   No orders found.")
-    else:
+        return
+    
+    while True:
         for order in result['orders']:
             print(f"\n   Order ID: {order['id']}")
             print(f"   User: {order['user_name']} (ID: {order['user_id']})")
             print(f"   Status: {order['status']}")
-            print(f"   Created At: {order['created_at']}")
+            print(f"   Created At: {order['created_at'].isoformat()}")
             print(f"   Total Amount: ${order['total_amount_cents'] / 100:.2f}")
             print(f"   Total Quantity: {order['total_quantity']}")
             print("   Items:")
             for item in order['items']:
                 print(f"     - {item['product_name']} (ID: {item['product_id']}): "
                       f"{item['quantity']} x ${item['price_cents_at_purchase'] / 100:.2f}")
+        
+        # Fetch the next page only if the user asks for it
+        if not ask_next_page(result['next_cursor']):
+            break
+        result = list_orders(user_id, after_id=result['next_cursor'])
 
 
 def handle_list_users():
@@ -191,21 +209,28 @@ def handle_list_users():
     
     try:
         # Call database operation function
-        # This will query the database and return all users
-        result = list_users()
+        # This will query the database and return the first page of users
+        # count="estimate" reads the row count from table statistics (no full scan)
+        result = list_users(count="estimate")
         
         # Display result
-        print(f"\n📋 Found {result['total']} user(s) in the database:")
+        print(f"\n📋 Found about {result['total']} user(s) in the database:")
         
-        if result['total'] == 0:
+        if not result['users']:
             print("   No users found.")
         else:
-            # Display each user's information
-            for user in result['users']:
-                print(f"\n   User ID: {user['id']}")
-                print(f"   Email: {user['email']}")
-                print(f"   Full Name: {user['full_name']}")
-                print(f"   Created At: {user['created_at']}")
+            while True:
+                # Display each user's information
+                for user in result['users']:
+                    print(f"\n   User ID: {user['id']}")
+                    print(f"   Email: {user['email']}")
+                    print(f"   Full Name: {user['full_name']}")
+                    print(f"   Created At: {user['created_at'].isoformat()}")
+                
+                # Fetch the next page only if the user asks for it
+                if not ask_next_page(result['next_cursor']):
+                    break
+                result = list_users(after_id=result['next_cursor'])
     
     except AttributeError:
         # Handle case where function exists but is not fully implemented
@@ -228,23 +253,29 @@ def handle_list_products():
     
     try:
         # Call database operation function
-        # This will query the database and return all products
-        result = list_products()
+        # This will query the database and return the first page of products
+        result = list_products(count="estimate")
         
         # Display result
-        print(f"\n📋 Found {result['total']} product(s) in the database:")
+        print(f"\n📋 Found about {result['total']} product(s) in the database:")
         
-        if result['total'] == 0:
+        if not result['products']:
             print("   No products found.")
         else:
-            # Display each product's information
-            for product in result['products']:
-                print(f"\n   Product ID: {product['id']}")
-                print(f"   Name: {product['name']}")
-                # Convert price from cents to dollars for display
-                # For example: 249999 cents = $2499.99
-                price_dollars = product['price_cents'] / 100
-                print(f"   Price: ${price_dollars:.2f}")
+            while True:
+                # Display each product's information
+                for product in result['products']:
+                    print(f"\n   Product ID: {product['id']}")
+                    print(f"   Name: {product['name']}")
+                    # Convert price from cents to dollars for display
+                    # For example: 249999 cents = $2499.99
+                    price_dollars = product['price_cents'] / 100
+                    print(f"   Price: ${price_dollars:.2f}")
+                
+                # Fetch the next page only if the user asks for it
+                if not ask_next_page(result['next_cursor']):
+                    break
+                result = list_products(after_id=result['next_cursor'])
     
     except AttributeError:
         # Handle case where function exists but is not fully implemented
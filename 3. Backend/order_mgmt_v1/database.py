@@ -3,13 +3,25 @@ Database connection and session management.
 
 This module handles:
 - SQLAlchemy engine creation
+- Connection pool configuration (from environment variables, see .env.example)
+- Connection pool telemetry (pool_stats(), shown by GET /admin/pool in order_api.py)
+- Sessions: get_db() (new session), session_scope() (unit of work) and
+  request_db() (one session per Flask request, see init_app())
 - Base class for ORM models
 - Table creation on initialization
 """
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from flask import g
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
+from json_provider import dumps as json_dumps
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,18 +36,262 @@ if not database_url:
         "Please create a .env file based on .env.example and set your database connection string."
     )
 
+# ============================================================================
+# Connection Pool Configuration
+# ============================================================================
+# Each process keeps its own pool, so the most connections one process can open
+# is DB_POOL_SIZE + DB_MAX_OVERFLOW. Across all workers this must stay below the
+# server's max_connections (SHOW max_connections) minus what other clients need:
+#   workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) < max_connections
+#
+# DB_POOL_SIZE: connections kept open in the pool
+# DB_MAX_OVERFLOW: extra connections opened under load (closed again when returned)
+# DB_POOL_TIMEOUT: seconds to wait for a free connection before raising an error
+# DB_POOL_RECYCLE: replace connections older than this many seconds, so they are
+#   not closed by the server while still in the pool (common with cloud Postgres)
+# DB_PRE_PING: test a connection with a ping (a "SELECT 1" round trip) before use,
+#   so stale/closed SSL connections are discarded and replaced
+#   (avoids "SSL connection has been closed unexpectedly"):
+#     always - ping on every checkout (every get_db() call pays one extra round trip)
+#     idle   - ping only connections that sat unused for DB_PRE_PING_IDLE_SECONDS or more
+#     never  - don't ping (a dead connection fails the first query that uses it)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '300'))
+DB_PRE_PING = os.getenv('DB_PRE_PING', 'idle')
+DB_PRE_PING_IDLE_SECONDS = float(os.getenv('DB_PRE_PING_IDLE_SECONDS', '30'))
+
+PRE_PING_MODES = ("always", "idle", "never")
+if DB_PRE_PING not in PRE_PING_MODES:
+    raise ValueError(f"DB_PRE_PING must be one of {PRE_PING_MODES}, got {DB_PRE_PING!r}")
+
+# Upper bounds (milliseconds) of the checkout wait time histogram buckets
+POOL_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolTelemetry:
+    """
+    Counters describing how the connection pool is used (per process).
+
+    - checkouts: connections handed out by the pool (one per get_db() session that ran a query)
+    - wait_histogram: how long checkouts took, including opening a new connection
+    - wait_timeouts: checkouts that gave up after DB_POOL_TIMEOUT (pool exhausted)
+    - pre_pings / pre_ping_failures: pings sent, and pings that found a dead connection
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_timeouts = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+            self.wait_histogram = [0] * (len(POOL_WAIT_BUCKETS_MS) + 1)  # last bucket: slower than all bounds
+            self.pre_pings = 0
+            self.pre_ping_failures = 0
+
+    def record_wait(self, wait_ms: float):
+        bucket = next((i for i, bound in enumerate(POOL_WAIT_BUCKETS_MS) if wait_ms <= bound),
+                      len(POOL_WAIT_BUCKETS_MS))
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            self.wait_histogram[bucket] += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.wait_timeouts += 1
+
+    def record_ping(self, ok: bool):
+        with self._lock:
+            self.pre_pings += 1
+            if not ok:
+                self.pre_ping_failures += 1
+
+    def snapshot(self) -> dict:
+        """A consistent copy of all counters (taken under the lock), for pool_stats() and metrics."""
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_timeouts": self.wait_timeouts,
+                "wait_total_ms": self.wait_total_ms,
+                "wait_max_ms": self.wait_max_ms,
+                "wait_histogram": list(self.wait_histogram),
+                "pre_pings": self.pre_pings,
+                "pre_ping_failures": self.pre_ping_failures,
+            }
+
+
+pool_telemetry = PoolTelemetry()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waits for a connection.
+
+    _do_get() is a private QueuePool method (SQLAlchemy 2.0); if a later
+    SQLAlchemy version drops it, POOL_CLASS falls back to a plain QueuePool
+    and only the wait numbers stay at zero.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection_record = super()._do_get()
+        except exc.TimeoutError:
+            pool_telemetry.record_timeout()
+            raise
+        pool_telemetry.record_wait((time.perf_counter() - start) * 1000)
+        return connection_record
+
+
+if callable(getattr(QueuePool, "_do_get", None)):
+    POOL_CLASS = InstrumentedQueuePool
+else:
+    warnings.warn("QueuePool._do_get() not found in this SQLAlchemy version - "
+                  "pool checkout wait times are not recorded")
+    POOL_CLASS = QueuePool
+
+
 # Create SQLAlchemy engine using the connection string from .env
-# pool_pre_ping=True: test connections before use so stale/closed SSL connections
-#   are discarded and replaced (avoids "SSL connection has been closed unexpectedly")
-# pool_recycle=300: recycle connections after 5 min so they don't get closed by
-#   the server while still in the pool (common with cloud Postgres)
+# pool_pre_ping is off here: pinging is done by the checkout listener below,
+# which follows DB_PRE_PING and counts failures
+# json_serializer: JSON/JSONB values may contain datetimes (e.g. a stored order
+# response, see db_operations.create_order_idempotent); write them like the API does
 engine = create_engine(
     database_url,
-    pool_pre_ping=True,
-    pool_recycle=300,
+    poolclass=POOL_CLASS,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    json_serializer=json_dumps,
 )
 
 
+@event.listens_for(engine, "checkin")
+def _remember_checkin_time(dbapi_connection, connection_record):
+    """Note when a connection went back into the pool (used by DB_PRE_PING=idle)."""
+    connection_record.info["checked_in_at"] = time.monotonic()
+
+
+@event.listens_for(engine, "checkout")
+def _pre_ping(dbapi_connection, connection_record, connection_proxy):
+    """
+    Ping the connection before handing it out, according to DB_PRE_PING.
+
+    Raising DisconnectionError makes the pool throw the connection away and
+    check out another one (it retries a few times before giving up).
+    """
+    if DB_PRE_PING == "never":
+        return
+    checked_in_at = connection_record.info.get("checked_in_at")
+    if DB_PRE_PING == "idle" and (checked_in_at is None or time.monotonic() - checked_in_at < DB_PRE_PING_IDLE_SECONDS):
+        # Brand-new connection (never checked in) or recently used one: skip the round trip
+        return
+
+    try:
+        engine.dialect.do_ping(dbapi_connection)
+    except Exception:
+        pool_telemetry.record_ping(ok=False)
+        raise exc.DisconnectionError("Connection failed pre-ping")
+    pool_telemetry.record_ping(ok=True)
+
+
+# ============================================================================
+# Statement timing (shared by instrumentation.py and metrics.py)
+# ============================================================================
+# One before/after_cursor_execute pair times every statement once; modules that
+# need the duration register a callback with on_statement_timed()
+_statement_timers = []
+
+
+def on_statement_timed(callback):
+    """
+    Call callback(statement, cursor, elapsed_seconds) after every statement run through engine.
+    
+    Registering the same callback twice has no effect.
+    """
+    if callback in _statement_timers:
+        return
+    if not _statement_timers:
+        event.listen(engine, "before_cursor_execute", _start_statement_timer)
+        event.listen(engine, "after_cursor_execute", _stop_statement_timer)
+    _statement_timers.append(callback)
+
+
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    # On the statement's execution context, not the connection: a statement
+    # that raises gets no after_cursor_execute, and its start time goes away
+    # with the context instead of piling up on the pooled connection
+    if context is not None:
+        context._statement_start = time.perf_counter()
+
+
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_statement_start", None)
+    if start is None:
+        return  # internal statement without an execution context
+    elapsed = time.perf_counter() - start
+    for callback in _statement_timers:
+        callback(statement, cursor, elapsed)
+
+
+def pool_stats() -> dict:
+    """
+    Current state and counters of this process's connection pool.
+
+    Returns:
+        Dictionary containing the pool settings, the current connection
+        counts and the telemetry counters, e.g.:
+        {
+            "pid": 4242,
+            "pool_size": 5, "max_overflow": 10, "max_connections": 15,
+            "checked_out": 2, "checked_in": 3, "overflow": 0,
+            "checkouts": 1200, "wait_timeouts": 0,
+            "wait_ms": {"avg": 0.1, "max": 12.5,
+                        "histogram": [{"le_ms": 1, "count": 1190}, ..., {"le_ms": null, "count": 0}]},
+            "pre_ping": "idle", "pre_pings": 14, "pre_ping_failures": 1
+        }
+    """
+    pool = engine.pool
+    telemetry = pool_telemetry.snapshot()
+    # One entry per bucket: checkouts that waited at most le_ms (null = slower than every bound)
+    histogram = [
+        {"le_ms": bound, "count": count}
+        for bound, count in zip(POOL_WAIT_BUCKETS_MS + (None,), telemetry["wait_histogram"])
+    ]
+    return {
+        "pid": os.getpid(),
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "max_connections": pool.size() + DB_MAX_OVERFLOW,
+        "timeout_seconds": DB_POOL_TIMEOUT,
+        "recycle_seconds": DB_POOL_RECYCLE,
+        # Connections in use right now / idle in the pool / opened beyond pool_size
+        # (overflow is negative while the pool has not opened pool_size connections yet)
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": telemetry["checkouts"],
+        "wait_timeouts": telemetry["wait_timeouts"],
+        "wait_ms": {
+            "avg": round(telemetry["wait_total_ms"] / telemetry["checkouts"], 3) if telemetry["checkouts"] else None,
+            "max": round(telemetry["wait_max_ms"], 3),
+            "histogram": histogram
+        },
+        "pre_ping": DB_PRE_PING,
+        "pre_ping_idle_seconds": DB_PRE_PING_IDLE_SECONDS,
+        "pre_pings": telemetry["pre_pings"],
+        "pre_ping_failures": telemetry["pre_ping_failures"]
+    }
+
+
 # ============================================================================
 # Get Database Session
 # ============================================================================
@@ -50,3 +306,90 @@ def get_db():
         Session: A new SQLAlchemy database session
     """
     return Session(engine)
+
+
+@contextmanager
+def session_scope(db: Optional[Session] = None) -> Iterator[Session]:
+    """
+    Unit of work: run a block of database code in one transaction.
+    
+    Without `db`, a new session is created, committed when the block ends
+    (rolled back if it raises) and closed:
+        with session_scope() as db:
+            db.add(Users(...))
+    
+    With `db` (a session borrowed from the caller, e.g. request_db()), that
+    session is used as is and nothing is committed or closed here - the owner
+    of the session decides when the whole unit of work is committed. This lets
+    several db_operations calls share one connection and one transaction.
+    
+    Args:
+        db: Session to borrow, or None to create (and own) a new one
+    
+    Yields:
+        Session: The session to use inside the block
+    """
+    if db is not None:
+        yield db
+        return
+    
+    db = get_db()
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# ============================================================================
+# Request-Scoped Session (Flask)
+# ============================================================================
+def request_db() -> Session:
+    """
+    Return the database session of the current Flask request.
+    
+    The first call in a request creates the session; later calls in the same
+    request return the same one, so all db_operations calls of a page view
+    (e.g. list_products + create_order) share one connection checkout and one
+    transaction. Pass it on as the `db` argument:
+        result = list_orders(user_id, db=request_db())
+    
+    Requires init_app(app), which commits and closes the session at the end
+    of the request.
+    
+    Returns:
+        Session: The request's SQLAlchemy session
+    """
+    if "db_session" not in g:
+        g.db_session = get_db()
+    return g.db_session
+
+
+def init_app(app):
+    """
+    Register the request_db() hooks on a Flask app.
+    
+    - after_request: commit the request's session if the response is not an
+      error (status < 400) and the session is still usable, else roll back.
+      This runs before the response is sent, so a failing COMMIT still turns
+      into an error response.
+    - teardown_appcontext: close the session (returns the connection to the pool)
+    """
+    @app.after_request
+    def commit_request_db(response):
+        db = g.get("db_session")
+        if db is not None:
+            if response.status_code < 400 and db.is_active:
+                db.commit()
+            else:
+                db.rollback()
+        return response
+    
+    @app.teardown_appcontext
+    def close_request_db(error=None):
+        db = g.pop("db_session", None)
+        if db is not None:
+            db.close()
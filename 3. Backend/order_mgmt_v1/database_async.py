@@ -0,0 +1,102 @@
+"""
+Async database connection and session management.
+
+This is the asyncio counterpart of database.py, used by order_api_async.py:
+- Async SQLAlchemy engine (create_async_engine) on the asyncpg driver
+- get_async_db() returning a new AsyncSession
+
+It reads the same DATABASE_URL as database.py. The URL is rewritten for
+asyncpg, because asyncpg does not understand libpq-only query parameters
+such as sslmode or channel_binding.
+
+The models (models.py) and the Base class are shared with the sync code.
+"""
+import os
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from dotenv import load_dotenv
+from json_provider import dumps as json_dumps
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Get database URL from environment variable (same variable as database.py)
+database_url = os.getenv('DATABASE_URL')
+
+if not database_url:
+    raise ValueError(
+        "DATABASE_URL environment variable is not set. "
+        "Please create a .env file based on .env.example and set your database connection string."
+    )
+
+# Connections per process kept open by the async pool
+# One event loop serves many requests at once, so it needs more connections
+# than a sync worker thread (which only ever uses one at a time)
+ASYNC_DB_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', '20'))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv('ASYNC_DB_MAX_OVERFLOW', '10'))
+
+
+def to_async_url(url: str):
+    """
+    Convert a psycopg2-style DATABASE_URL into an asyncpg URL.
+
+    Example:
+        postgresql://user:pw@host/db?sslmode=require&channel_binding=require
+        -> postgresql+asyncpg://user:pw@host/db   and connect_args {"ssl": "require"}
+
+    Args:
+        url: The DATABASE_URL value
+
+    Returns:
+        Tuple of (SQLAlchemy URL object, connect_args dictionary for create_async_engine)
+    """
+    parsed = make_url(url).set(drivername="postgresql+asyncpg")
+    query = dict(parsed.query)
+    connect_args = {}
+
+    # asyncpg takes the libpq sslmode values ("require", "verify-full", ...) as ssl=
+    sslmode = query.pop('sslmode', None)
+    if sslmode and sslmode != 'disable':
+        connect_args['ssl'] = sslmode
+
+    # libpq-only options asyncpg does not support
+    query.pop('channel_binding', None)
+
+    return parsed.set(query=query), connect_args
+
+
+async_url, async_connect_args = to_async_url(database_url)
+
+# Create the async engine
+# pool_pre_ping / pool_recycle: same reasons as the sync engine in database.py
+async_engine = create_async_engine(
+    async_url,
+    connect_args=async_connect_args,
+    pool_size=ASYNC_DB_POOL_SIZE,
+    max_overflow=ASYNC_DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=300,
+    # JSONB values may contain datetimes (see database.engine)
+    json_serializer=json_dumps,
+)
+
+# expire_on_commit=False: objects stay readable after commit without another
+# query (lazy loading is not possible in async code)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+# ============================================================================
+# Get Async Database Session
+# ============================================================================
+def get_async_db() -> AsyncSession:
+    """
+    Create and return a new async database session.
+
+    Use it as an async context manager so it is always closed:
+        async with get_async_db() as db:
+            rows = (await db.execute(stmt)).all()
+
+    Returns:
+        AsyncSession: A new SQLAlchemy async database session
+    """
+    return AsyncSessionLocal()
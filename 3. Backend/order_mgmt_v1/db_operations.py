@@ -6,17 +6,135 @@ This module contains the core database operation functions:
 2. create_product - Create a new product
 3. create_order - Create a new order with items
 4. list_orders - List all orders for a specific user
+5. create_orders_bulk - Create many orders at once, in chunked transactions
+6. export_orders / export_users / export_products - Stream whole tables row by row
+7. get_user_by_name / get_user_by_email - Find a single user through an index
+8. search_users - Prefix search on user name/email (typeahead)
+9. user_order_summary - Order count, lifetime spend and last order date of several users
+10. list_orders_by_product - Orders that contain a given product (reverse lookup)
+11. list_orders_by_status - Open orders by status and creation time (fulfillment backlog)
+12. transition_order_status / transition_orders_status - Change order status with a concurrency check
+13. create_order_idempotent - create_order that runs once per Idempotency-Key (safe client retries)
+14. get_table_version - Change counter of the users/products tables (cheap "has the list changed?" check)
 
 These functions handle all database interactions using SQLAlchemy ORM.
+
+Timestamps (created_at, updated_at, ...) in the returned dictionaries are
+datetime objects; the APIs turn them into ISO 8601 strings while serializing
+the response (see json_provider.py), not one .isoformat() call at a time.
+
+Sessions: every function (except the export_* generators) takes an optional
+`db` session. Called without it (e.g. from console.py), a function opens,
+commits and closes its own session. Called with one (e.g. request_db() in the
+Flask apps), it runs inside the caller's transaction and only flushes; the
+caller commits once for the whole unit of work.
 """
-from datetime import datetime, timezone
-from sqlalchemy.orm import joinedload
-from database import get_db
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import Iterator, Optional
+from sqlalchemy import (
+    BigInteger, any_, cast, column, event, func, insert, literal, select, table, text, tuple_, union, union_all,
+    update
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.orm import Session
+from database import get_db, session_scope
+from product_cache import product_cache
+from metrics import count_orders_created, track_operation
 # Import models - using the generated model names (Users, Products, Orders, OrderItems)
-from models import Users, Products, Orders, OrderItems
+from models import Users, Products, Orders, OrderItems, IdempotencyKeys, TableVersions
+
+logger = logging.getLogger(__name__)
+
+
+# Allowed values of orders.status (mirrors the orders_status_check constraint)
+ORDER_STATUSES = ("pending", "paid", "shipped", "cancelled")
+
+# Statuses of orders that still need work (the rest is history that only grows).
+# Mirrors the WHERE clause of the partial index idx_orders_open_status_created_at
+OPEN_ORDER_STATUSES = ("pending", "paid")
+
+# Allowed status changes: from_status -> statuses it may change to
+ORDER_TRANSITIONS = {
+    "pending": ("paid", "cancelled"),
+    "paid": ("shipped", "cancelled"),
+}
+
+# Most orders one transition_orders_status() call accepts
+TRANSITION_MAX_BATCH = 10000
+
+# How long create_order_idempotent() remembers an Idempotency-Key (environment
+# variable, see .env.example): a retry within this time gets the stored response,
+# after it the key may be deleted (maintenance.py gc-idempotency-keys) or reused
+IDEMPOTENCY_KEY_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_KEY_TTL_SECONDS', '86400'))
+
+# Longest Idempotency-Key accepted (clients usually send a UUID)
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Tables with a change counter in tony.table_versions (see get_table_version)
+VERSIONED_TABLES = ("users", "products")
+
+# Default number of orders written per transaction by create_orders_bulk()
+BULK_ORDER_CHUNK_SIZE = 1000
+
+# Page size for list functions when the caller does not ask for one,
+# and the largest page the server returns no matter what the caller asks for
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Ways list functions can compute "total" (None = don't count at all)
+COUNT_MODES = ("exact", "estimate")
+
+# Default and maximum number of results returned by search_users()
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+
+# Rows fetched per round trip from the server-side cursor by the export_* functions
+EXPORT_BATCH_SIZE = 1000
 
+# Most users one user_order_summary() call accepts
+SUMMARY_MAX_USERS = 500
 
-def create_user(email: str, full_name: str) -> dict:
+# Where user_order_summary() gets its numbers (environment variables, see .env.example):
+# ORDER_SUMMARY_SOURCE:
+#   query - GROUP BY over the user's orders on every call (always up to date)
+#   view  - read the tony.user_order_summary materialized view (one index lookup
+#           per user, but only as fresh as the last refresh)
+# ORDER_SUMMARY_REFRESH (view only):
+#   manual  - refreshed only by "python maintenance.py refresh-order-summary" (e.g. from cron)
+#   on-read - the first call that finds it older than ORDER_SUMMARY_MAX_AGE_SECONDS
+#             starts a refresh in the background and serves the current numbers
+ORDER_SUMMARY_SOURCES = ("query", "view")
+ORDER_SUMMARY_REFRESH_MODES = ("manual", "on-read")
+ORDER_SUMMARY_SOURCE = os.getenv('ORDER_SUMMARY_SOURCE', 'query')
+ORDER_SUMMARY_REFRESH = os.getenv('ORDER_SUMMARY_REFRESH', 'manual')
+ORDER_SUMMARY_MAX_AGE_SECONDS = float(os.getenv('ORDER_SUMMARY_MAX_AGE_SECONDS', '300'))
+
+if ORDER_SUMMARY_SOURCE not in ORDER_SUMMARY_SOURCES:
+    raise ValueError(f"ORDER_SUMMARY_SOURCE must be one of {ORDER_SUMMARY_SOURCES}, got {ORDER_SUMMARY_SOURCE!r}")
+if ORDER_SUMMARY_REFRESH not in ORDER_SUMMARY_REFRESH_MODES:
+    raise ValueError(
+        f"ORDER_SUMMARY_REFRESH must be one of {ORDER_SUMMARY_REFRESH_MODES}, got {ORDER_SUMMARY_REFRESH!r}"
+    )
+
+# The materialized view (created by 2. Database/postgres.sql or
+# "python maintenance.py refresh-order-summary"); it has no ORM model, these
+# are just the columns we read
+user_order_summary_view = table(
+    "user_order_summary",
+    column("user_id"), column("order_count"), column("lifetime_spend_cents"),
+    column("last_order_at"), column("refreshed_at"),
+    schema="tony"
+)
+
+
+@track_operation
+def create_user(email: str, full_name: str, db: Optional[Session] = None) -> dict:
     """
     Create a new user in the database.
     
@@ -26,6 +144,8 @@ def create_user(email: str, full_name: str) -> dict:
     Args:
         email: User's email address (must be unique)
         full_name: User's full name
+        db: Optional session to run in (see database.session_scope); the caller
+            commits it. Without it, the function uses and commits its own session.
     
     Returns:
         Dictionary containing the created user's data:
@@ -33,14 +153,12 @@ def create_user(email: str, full_name: str) -> dict:
             "id": int,
             "email": str,
             "full_name": str,
-            "created_at": str (ISO format)
+            "created_at": datetime
         }
     """
-    # Create a new database session
-    # Each function call gets its own session to ensure data consistency
-    db = get_db()
-    
-    try:
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
         # Create a new Users object with the provided data
         # The ORM will map this to a row in the users table
         new_user = Users(
@@ -52,25 +170,20 @@ def create_user(email: str, full_name: str) -> dict:
         # Add the user to the session (stages it for insertion)
         db.add(new_user)
         
-        # Commit the transaction (actually saves to database)
-        db.commit()
+        # Flush: send the INSERT now (INSERT ... RETURNING id fills in the new ID)
+        # The transaction is committed when the session scope ends
+        db.flush()
         
-        # Refresh to get database-generated values (like auto-incremented ID)
-        db.refresh(new_user)
+        # The user list changed: bump its version in the same transaction, so the
+        # new version becomes visible exactly when the new user does (see get_table_version)
+        bump_table_version("users", db=db)
         
         # Return user data as a dictionary
-        return {
-            "id": new_user.id,
-            "email": new_user.email,
-            "full_name": new_user.full_name,
-            "created_at": new_user.created_at.isoformat() if new_user.created_at else None
-        }
-    finally:
-        # Always close the session, even if an error occurs
-        db.close()
+        return _user_dict(new_user)
 
 
-def create_product(name: str, price_cents: int) -> dict:
+@track_operation
+def create_product(name: str, price_cents: int, db: Optional[Session] = None) -> dict:
     """
     Create a new product in the database.
     
@@ -80,6 +193,8 @@ def create_product(name: str, price_cents: int) -> dict:
     Args:
         name: Product name (e.g., "MacBook Pro 16\"")
         price_cents: Price in cents (e.g., 249999 = $2499.99)
+        db: Optional session to run in (see database.session_scope); the caller
+            commits it. Without it, the function uses and commits its own session.
     
     Returns:
         Dictionary containing the created product's data:
@@ -89,33 +204,33 @@ def create_product(name: str, price_cents: int) -> dict:
             "price_cents": int
         }
     """
-    # Create a new database session
-    db = get_db()
-    
-    try:
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
         # Create a new Products object
         new_product = Products(
             name=name,
             price_cents=price_cents
         )
         
-        # Add to session and commit
+        # Add to session and flush (INSERT ... RETURNING id)
         db.add(new_product)
-        db.commit()
-        db.refresh(new_product)
+        db.flush()
+        
+        # Bump the catalog version in the same transaction (see get_table_version)
+        bump_table_version("products", db=db)
+        
+        # The catalog changed: drop cached product pages so the new product shows up
+        # Done after COMMIT (whenever the session's owner commits), so a concurrent
+        # read cannot cache the catalog without the new product in between
+        event.listen(db, "after_commit", lambda session: product_cache.invalidate(), once=True)
         
         # Return product data
-        return {
-            "id": new_product.id,
-            "name": new_product.name,
-            "price_cents": new_product.price_cents
-        }
-    finally:
-        # Always close the session
-        db.close()
+        return _product_dict(new_product)
 
 
-def create_order(user_id: int, status: str, items: list) -> dict:
+@track_operation
+def create_order(user_id: int, status: str, items: list, db: Optional[Session] = None) -> dict:
     """
     Create a new order with multiple items.
     
@@ -131,6 +246,8 @@ def create_order(user_id: int, status: str, items: list) -> dict:
                 "product_id": int,
                 "quantity": int
             }
+        db: Optional session to run in (see database.session_scope); the caller
+            commits it. Without it, the function uses and commits its own session.
     
     Returns:
         Dictionary containing the created order's data:
@@ -138,306 +255,1808 @@ def create_order(user_id: int, status: str, items: list) -> dict:
             "id": int,
             "user_id": int,
             "status": str,
-            "created_at": str (ISO format),
+            "created_at": datetime,
             "items": list of item dictionaries,
             "total_amount_cents": int,
             "total_quantity": int
         }
     """
-    # Create a new database session
-    db = get_db()
-    
-    try:
-        # Step 1: Create the order record
-        # We use flush() to get the order ID without committing yet
-        # This allows us to link order items to the order before committing
-        new_order = Orders(
-            user_id=user_id,
-            status=status,
-            created_at=datetime.now(timezone.utc)
-        )
-        db.add(new_order)
-        db.flush()  # Gets the order ID from database without committing
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        # Step 1: Resolve the current price of every product in at most ONE query
+        # Looking products up one by one inside the item loop costs a round trip
+        # per line item; a single "WHERE id IN (...)" keeps checkout at a fixed
+        # number of queries no matter how big the cart is. Products already in
+        # the product cache are not queried at all.
+        products = _fetch_products(db, [item_data["product_id"] for item_data in items])
         
         # Step 2: Initialize variables to track totals
         total_amount = 0  # Total price in cents for all items
         total_quantity = 0  # Total number of items
+        item_rows = []  # Rows to insert into order_items
         items_list = []  # List to store item data for response
         
-        # Step 3: Create order items for each product in the order
+        # Step 3: Build order item rows from the prices we already loaded
         for item_data in items:
-            # Fetch the product to get its current price
-            # This ensures we capture the price at the time of purchase
-            product = db.query(Products).filter(Products.id == item_data["product_id"]).first()
+            product = products[item_data["product_id"]]
             
             # Calculate total price for this line item (unit price * quantity)
-            price_at_purchase = product.price_cents * item_data["quantity"]
-            
-            # Create the order item record
             # We store price_at_purchase so we remember what was charged
             # even if product price changes later
-            order_item = OrderItems(
-                order_id=new_order.id,  # Link to the order we just created
-                product_id=item_data["product_id"],
-                quantity=item_data["quantity"],
-                price_cents_at_purchase=price_at_purchase
-            )
-            db.add(order_item)
+            price_at_purchase = product["price_cents"] * item_data["quantity"]
+            
+            item_rows.append({
+                "product_id": item_data["product_id"],
+                "quantity": item_data["quantity"],
+                "price_cents_at_purchase": price_at_purchase
+            })
             
             # Update running totals
             total_amount += price_at_purchase
             total_quantity += item_data["quantity"]
             
-            # Store item data for response (ID will be added after commit)
+            # Store item data for response (ID is filled in after the insert)
             items_list.append({
-                "product_id": order_item.product_id,
-                "quantity": order_item.quantity,
-                "price_cents_at_purchase": order_item.price_cents_at_purchase,
-                "product_name": product.name if product else None
+                "product_id": item_data["product_id"],
+                "quantity": item_data["quantity"],
+                "price_cents_at_purchase": price_at_purchase,
+                "product_name": product["name"]
             })
         
-        # Step 4: Commit all changes to database (order + all items in one transaction)
-        # This ensures atomicity - either all items are saved or none are
-        db.commit()
+        # Step 4: Create the order record, including its totals
+        # The totals are stored on the order (denormalized) so order headers can be
+        # listed without reading order_items; they are written in the same
+        # transaction as the items, so they always match
+        # We use flush() to get the order ID without committing yet
+        # This allows us to link order items to the order before committing
+        created_at = datetime.now(timezone.utc)
+        new_order = Orders(
+            user_id=user_id,
+            status=status,
+            created_at=created_at,
+            total_amount_cents=total_amount,
+            total_quantity=total_quantity
+        )
+        db.add(new_order)
+        db.flush()  # INSERT ... RETURNING id - gets the order ID without committing
+        order_id = new_order.id
+        for item_row in item_rows:
+            item_row["order_id"] = order_id  # Link to the order we just created
         
-        # Reload order with items to get all database-assigned IDs
-        db.refresh(new_order)
-        new_order = db.query(Orders).filter(Orders.id == new_order.id).first()
+        # Step 5: Insert all order items with ONE multi-row INSERT ... RETURNING id
+        # sort_by_parameter_order=True guarantees the returned IDs come back in the
+        # same order as item_rows, so we can match them up with items_list
+        # (skipped for an order without items: an INSERT with no rows would
+        # become "INSERT ... DEFAULT VALUES" and fail on the NOT NULL columns)
+        item_ids = []
+        if item_rows:
+            item_ids = db.scalars(
+                insert(OrderItems).returning(OrderItems.id, sort_by_parameter_order=True),
+                item_rows
+            ).all()
+        for item_dict, item_id in zip(items_list, item_ids):
+            item_dict["id"] = item_id
+        # Counted after COMMIT (whenever the session's owner commits), so an order
+        # whose transaction is rolled back later is not counted
+        _after_outer_commit(db, lambda: count_orders_created(1, len(item_ids)))
         
-        # Add IDs to items_list after they've been assigned by database
-        # Note: Generated model uses 'order_items' relationship name
-        for i, db_item in enumerate(new_order.order_items):
-            items_list[i]["id"] = db_item.id
+        # Step 6: The order and all items are committed together in one transaction
+        # when the session scope ends (or by the caller that owns the session)
+        # This ensures atomicity - either all items are saved or none are
+        # Everything in the response is already known, so there is no need to
+        # refresh or re-query the order afterwards
         
         # Return order data with calculated totals
         return {
-            "id": new_order.id,
-            "user_id": new_order.user_id,
-            "status": new_order.status,
-            "created_at": new_order.created_at.isoformat() if new_order.created_at else None,
+            "id": order_id,
+            "user_id": user_id,
+            "status": status,
+            "created_at": created_at,
             "items": items_list,
             "total_amount_cents": total_amount,
             "total_quantity": total_quantity
         }
-    finally:
-        # Always close the session
-        db.close()
 
-def list_users() -> dict:
+
+def _after_outer_commit(db: Session, callback):
+    """
+    Call callback() once the session's outermost transaction commits.
+    
+    Unlike a plain "after_commit" listener, releasing a SAVEPOINT
+    (begin_nested) does not count as a commit, and if the outer transaction
+    is rolled back the callback is dropped instead of waiting for a later
+    commit of the same session. (The listeners stay registered but do nothing
+    afterwards - they cannot be removed while the event is being dispatched.)
+    """
+    pending = True
+    
+    def on_commit(session):
+        nonlocal pending
+        if pending and not session.in_nested_transaction():
+            pending = False
+            callback()
+    
+    def on_transaction_end(session, transaction):
+        nonlocal pending
+        if transaction.parent is None:  # the outermost transaction, committed or rolled back
+            pending = False
+    
+    event.listen(db, "after_commit", on_commit)
+    event.listen(db, "after_transaction_end", on_transaction_end)
+
+
+def _fetch_products(db, product_ids: list) -> dict:
     """
-    List all users in the database.
+    Load several products with a single query.
     
-    This function retrieves all users from the database and returns them
-    in a dictionary format. It's useful for displaying all registered users
-    or checking what users exist in the system.
+    Args:
+        db: Open database session
+        product_ids: Product IDs to load (duplicates are fine)
     
     Returns:
-        Dictionary containing:
-        {
-            "users": list of user dictionaries,
-            "total": int (count of users)
-        }
-        
-        Each user dictionary contains:
+        Dictionary mapping product ID to {"id", "name", "price_cents"}
+    
+    Raises:
+        ValueError: If any of the product IDs does not exist
+    """
+    products = _load_products(db, product_ids)
+    
+    missing = set(product_ids) - products.keys()
+    if missing:
+        raise ValueError(f"Product(s) not found: {sorted(missing)}")
+    return products
+
+
+def _load_products(db, product_ids) -> dict:
+    """
+    Load several products, skipping IDs that do not exist.
+    
+    Products found in the product cache are not queried again; all the others
+    are loaded with a single query (see product_cache.py).
+    
+    Returns:
+        Dictionary mapping product ID to {"id", "name", "price_cents"}
+    """
+    def query_products(missing_ids: set) -> dict:
+        rows = db.execute(
+            select(Products.id, Products.name, Products.price_cents).where(Products.id.in_(missing_ids))
+        ).all()
+        return {row.id: {"id": row.id, "name": row.name, "price_cents": row.price_cents} for row in rows}
+    
+    return product_cache.get_many(product_ids, query_products)
+
+
+@track_operation
+def create_orders_bulk(orders: list, chunk_size: int = BULK_ORDER_CHUNK_SIZE,
+                       db: Optional[Session] = None) -> dict:
+    """
+    Create many orders at once (bulk ingestion).
+    
+    Orders are validated up front, then written in chunks of `chunk_size`.
+    Each chunk is its own transaction: if anything in a chunk fails to insert,
+    the whole chunk is rolled back and every order in it is reported as failed,
+    while the chunks before and after it are kept.
+    
+    Compared with calling create_order() in a loop:
+    - Product prices are looked up once per distinct product for the whole call
+    - User IDs are checked once per distinct user for the whole call
+    - Each chunk costs a handful of statements (batched multi-row INSERTs for
+      orders and for order items) instead of several per order
+    
+    Args:
+        orders: List of order dictionaries, same shape as create_order() input:
+            {
+                "user_id": int,
+                "status": str,
+                "items": [{"product_id": int, "quantity": int}, ...]
+            }
+        chunk_size: Number of orders written per transaction
+        db: Optional session to run in (see database.session_scope). The chunks
+            then become SAVEPOINTs inside the caller's transaction (a failed chunk
+            is still rolled back on its own) and the caller commits.
+    
+    Returns:
+        Dictionary containing one result per input order (same order as input):
         {
-            "id": int,
-            "email": str,
-            "full_name": str,
-            "created_at": str (ISO format) or None
+            "results": [
+                {"index": 0, "ok": True, "id": int, "item_count": int,
+                 "total_amount_cents": int, "total_quantity": int},
+                {"index": 1, "ok": False, "error": str},
+                ...
+            ],
+            "created": int (orders written),
+            "failed": int (orders rejected or rolled back)
         }
     """
-    # Create a new database session
-    # Each function call gets its own session to ensure data consistency
-    db = get_db()
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    
+    results = [None] * len(orders)
+    
+    # Use the caller's session if one was passed in, otherwise create a new one
+    # (not session_scope: with our own session every chunk commits by itself)
+    owned = db is None
+    if owned:
+        db = get_db()
     
     try:
-        # Query all users from the database
-        # db.query(Users): Start a query targeting the Users model/table
-        # .all(): Execute the query and return all matching records as a list
-        # This will return a list of Users ORM objects
-        users = db.query(Users).all()
+        # Step 1: Look up every distinct product and user ONCE for the whole call
+        user_ids, product_ids = _bulk_order_ids(orders)
+        products = _load_products(db, product_ids)
+        known_users = set(db.scalars(select(Users.id).where(Users.id.in_(user_ids))).all()) if user_ids else set()
+        if owned:
+            db.rollback()  # End the read-only transaction before writing
         
-        # Convert ORM objects to dictionaries for easier handling
-        # We need to iterate through each user object and extract its attributes
-        users_list = []
-        for user in users:
-            # For each user object, create a dictionary with its data
-            # This makes it easier to work with the data (e.g., for JSON serialization)
-            user_dict = {
-                "id": user.id,  # Get the user's ID (primary key)
-                "email": user.email,  # Get the user's email address
-                "full_name": user.full_name,  # Get the user's full name
-                # Convert created_at to ISO format string if it exists, otherwise None
-                # ISO format is a standard date/time format (e.g., "2024-01-15T10:30:00")
-                "created_at": user.created_at.isoformat() if user.created_at else None
-            }
-            users_list.append(user_dict)
+        # Step 2: Validate every order and pre-compute its item rows
+        valid = _prepare_bulk_orders(orders, products, known_users, results)
         
-        # Return the result as a dictionary
-        # This format is consistent with other list functions in this module
+        # Step 3: Write the valid orders chunk by chunk, one transaction per chunk
+        # (a SAVEPOINT per chunk when running inside the caller's transaction)
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            created_at = datetime.now(timezone.utc)
+            chunk_transaction = db.begin() if owned else db.begin_nested()
+            try:
+                # One batched INSERT ... RETURNING id for all orders in the chunk
+                order_ids = db.scalars(
+                    insert(Orders).returning(Orders.id, sort_by_parameter_order=True),
+                    [
+                        {
+                            "user_id": order_data["user_id"],
+                            "status": order_data["status"],
+                            "created_at": created_at,
+                            "total_amount_cents": total_amount,
+                            "total_quantity": total_quantity
+                        }
+                        for _, order_data, _, total_amount, total_quantity in chunk
+                    ]
+                ).all()
+                
+                # One batched INSERT for all items in the chunk (no RETURNING needed)
+                all_item_rows = [
+                    {"order_id": order_id, **item_row}
+                    for order_id, (_, _, item_rows, _, _) in zip(order_ids, chunk)
+                    for item_row in item_rows
+                ]
+                db.execute(insert(OrderItems), all_item_rows)
+                # Counted at the real COMMIT: right away with our own session, at
+                # the caller's commit when the chunk is only a SAVEPOINT
+                _after_outer_commit(
+                    db, lambda orders=len(order_ids), items=len(all_item_rows): count_orders_created(orders, items)
+                )
+                chunk_transaction.commit()
+            except Exception as e:
+                # Roll back this chunk only and report every order in it as failed
+                chunk_transaction.rollback()
+                for index, _, _, _, _ in chunk:
+                    results[index] = {"index": index, "ok": False, "error": _chunk_error(e)}
+                continue
+            
+            for order_id, (index, _, item_rows, total_amount, total_quantity) in zip(order_ids, chunk):
+                results[index] = {
+                    "index": index,
+                    "ok": True,
+                    "id": order_id,
+                    "item_count": len(item_rows),
+                    "total_amount_cents": total_amount,
+                    "total_quantity": total_quantity
+                }
+        
+        created = sum(1 for result in results if result["ok"])
         return {
-            "users": users_list,  # List of user dictionaries
-            "total": len(users_list)  # Total count of users
+            "results": results,
+            "created": created,
+            "failed": len(results) - created
         }
     finally:
-        # Always close the session, even if an error occurs
-        # This ensures database connections are properly released
-        # If we don't close the session, we could run out of database connections
-        db.close()
+        # Always close the session (only if we created it)
+        if owned:
+            db.close()
+
+
+def _bulk_order_ids(orders: list) -> tuple:
+    """Collect the distinct user IDs and product IDs of a bulk request, as (user_ids, product_ids)."""
+    product_ids = set()
+    user_ids = set()
+    for order_data in orders:
+        if not isinstance(order_data, dict):
+            continue
+        if isinstance(order_data.get("user_id"), int):
+            user_ids.add(order_data["user_id"])
+        items = order_data.get("items")
+        for item_data in items if isinstance(items, list) else []:
+            if isinstance(item_data, dict) and isinstance(item_data.get("product_id"), int):
+                product_ids.add(item_data["product_id"])
+    return user_ids, product_ids
+
+
+def _chunk_error(e: Exception) -> str:
+    """
+    Error message for the orders of a chunk that was rolled back.
+    
+    Includes the first line of the database error (e.g. which constraint
+    failed), not only the exception class.
+    """
+    message = str(getattr(e, "orig", e)).strip()
+    detail = message.splitlines()[0] if message else ""
+    return f"Chunk rolled back: {e.__class__.__name__}" + (f": {detail}" if detail else "")
+
+
+def _prepare_bulk_orders(orders: list, products: dict, known_users: set, results: list) -> list:
+    """
+    Validate every order of a bulk request and pre-compute its item rows.
+    
+    Invalid orders get their error entry written into `results`.
+    
+    Returns:
+        List of (index, order_data, item_rows, total_amount, total_quantity) for the valid orders
+    """
+    valid = []
+    for index, order_data in enumerate(orders):
+        error = _validate_bulk_order(order_data, products, known_users)
+        if error:
+            results[index] = {"index": index, "ok": False, "error": error}
+            continue
+        
+        item_rows = []
+        total_amount = 0
+        total_quantity = 0
+        for item_data in order_data["items"]:
+            price_at_purchase = products[item_data["product_id"]]["price_cents"] * item_data["quantity"]
+            item_rows.append({
+                "product_id": item_data["product_id"],
+                "quantity": item_data["quantity"],
+                "price_cents_at_purchase": price_at_purchase
+            })
+            total_amount += price_at_purchase
+            total_quantity += item_data["quantity"]
+        valid.append((index, order_data, item_rows, total_amount, total_quantity))
+    return valid
+
+
+def _validate_bulk_order(order_data, products: dict, known_users: set):
+    """
+    Check one order of a bulk request.
+    
+    Returns:
+        An error message, or None if the order can be inserted
+    """
+    if not isinstance(order_data, dict):
+        return "Order must be an object"
+    if not isinstance(order_data.get("user_id"), int) or order_data["user_id"] not in known_users:
+        return f"User not found: {order_data.get('user_id')}"
+    if not isinstance(order_data.get("status"), str) or order_data["status"] not in ORDER_STATUSES:
+        return f"Invalid status: {order_data.get('status')}"
+    items = order_data.get("items")
+    if not items or not isinstance(items, list):
+        return "Order must have at least one item"
+    for item_data in items:
+        if not isinstance(item_data, dict) or not isinstance(item_data.get("product_id"), int) \
+                or item_data["product_id"] not in products:
+            return f"Product not found: {item_data.get('product_id') if isinstance(item_data, dict) else item_data}"
+        quantity = item_data.get("quantity")
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            return f"Invalid quantity for product {item_data['product_id']}: {quantity}"
+    return None
+
 
-def list_products() -> dict:
+@track_operation
+def create_order_idempotent(idempotency_key: str, user_id: int, status: str, items: list,
+                            db: Optional[Session] = None) -> dict:
     """
-    List all products in the database.
+    Create an order at most once per idempotency key.
     
-    This function retrieves all products from the database and returns them
-    in a dictionary format. It's useful for displaying the product catalog
-    or checking what products are available in the system.
+    Clients (and load balancers) retry a POST /orders that timed out, without
+    knowing whether the first attempt created the order. With an idempotency
+    key - a unique value the client generates once per order and sends again
+    on every retry - the first request creates the order and stores its
+    response under the key; every repeat gets the stored response back
+    without looking up products or inserting anything again:
+    
+        1. SELECT the key (primary key lookup)        -> found: return it
+        2. INSERT the key ... ON CONFLICT DO NOTHING  -> claims the key
+        3. create_order(), then store its response on the key row
+    
+    Steps 2 and 3 run in ONE transaction, so the key is stored if and only if
+    the order is. A second request with the same key that arrives while the
+    first one is still running waits at step 2 (on the uncommitted key row)
+    and then returns the first request's response, or creates the order
+    itself if the first request failed and rolled back.
+    
+    Keys expire after IDEMPOTENCY_KEY_TTL_SECONDS; an expired key counts as
+    new. The same key with a different request body is rejected ("mismatch"),
+    because returning the other order would hide a client bug.
+    
+    Args:
+        idempotency_key: Client-generated key (at most IDEMPOTENCY_KEY_MAX_LENGTH characters)
+        user_id, status, items: Same as create_order()
+        db: Optional session to run in (see database.session_scope); the caller
+            commits it. Without it, the function uses and commits its own session.
     
     Returns:
         Dictionary containing:
         {
-            "products": list of product dictionaries,
-            "total": int (count of products)
+            "outcome": "created" (new order) | "replayed" (stored response)
+                       | "mismatch" (key used before with another request body),
+            "order": the create_order() response (None for "mismatch")
         }
+    
+    Raises:
+        ValueError: If the key is empty or too long
+    """
+    _check_idempotency_key(idempotency_key)
+    request_hash = _order_request_hash(user_id, status, items)
+    
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        # Step 1: The common retry case costs one indexed read
+        stored = db.execute(_idempotency_lookup_stmt(idempotency_key)).first()
         
-        Each product dictionary contains:
+        # Step 2: New key - claim it. If another request claimed it meanwhile,
+        # the INSERT waits for that transaction and returns nothing; its
+        # stored response is visible to the next query
+        if stored is None and db.scalar(_idempotency_claim_stmt(idempotency_key, request_hash)) is None:
+            stored = db.execute(_idempotency_lookup_stmt(idempotency_key)).first()
+        if stored is not None:
+            return _idempotent_replay(stored, request_hash)
+        
+        # Step 3: We own the key - create the order and remember the response
+        order = create_order(user_id, status, items, db=db)
+        db.execute(_idempotency_save_stmt(idempotency_key, order))
+        return {"outcome": "created", "order": order}
+
+
+def _check_idempotency_key(idempotency_key: str):
+    """Raise ValueError if the key is empty or longer than IDEMPOTENCY_KEY_MAX_LENGTH."""
+    if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f"Idempotency key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+
+def _order_request_hash(user_id: int, status: str, items: list) -> str:
+    """Fingerprint of a create_order() request (same request -> same hash, whatever the key order)."""
+    payload = json.dumps({"user_id": user_id, "status": status, "items": items},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _idempotency_lookup_stmt(idempotency_key: str):
+    """Query for a key's stored request hash and response (primary key lookup; expired keys don't count)."""
+    return (
+        select(IdempotencyKeys.request_hash, IdempotencyKeys.response)
+        .where(IdempotencyKeys.key == idempotency_key, IdempotencyKeys.expires_at > func.now())
+    )
+
+
+def _idempotency_claim_stmt(idempotency_key: str, request_hash: str):
+    """
+    INSERT the key, returning it if this request now owns the key:
+    
+        INSERT INTO idempotency_keys (key, request_hash, expires_at) VALUES (...)
+        ON CONFLICT (key) DO UPDATE SET ... WHERE idempotency_keys.expires_at <= now()
+        RETURNING key
+    
+    A live key returns no row; an expired one that gc-idempotency-keys has not
+    deleted yet is taken over (its old response is cleared).
+    """
+    stmt = pg_insert(IdempotencyKeys).values(
+        key=idempotency_key,
+        request_hash=request_hash,
+        expires_at=func.now() + timedelta(seconds=IDEMPOTENCY_KEY_TTL_SECONDS)
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[IdempotencyKeys.key],
+        set_={
+            "request_hash": stmt.excluded.request_hash,
+            "expires_at": stmt.excluded.expires_at,
+            "response": None,
+            "created_at": func.now()
+        },
+        where=IdempotencyKeys.expires_at <= func.now()
+    ).returning(IdempotencyKeys.key)
+
+
+def _idempotency_save_stmt(idempotency_key: str, order: dict):
+    """UPDATE storing the response of the request that claimed the key."""
+    return (
+        update(IdempotencyKeys)
+        .where(IdempotencyKeys.key == idempotency_key)
+        .values(response=order)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _idempotent_replay(stored, request_hash: str) -> dict:
+    """Build the create_order_idempotent() result for a key that was used before."""
+    if stored.request_hash != request_hash:
+        return {"outcome": "mismatch", "order": None}
+    return {"outcome": "replayed", "order": stored.response}
+
+
+@track_operation
+def transition_order_status(order_id: int, from_status: str, to_status: str,
+                            expected_updated_at: Optional[datetime] = None,
+                            db: Optional[Session] = None) -> dict:
+    """
+    Change the status of one order, only if nobody changed it in the meantime.
+    
+    Optimistic concurrency: instead of reading the order, checking it and then
+    writing it (two round trips, and another worker can change the order in
+    between), the check IS the update:
+    
+        UPDATE orders SET status = :to_status, updated_at = clock_timestamp()
+        WHERE id = :order_id AND status = :from_status
+          [AND updated_at = :expected_updated_at]
+        RETURNING id, status, updated_at
+    
+    The row lock taken by the UPDATE makes concurrent calls queue up; the
+    first one wins, the others find the status (or updated_at) changed and
+    update nothing. updated_at works as the order's version number: every
+    transition sets it, so passing the updated_at you last saw (from
+    list_orders etc.) also catches changes that ended in the same status.
+    
+    Args:
+        order_id: ID of the order
+        from_status: Status the order must have now
+        to_status: New status (must be allowed by ORDER_TRANSITIONS)
+        expected_updated_at: updated_at the order must have now (None = only
+            check the status; an order never changed before has updated_at None)
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        Dictionary containing:
         {
-            "id": int,
-            "name": str,
-            "price_cents": int (price in cents, e.g., 2499 = $24.99)
+            "ok": bool (True if the status was changed),
+            "order": {"id": int, "status": str, "updated_at": datetime or None}
+                - the order after the change, or its current state if "ok" is
+                False (None if the order does not exist)
         }
+    
+    Raises:
+        ValueError: If the transition is not allowed
     """
-    # Create a new database session
-    # Each function call gets its own session to ensure data consistency
-    db = get_db()
+    _check_transition(from_status, to_status)
+    stmt = _transition_stmt(order_id, from_status, to_status, expected_updated_at)
     
-    try:
-        # Query all products from the database
-        # db.query(Products): Start a query targeting the Products model/table
-        # .all(): Execute the query and return all matching records as a list
-        # This will return a list of Products ORM objects
-        products = db.query(Products).all()
-        
-        # Convert ORM objects to dictionaries for easier handling
-        # We need to iterate through each product object and extract its attributes
-        products_list = []
-        for product in products:
-            # For each product object, create a dictionary with its data
-            # This makes it easier to work with the data (e.g., for JSON serialization)
-            product_dict = {
-                "id": product.id,  # Get the product's ID (primary key)
-                "name": product.name,  # Get the product's name
-                # Get the product's price in cents
-                # Note: Price is stored in cents to avoid floating-point precision issues
-                # For example, 249999 cents = $2499.99
-                "price_cents": product.price_cents
-            }
-            products_list.append(product_dict)
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        row = db.execute(stmt).first()
+        if row is not None:
+            return {"ok": True, "order": _transition_dict(row)}
         
-        # Return the result as a dictionary
-        # This format is consistent with other list functions in this module
-        return {
-            "products": products_list,  # List of product dictionaries
-            "total": len(products_list)  # Total count of products
+        # Nothing updated: report the current state so the caller can decide
+        # (only this losing path pays for the extra query)
+        current = db.execute(_transition_current_stmt(order_id)).first()
+        return {"ok": False, "order": _transition_dict(current) if current is not None else None}
+
+
+@track_operation
+def transition_orders_status(order_ids: list, from_status: str, to_status: str,
+                             db: Optional[Session] = None) -> dict:
+    """
+    Change the status of many orders in ONE statement (e.g. "ship these 5000 paid orders").
+    
+    Same rule as transition_order_status(): only orders that currently have
+    from_status are changed; the others are left alone and reported back.
+    Replaces a loop of SELECT-then-UPDATE per order (two round trips per
+    order, racing with other workers) with a single round trip.
+    
+    The order IDs are sent as one array parameter (WHERE id = ANY(:ids)), so
+    the statement stays the same size for 10 or 10000 orders. The rows are
+    locked in ID order first, so two batches with overlapping orders wait for
+    each other instead of deadlocking.
+    
+    Args:
+        order_ids: IDs of the orders (at most TRANSITION_MAX_BATCH)
+        from_status: Status the orders must have now
+        to_status: New status (must be allowed by ORDER_TRANSITIONS)
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        Dictionary containing:
+        {
+            "updated": list of {"id", "status", "updated_at"} for the changed orders (by ID),
+            "skipped": list of IDs not changed (other status, or no such order)
         }
-    finally:
-        # Always close the session, even if an error occurs
-        # This ensures database connections are properly released
-        # If we don't close the session, we could run out of database connections
-        db.close()
+    
+    Raises:
+        ValueError: If the transition is not allowed or there are too many IDs
+    """
+    _check_transition(from_status, to_status)
+    order_ids = _transition_order_ids(order_ids)
+    if not order_ids:
+        return {"updated": [], "skipped": []}
+    
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        rows = db.execute(_transition_batch_stmt(order_ids, from_status, to_status)).all()
+    return _transition_batch_response(order_ids, rows)
+
+
+def _check_transition(from_status: str, to_status: str):
+    """Raise ValueError if ORDER_TRANSITIONS does not allow from_status -> to_status."""
+    if to_status not in ORDER_TRANSITIONS.get(from_status, ()):
+        raise ValueError(f"Cannot change order status from {from_status!r} to {to_status!r}")
+
 
-def list_orders(user_id: int) -> dict:
+def _transition_order_ids(order_ids: list) -> list:
+    """Drop duplicate order IDs (keeping the order) and enforce TRANSITION_MAX_BATCH."""
+    order_ids = list(dict.fromkeys(order_ids))
+    if len(order_ids) > TRANSITION_MAX_BATCH:
+        raise ValueError(f"At most {TRANSITION_MAX_BATCH} orders per call, got {len(order_ids)}")
+    return order_ids
+
+
+def _transition_stmt(order_id: int, from_status: str, to_status: str, expected_updated_at: Optional[datetime]):
+    """The conditional UPDATE ... RETURNING of transition_order_status()."""
+    stmt = (
+        update(Orders)
+        .where(Orders.id == order_id, Orders.status == from_status)
+        .values(status=to_status, updated_at=func.clock_timestamp())
+        .returning(Orders.id, Orders.status, Orders.updated_at)
+        # Plain SQL UPDATE: no ORM objects in the session to keep in sync
+        .execution_options(synchronize_session=False)
+    )
+    if expected_updated_at is not None:
+        stmt = stmt.where(Orders.updated_at == expected_updated_at)
+    return stmt
+
+
+def _transition_current_stmt(order_id: int):
+    """Query for an order's current status and version, after a transition found nothing to update."""
+    return select(Orders.id, Orders.status, Orders.updated_at).where(Orders.id == order_id)
+
+
+def _transition_batch_stmt(order_ids: list, from_status: str, to_status: str):
     """
-    List all orders for a specific user.
+    The single statement of transition_orders_status():
     
-    This function retrieves all orders belonging to the specified user.
-    It includes order details, all items in each order, and calculated totals.
-    Also includes user name and product names for convenience.
+        WITH locked AS (SELECT id FROM orders WHERE id = ANY(:ids) AND status = :from_status
+                        ORDER BY id FOR UPDATE)
+        UPDATE orders SET status = :to_status, updated_at = clock_timestamp()
+        FROM locked WHERE orders.id = locked.id
+        RETURNING id, status, updated_at
+    """
+    locked = (
+        select(Orders.id)
+        .where(Orders.id == any_(literal(order_ids, ARRAY(BigInteger))), Orders.status == from_status)
+        .order_by(Orders.id)
+        .with_for_update()
+        .cte("locked")
+    )
+    return (
+        update(Orders)
+        .where(Orders.id == locked.c.id)
+        .values(status=to_status, updated_at=func.clock_timestamp())
+        .returning(Orders.id, Orders.status, Orders.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _transition_batch_response(order_ids: list, rows: list) -> dict:
+    """Build the transition_orders_status() result from the rows returned by the UPDATE."""
+    rows = sorted(rows, key=lambda row: row.id)
+    updated_ids = {row.id for row in rows}
+    return {
+        "updated": [_transition_dict(row) for row in rows],
+        "skipped": [order_id for order_id in order_ids if order_id not in updated_ids]
+    }
+
+
+def _transition_dict(row) -> dict:
+    """Convert a (id, status, updated_at) row to the dictionary returned by the transition functions."""
+    return {
+        "id": row.id,
+        "status": row.status,
+        "updated_at": row.updated_at
+    }
+
+
+@track_operation
+def list_users(after_id: Optional[int] = None, limit: Optional[int] = None, count: Optional[str] = None,
+               db: Optional[Session] = None) -> dict:
+    """
+    List users in the database, one page at a time.
+    
+    This function retrieves a page of users ordered by ID and returns them
+    in a dictionary format. It uses keyset pagination: instead of OFFSET, the
+    caller passes the last ID it has seen (after_id) and the database jumps
+    straight to it through the primary key index, so every page costs the same
+    no matter how deep into the table it is.
     
     Args:
-        user_id: The ID of the user whose orders to retrieve
+        after_id: Return users with an ID greater than this (None = first page)
+        limit: Page size (default DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE)
+        count: How to compute "total":
+            None - don't count (total is None)
+            "exact" - COUNT(*) over the whole table (slow on big tables)
+            "estimate" - planner statistics from pg_class.reltuples (instant)
+        db: Optional session to run in (see database.session_scope)
     
     Returns:
         Dictionary containing:
         {
-            "orders": list of order dictionaries,
-            "total": int (count of orders)
+            "users": list of user dictionaries,
+            "next_cursor": int or None (pass as after_id to get the next page),
+            "total": int or None (count of users, see `count`)
         }
         
-        Each order dictionary contains:
+        Each user dictionary contains:
         {
             "id": int,
-            "user_id": int,
-            "user_name": str,
-            "status": str,
-            "created_at": str (ISO format),
-            "items": list of item dictionaries,
-            "total_amount_cents": int,
-            "total_quantity": int
+            "email": str,
+            "full_name": str,
+            "created_at": datetime or None
         }
     """
-    # Create a new database session
-    db = get_db()
-    
-    try:
-        # Query orders for the user with relationships pre-loaded
-        # joinedload(Orders.user): Load user data in the same query (for user_name)
-        # joinedload(Orders.order_items).joinedload(OrderItems.product): Load all items and their products
-        # Note: Generated model uses 'order_items' relationship name instead of 'items'
-        # This prevents multiple database queries (N+1 problem)
-        orders = db.query(Orders).options(
-            joinedload(Orders.user),  # Eagerly load user relationship
-            joinedload(Orders.order_items).joinedload(OrderItems.product)  # Eagerly load items and products
-        ).filter(Orders.user_id == user_id).all()
-        
-        # Using Lazy Loading (not recommended, will have performance issues)
-        # orders = db.query(Orders).filter(Orders.user_id == user_id).all()
-
-        # Then accessing relationships will trigger additional queries
-        # for order in orders:
-        #     # This will trigger a query
-        #     user_name = order.user.full_name
-        #     for item in order.order_items:
-        #         product_name = item.product.name
-
-        # Build response list
-        orders_list = []
-        for order in orders:
-            # Calculate totals for this order by summing up all items
-            # Note: Generated model uses 'order_items' relationship name
-            total_amount = sum(item.price_cents_at_purchase for item in order.order_items)
-            total_quantity = sum(item.quantity for item in order.order_items)
-            
-            # Build list of order items with product names
-            items = [
-                {
-                    "id": item.id,
-                    "product_id": item.product_id,
-                    "quantity": item.quantity,
-                    "price_cents_at_purchase": item.price_cents_at_purchase,
-                    "product_name": item.product.name if item.product else None
-                }
-                for item in order.order_items
-            ]
-            
-            # Add order data to response list
-            orders_list.append({
-                "id": order.id,
-                "user_id": order.user_id,
-                "user_name": order.user.full_name if order.user else None,
-                "status": order.status,
-                "created_at": order.created_at.isoformat() if order.created_at else None,
-                "items": items,
-                "total_amount_cents": total_amount,
-                "total_quantity": total_quantity
-            })
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        # Query one page of users from the database
+        # db.query(Users): Start a query targeting the Users model/table
+        # .filter(Users.id > after_id): Skip everything up to the cursor (uses the primary key index)
+        # .order_by(Users.id): Keyset pagination needs a stable order
+        # .limit(limit + 1): Fetch one extra row to find out whether there is a next page
+        # .all(): Execute the query and return the matching records as a list
+        limit = _page_limit(limit)
+        query = db.query(Users)
+        if after_id is not None:
+            query = query.filter(Users.id > after_id)
+        users = query.order_by(Users.id).limit(limit + 1).all()
+        users, next_cursor = _split_page(users, limit)
+        
+        # Convert ORM objects to dictionaries for easier handling
+        # (e.g., for JSON serialization); see _user_dict for the fields
+        users_list = [_user_dict(user) for user in users]
+        
+        # Return the result as a dictionary
+        # This format is consistent with other list functions in this module
+        return {
+            "users": users_list,  # List of user dictionaries
+            "next_cursor": next_cursor,  # ID to pass as after_id for the next page
+            "total": _count_rows(db, Users, count)  # Total count of users (if requested)
+        }
+
+
+@track_operation
+def get_user_by_name(full_name: str, db: Optional[Session] = None) -> Optional[dict]:
+    """
+    Find a user by exact full name.
+    
+    This is a single indexed lookup (idx_users_full_name), so it takes the same
+    time whether the table has ten users or ten million. If several users share
+    the name, the one with the lowest ID is returned.
+    
+    Args:
+        full_name: The user's full name (case-sensitive, exact match)
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        User dictionary (same shape as in list_users()), or None if not found
+    """
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        user = db.query(Users).filter(Users.full_name == full_name).order_by(Users.id).first()
+        return _user_dict(user) if user is not None else None
+
+
+@track_operation
+def get_user_by_email(email: str, db: Optional[Session] = None) -> Optional[dict]:
+    """
+    Find a user by email address, ignoring upper/lower case.
+    
+    Compares lower(email) so that "John@Example.com" finds "john@example.com";
+    the idx_users_lower_email expression index makes this a single index lookup.
+    
+    Args:
+        email: The user's email address
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        User dictionary (same shape as in list_users()), or None if not found
+    """
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        user = db.query(Users).filter(func.lower(Users.email) == email.lower()).order_by(Users.id).first()
+        return _user_dict(user) if user is not None else None
+
+
+@track_operation
+def search_users(prefix: str, limit: Optional[int] = None, db: Optional[Session] = None) -> dict:
+    """
+    Find users whose full name or email starts with `prefix` (case-insensitive).
+    
+    Meant for a typeahead / autocomplete box: it returns at most `limit` users,
+    in alphabetical order of the matched name or email.
+    
+    Each half of the search (name, email) walks its own expression index
+    (lower(full_name) text_pattern_ops / lower(email) text_pattern_ops) from
+    the prefix onwards and stops after `limit` rows, so the query cost does not
+    depend on how many users there are or how many of them match.
+    
+    Args:
+        prefix: Beginning of the user's name or email (e.g., "jo")
+        limit: Maximum number of users (default SEARCH_DEFAULT_LIMIT, capped at SEARCH_MAX_LIMIT)
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        Dictionary containing:
+        {
+            "users": list of user dictionaries (same shape as in list_users())
+        }
+    """
+    limit = SEARCH_DEFAULT_LIMIT if limit is None else max(1, min(limit, SEARCH_MAX_LIMIT))
+    stmt = _search_users_stmt(prefix, limit)
+    if stmt is None:
+        return {"users": []}
+    
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        rows = db.execute(stmt).all()
+        
+        # At most 2 * limit rows come back: sort them and keep the first `limit`
+        rows = sorted(rows, key=lambda row: (row.full_name.lower(), row.id))[:limit]
+        return {"users": [_user_dict(row) for row in rows]}
+
+
+def _search_users_stmt(prefix: str, limit: int):
+    """
+    Build the search_users() query, or return None for an empty prefix.
+    
+    Two small index range scans, combined with UNION (which also removes users
+    matched by both). "ORDER BY ... USING ~<~" is the sort order of a
+    text_pattern_ops index, so each side can stop after `limit` rows.
+    """
+    prefix = (prefix or "").strip().lower()
+    if not prefix:
+        return None
+    
+    # Escape LIKE wildcards so "%" or "_" typed by the user are matched literally
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    
+    columns = (Users.id, Users.email, Users.full_name, Users.created_at)
+    by_name = (
+        select(*columns)
+        .where(func.lower(Users.full_name).like(pattern))
+        .order_by(text("lower(full_name) USING ~<~"))
+        .limit(limit)
+    )
+    by_email = (
+        select(*columns)
+        .where(func.lower(Users.email).like(pattern))
+        .order_by(text("lower(email) USING ~<~"))
+        .limit(limit)
+    )
+    return union(by_name, by_email)
+
+
+@track_operation
+def list_products(after_id: Optional[int] = None, limit: Optional[int] = None, count: Optional[str] = None,
+                  version: Optional[int] = None, db: Optional[Session] = None) -> dict:
+    """
+    List products in the database, one page at a time.
+    
+    This function retrieves a page of products ordered by ID and returns them
+    in a dictionary format. It uses keyset pagination on the primary key, the
+    same way as list_users().
+    
+    Args:
+        after_id: Return products with an ID greater than this (None = first page)
+        limit: Page size (default DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE)
+        count: How to compute "total": None, "exact" or "estimate" (see list_users)
+        version: Catalog version the caller has read with get_table_version("products"),
+            if any. It is part of the cache key, so a page cached (in this worker)
+            before another worker added a product is not returned for a newer version.
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        Dictionary containing:
+        {
+            "products": list of product dictionaries,
+            "next_cursor": int or None (pass as after_id to get the next page),
+            "total": int or None (count of products, see `count`)
+        }
+        
+        Each product dictionary contains:
+        {
+            "id": int,
+            "name": str,
+            "price_cents": int (price in cents, e.g., 2499 = $24.99)
+        }
+    
+    Pages are served from the product cache when possible (see product_cache.py),
+    so the database is only queried on a cache miss.
+    """
+    limit = _page_limit(limit)
+    return product_cache.get_or_load(
+        ("page", after_id, limit, count, version),
+        lambda: _list_products_uncached(after_id, limit, count, db)
+    )
+
+
+def _list_products_uncached(after_id: Optional[int], limit: int, count: Optional[str],
+                            db: Optional[Session] = None) -> dict:
+    """Query one page of products from the database (list_products() without the cache)."""
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        # Query one page of products from the database
+        # db.query(Products): Start a query targeting the Products model/table
+        # .filter / .order_by / .limit: keyset pagination on the primary key (see list_users)
+        # .all(): Execute the query and return the matching records as a list
+        query = db.query(Products)
+        if after_id is not None:
+            query = query.filter(Products.id > after_id)
+        products = query.order_by(Products.id).limit(limit + 1).all()
+        products, next_cursor = _split_page(products, limit)
+        
+        # Convert ORM objects to dictionaries for easier handling
+        # (e.g., for JSON serialization); see _product_dict for the fields
+        products_list = [_product_dict(product) for product in products]
+        
+        # Return the result as a dictionary
+        # This format is consistent with other list functions in this module
+        return {
+            "products": products_list,  # List of product dictionaries
+            "next_cursor": next_cursor,  # ID to pass as after_id for the next page
+            "total": _count_rows(db, Products, count)  # Total count of products (if requested)
+        }
+
+
+@track_operation
+def get_table_version(table_name: str, db: Optional[Session] = None) -> int:
+    """
+    Return the change counter of a table in VERSIONED_TABLES.
+    
+    create_user() / create_product() increment it in the same transaction as
+    their INSERT, so the number changes exactly when the table's content does.
+    Reading it is one primary key lookup on a tiny table - much cheaper than
+    the list query (and its serialization) it stands for. The APIs use it as
+    the ETag of GET /users and GET /products: a client that polls with
+    If-None-Match gets 304 Not Modified without the list being read at all.
+    
+    Code that writes these tables some other way (e.g. a bulk import) must
+    call bump_table_version() in the same transaction.
+    
+    Args:
+        table_name: "users" or "products"
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        The version (0 if the table has never been changed through these functions)
+    """
+    _check_versioned_table(table_name)
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        return db.scalar(_table_version_stmt(table_name)) or 0
+
+
+def bump_table_version(table_name: str, db: Optional[Session] = None):
+    """
+    Increment the change counter of a table in VERSIONED_TABLES (see get_table_version).
+    
+    One upsert, which creates the counter on first use (see _bump_table_version_stmt).
+    The counter row stays locked until the transaction ends, so concurrent
+    inserts into the same table queue up behind each other's COMMIT - keep the
+    transactions that call this short.
+    
+    Args:
+        table_name: "users" or "products"
+        db: Optional session to run in (see database.session_scope)
+    """
+    _check_versioned_table(table_name)
+    with session_scope(db) as db:
+        db.execute(_bump_table_version_stmt(table_name))
+
+
+def _check_versioned_table(table_name: str):
+    """Raise ValueError for a table without a change counter."""
+    if table_name not in VERSIONED_TABLES:
+        raise ValueError(f"table_name must be one of {VERSIONED_TABLES}, got {table_name!r}")
+
+
+def _table_version_stmt(table_name: str):
+    """Query for a table's change counter (primary key lookup; no row = never changed)."""
+    return select(TableVersions.version).where(TableVersions.table_name == table_name)
+
+
+def _bump_table_version_stmt(table_name: str):
+    """
+    Upsert incrementing a table's change counter:
+    
+        INSERT INTO table_versions (table_name, version) VALUES (:table_name, 1)
+        ON CONFLICT (table_name) DO UPDATE SET version = table_versions.version + 1, changed_at = now()
+    """
+    stmt = pg_insert(TableVersions).values(table_name=table_name, version=1)
+    return stmt.on_conflict_do_update(
+        index_elements=[TableVersions.table_name],
+        set_={"version": TableVersions.version + 1, "changed_at": func.now()}
+    )
+
+
+@track_operation
+def list_orders(user_id: int, after_id: Optional[int] = None, limit: Optional[int] = None,
+                count: Optional[str] = None, headers_only: bool = False,
+                db: Optional[Session] = None) -> dict:
+    """
+    List orders for a specific user, one page at a time.
+    
+    This function retrieves a page of orders belonging to the specified user,
+    ordered by order ID (keyset pagination, see list_users).
+    It includes order details, all items in each order, and the order totals.
+    Also includes user name and product names for convenience.
+    
+    The totals are stored on the orders table (total_amount_cents and
+    total_quantity, written by create_order), so with headers_only=True the
+    order_items table is not queried at all - useful for order history lists
+    that only show one line per order.
+    
+    Args:
+        user_id: The ID of the user whose orders to retrieve
+        after_id: Return orders with an ID greater than this (None = first page)
+        limit: Page size (default DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE)
+        count: None to skip counting; "exact" or "estimate" both count this
+            user's orders exactly (table statistics can't estimate one user's rows)
+        headers_only: If True, skip the items (the orders have no "items" key)
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        Dictionary containing:
+        {
+            "orders": list of order dictionaries,
+            "next_cursor": int or None (pass as after_id to get the next page),
+            "total": int or None (count of this user's orders, see `count`)
+        }
         
-        # Return orders list and total count
+        Each order dictionary contains:
+        {
+            "id": int,
+            "user_id": int,
+            "user_name": str,
+            "status": str,
+            "created_at": datetime,
+            "updated_at": datetime or None (last status change),
+            "items": list of item dictionaries (left out with headers_only),
+            "total_amount_cents": int,
+            "total_quantity": int
+        }
+    """
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        # Step 1: Query one page of order headers (plus the user's name and the stored totals)
+        # We select only the columns the response needs and get plain rows back,
+        # instead of full ORM objects that would be turned into dicts right away
+        # .where / .order_by / .limit: keyset pagination on the order ID (see list_users)
+        limit = _page_limit(limit)
+        orders = db.execute(_orders_page_stmt(user_id, after_id, limit)).all()
+        orders, next_cursor = _split_page(orders, limit)
+        
+        # Step 2: Query the items of ALL orders on this page in ONE query
+        # Why not joinedload(Orders.user) + joinedload(Orders.order_items)?
+        # A single JOIN repeats every order column (and the user row) once per item,
+        # so the result set grows with orders x items. Loading the items separately
+        # with "WHERE order_id IN (...)" returns each row exactly once.
+        # (This is the same idea as SQLAlchemy's selectinload, without the ORM objects.)
+        #
+        # Using Lazy Loading instead (not recommended) would run one query per order:
+        # for order in orders:
+        #     for item in order.order_items:  # <- triggers a query for every order (N+1 problem)
+        #
+        # With headers_only we skip this query: the totals are already on the order rows
+        items_by_order = {order.id: [] for order in orders}
+        if items_by_order and not headers_only:
+            item_rows = db.execute(_order_items_stmt(items_by_order.keys())).all()
+            _group_items(items_by_order, item_rows)
+
+        # Step 3: Build response list
+        orders_list = [
+            _order_dict(order, None if headers_only else items_by_order[order.id])
+            for order in orders
+        ]
+        
+        # Count this user's orders only when asked to (uses the user_id index)
+        total = None
+        if count is not None:
+            _check_count_mode(count)
+            total = db.query(func.count(Orders.id)).filter(Orders.user_id == user_id).scalar()
+        
+        # Return orders page, cursor for the next page and (optional) total count
         return {
             "orders": orders_list,
-            "total": len(orders_list)
+            "next_cursor": next_cursor,
+            "total": total
         }
+
+
+def _orders_page_stmt(user_id: int, after_id: Optional[int], limit: int):
+    """Query for one page (limit + 1 rows) of a user's order headers, with the user's name and totals."""
+    stmt = (
+        select(
+            Orders.id, Orders.user_id, Users.full_name, Orders.status, Orders.created_at,
+            Orders.updated_at, Orders.total_amount_cents, Orders.total_quantity
+        )
+        .join(Users, Users.id == Orders.user_id)
+        .where(Orders.user_id == user_id)
+    )
+    if after_id is not None:
+        stmt = stmt.where(Orders.id > after_id)
+    return stmt.order_by(Orders.id).limit(limit + 1)
+
+
+def _order_items_stmt(order_ids):
+    """Query for the items (with product names) of several orders, in one IN query."""
+    return (
+        select(
+            OrderItems.order_id, OrderItems.id, OrderItems.product_id,
+            OrderItems.quantity, OrderItems.price_cents_at_purchase, Products.name
+        )
+        .outerjoin(Products, Products.id == OrderItems.product_id)
+        .where(OrderItems.order_id.in_(order_ids))
+        .order_by(OrderItems.order_id, OrderItems.id)
+    )
+
+
+def _group_items(items_by_order: dict, item_rows):
+    """Append each row of _order_items_stmt() to its order's list in items_by_order."""
+    for row in item_rows:
+        items_by_order[row.order_id].append({
+            "id": row.id,
+            "product_id": row.product_id,
+            "quantity": row.quantity,
+            "price_cents_at_purchase": row.price_cents_at_purchase,
+            "product_name": row.name
+        })
+
+
+@track_operation
+def list_orders_by_product(product_id: int, after_id: Optional[int] = None, limit: Optional[int] = None,
+                           count: Optional[str] = None, db: Optional[Session] = None) -> dict:
+    """
+    List the orders that contain a product, one page at a time (reverse lookup).
+    
+    Answers "who bought product 17" for recalls and support, without going
+    through every user's orders. The order IDs are read from the
+    idx_order_items_product_id_order_id index (product_id, order_id): all
+    items of the product sit next to each other in order ID order, so the
+    query reads one page worth of index entries and stops.
+    
+    Only the order headers are returned (same shape as list_orders() with
+    headers_only=True), plus how many of the product each order contains;
+    the order's other items are not loaded.
+    
+    Args:
+        product_id: The ID of the product
+        after_id: Return orders with an ID greater than this (None = first page)
+        limit: Page size (default DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE)
+        count: None to skip counting; "exact" or "estimate" both count the
+            orders containing this product exactly
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        Dictionary containing:
+        {
+            "orders": list of order dictionaries (see list_orders, without "items")
+                with an extra "product_quantity": int (units of this product in the order),
+            "next_cursor": int or None (pass as after_id to get the next page),
+            "total": int or None (number of orders containing the product, see `count`)
+        }
+    """
+    limit = _page_limit(limit)
+    
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        rows = db.execute(_orders_by_product_stmt(product_id, after_id, limit)).all()
+        rows, next_cursor = _split_page(rows, limit)
+        
+        orders_list = []
+        for row in rows:
+            order_dict = _order_dict(row, None)
+            order_dict["product_quantity"] = row.product_quantity
+            orders_list.append(order_dict)
+        
+        total = None
+        if count is not None:
+            _check_count_mode(count)
+            total = db.scalar(
+                select(func.count(func.distinct(OrderItems.order_id))).where(OrderItems.product_id == product_id)
+            )
+        
+        return {
+            "orders": orders_list,
+            "next_cursor": next_cursor,
+            "total": total
+        }
+
+
+def _orders_by_product_stmt(product_id: int, after_id: Optional[int], limit: int):
+    """
+    Query for one page (limit + 1 rows) of the order headers containing a product.
+    
+    The subquery walks idx_order_items_product_id_order_id and groups the
+    product's items per order (an order can list the same product twice);
+    only the limit + 1 order IDs it returns are joined to orders and users.
+    """
+    items = select(
+        OrderItems.order_id,
+        func.sum(OrderItems.quantity).label("product_quantity")
+    ).where(OrderItems.product_id == product_id)
+    if after_id is not None:
+        items = items.where(OrderItems.order_id > after_id)
+    items = items.group_by(OrderItems.order_id).order_by(OrderItems.order_id).limit(limit + 1).subquery()
+    
+    return (
+        select(
+            Orders.id, Orders.user_id, Users.full_name, Orders.status, Orders.created_at,
+            Orders.updated_at, Orders.total_amount_cents, Orders.total_quantity, items.c.product_quantity
+        )
+        .join(items, items.c.order_id == Orders.id)
+        .join(Users, Users.id == Orders.user_id)
+        .order_by(Orders.id)
+    )
+
+
+@track_operation
+def list_orders_by_status(statuses: tuple = OPEN_ORDER_STATUSES, created_after: Optional[datetime] = None,
+                          created_before: Optional[datetime] = None, after: Optional[str] = None,
+                          limit: Optional[int] = None, db: Optional[Session] = None) -> dict:
+    """
+    List open orders by status and creation time, oldest first, one page at a time.
+    
+    Meant for fulfillment workers polling their backlog, e.g. "all paid orders
+    older than 30 minutes":
+        list_orders_by_status(("paid",), created_before=now - timedelta(minutes=30))
+    
+    Only the open statuses (OPEN_ORDER_STATUSES) can be queried: they are the
+    ones in the partial index idx_orders_open_status_created_at, which stays
+    small because shipped and cancelled orders (the ever-growing history) are
+    not in it. For each status the query walks that index from the oldest
+    matching order and stops after one page, no matter how big orders gets.
+    
+    Pagination is keyset on (created_at, id) - orders are sorted by time, and
+    the ID breaks ties between orders created at the same moment. The cursor
+    is an opaque string; pass next_cursor back as `after`.
+    
+    Args:
+        statuses: Statuses to include (subset of OPEN_ORDER_STATUSES)
+        created_after: Only orders created at or after this time (None = no lower bound)
+        created_before: Only orders created before this time (None = no upper bound)
+        after: next_cursor of the previous page (None = first page)
+        limit: Page size (default DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE)
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        Dictionary containing:
+        {
+            "orders": list of order dictionaries (see list_orders, without "items"),
+            "next_cursor": str or None (pass as `after` to get the next page)
+        }
+    """
+    statuses = tuple(dict.fromkeys(statuses))
+    if not statuses or any(status not in OPEN_ORDER_STATUSES for status in statuses):
+        raise ValueError(f"statuses must be a non-empty subset of {OPEN_ORDER_STATUSES}, got {statuses!r}")
+    limit = _page_limit(limit)
+    stmt = _orders_by_status_stmt(statuses, created_after, created_before, _decode_time_cursor(after), limit)
+    
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        rows = db.execute(stmt).all()
+        return _orders_by_status_response(rows, limit)
+
+
+def _orders_by_status_stmt(statuses: tuple, created_after: Optional[datetime], created_before: Optional[datetime],
+                           cursor: Optional[tuple], limit: int):
+    """
+    Query for one page (limit + 1 rows) of order headers with the given statuses, by (created_at, id).
+    
+    One branch per status, combined with UNION ALL: each branch is a range scan
+    of the partial index that already returns its rows in (created_at, id)
+    order and stops after limit + 1 rows, so at most len(statuses) * (limit + 1)
+    rows are merged. (A single "status IN (...)" would have to read and sort
+    every matching order of all statuses.)
+    """
+    branches = []
+    for status in statuses:
+        branch = select(Orders.id, Orders.created_at).where(
+            Orders.status == status,
+            Orders.created_at.is_not(None)
+        )
+        if created_after is not None:
+            branch = branch.where(Orders.created_at >= created_after)
+        if created_before is not None:
+            branch = branch.where(Orders.created_at < created_before)
+        if cursor is not None:
+            # Row comparison: later time, or same time and higher ID
+            branch = branch.where(tuple_(Orders.created_at, Orders.id) > tuple_(*cursor))
+        branches.append(branch.order_by(Orders.created_at, Orders.id).limit(limit + 1))
+    page = (union_all(*branches) if len(branches) > 1 else branches[0]).subquery()
+    
+    return (
+        select(
+            Orders.id, Orders.user_id, Users.full_name, Orders.status, Orders.created_at,
+            Orders.updated_at, Orders.total_amount_cents, Orders.total_quantity
+        )
+        .join(page, page.c.id == Orders.id)
+        .join(Users, Users.id == Orders.user_id)
+        .order_by(page.c.created_at, page.c.id)
+        .limit(limit + 1)
+    )
+
+
+def _orders_by_status_response(rows: list, limit: int) -> dict:
+    """Build the list_orders_by_status() result from the limit + 1 rows of _orders_by_status_stmt()."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_time_cursor(rows[-1].created_at, rows[-1].id)
+    return {
+        "orders": [_order_dict(row, None) for row in rows],
+        "next_cursor": next_cursor
+    }
+
+
+# Cursor timestamps are microseconds since this moment (PostgreSQL's timestamp precision)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _encode_time_cursor(created_at: datetime, order_id: int) -> str:
+    """
+    Turn a (created_at, id) position into a cursor string like "1705401000000000:42".
+    
+    Integers only, so the cursor can be put in a URL as is and maps back to
+    the exact timestamp (no float rounding, no "+00:00" to escape).
+    """
+    microseconds = (created_at - _EPOCH) // timedelta(microseconds=1)
+    return f"{microseconds}:{order_id}"
+
+
+def _decode_time_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    """Turn a cursor from _encode_time_cursor() back into (created_at, id); None stays None."""
+    if cursor is None:
+        return None
+    try:
+        microseconds, order_id = (int(part) for part in cursor.split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return _EPOCH + timedelta(microseconds=microseconds), order_id
+
+
+@track_operation
+def user_order_summary(user_ids: list, db: Optional[Session] = None) -> dict:
+    """
+    Order count, lifetime spend and last order date for one or more users.
+    
+    Account dashboards need these three numbers, not the orders themselves.
+    Instead of loading every order with list_orders() and adding them up, the
+    database aggregates them - for the whole batch of users in ONE query:
+    
+    - ORDER_SUMMARY_SOURCE=query: a GROUP BY over the users' orders (through
+      idx_orders_user_id_created_at). It reads the totals stored on each order, so
+      order_items is not touched.
+    - ORDER_SUMMARY_SOURCE=view: one lookup per user in the user_order_summary
+      materialized view, which holds the same numbers precomputed for every
+      user. Cheaper for users with many orders, but the numbers are as old as
+      the last refresh (see refresh_user_order_summary()).
+    
+    Cancelled orders are counted in order_count but not in lifetime_spend_cents.
+    
+    Args:
+        user_ids: IDs of the users to summarize (at most SUMMARY_MAX_USERS)
+        db: Optional session to run in (see database.session_scope)
+    
+    Returns:
+        Dictionary containing:
+        {
+            "summaries": list of summary dictionaries, in the order of user_ids,
+            "refreshed_at": datetime or None - when the view was last
+                refreshed (None when the numbers were computed just now)
+        }
+        
+        Each summary dictionary contains:
+        {
+            "user_id": int,
+            "order_count": int (0 for users without orders),
+            "lifetime_spend_cents": int,
+            "last_order_at": datetime or None
+        }
+    """
+    user_ids = _summary_user_ids(user_ids)
+    if not user_ids:
+        return {"summaries": [], "refreshed_at": None}
+    
+    # Use the caller's session if one was passed in (e.g. request_db()), otherwise
+    # a new one that is committed and closed at the end (see database.session_scope)
+    with session_scope(db) as db:
+        refreshed_at = None
+        if ORDER_SUMMARY_SOURCE == "view":
+            rows = db.execute(_summary_view_stmt(user_ids)).all()
+            refreshed_at = _summary_refreshed_at(db, rows)
+            if _summary_is_stale(refreshed_at):
+                # Not in this request: a refresh needs a second connection while
+                # this session still holds one, which can exhaust the pool
+                # (DB_POOL_SIZE concurrent stale readers would all wait for a
+                # connection). This call serves the current numbers; later ones
+                # see the refreshed view.
+                _start_background_summary_refresh()
+        else:
+            rows = db.execute(_summary_query_stmt(user_ids)).all()
+        
+        return _summary_response(user_ids, rows, refreshed_at)
+
+
+@track_operation
+def refresh_user_order_summary(wait: bool = True) -> bool:
+    """
+    Recompute the user_order_summary materialized view.
+    
+    REFRESH ... CONCURRENTLY builds the new contents next to the old ones, so
+    user_order_summary() keeps reading the old numbers meanwhile instead of
+    waiting for the refresh (this needs the view's unique index on user_id).
+    
+    An advisory lock makes sure only one refresh runs at a time, even with
+    many worker processes noticing a stale view at once.
+    
+    Always runs in its own session and transaction (never the caller's), so
+    the refresh is committed on its own and no request holds its locks.
+    
+    Args:
+        wait: Wait for a refresh that is already running to finish and then
+            refresh again (maintenance job); False = skip if one is running
+            (on-read refresh, the caller serves the current numbers instead)
+    
+    Returns:
+        True if the view was refreshed, False if skipped
+    """
+    with session_scope() as db:
+        # Transaction-level lock: released automatically at commit/rollback
+        if wait:
+            db.execute(SUMMARY_REFRESH_LOCK)
+        elif not db.scalar(SUMMARY_REFRESH_TRY_LOCK):
+            return False
+        db.execute(SUMMARY_REFRESH)
+        return True
+
+
+# At most one background refresh per process (see _start_background_summary_refresh)
+_summary_refresh_running = threading.Lock()
+
+
+def _start_background_summary_refresh() -> bool:
+    """
+    Run refresh_user_order_summary(wait=False) in a background thread (on-read refresh).
+    
+    Returns:
+        True if a refresh was started, False if this process is already running one
+    """
+    if not _summary_refresh_running.acquire(blocking=False):
+        return False
+    
+    def refresh():
+        try:
+            refresh_user_order_summary(wait=False)
+        except Exception:
+            logger.exception("Background refresh of user_order_summary failed")
+        finally:
+            _summary_refresh_running.release()
+    
+    threading.Thread(target=refresh, name="order-summary-refresh", daemon=True).start()
+    return True
+
+
+# Statements used by refresh_user_order_summary() (and its async version)
+SUMMARY_REFRESH_LOCK = text("SELECT pg_advisory_xact_lock(hashtext('tony.user_order_summary'))")
+SUMMARY_REFRESH_TRY_LOCK = text("SELECT pg_try_advisory_xact_lock(hashtext('tony.user_order_summary'))")
+SUMMARY_REFRESH = text("REFRESH MATERIALIZED VIEW CONCURRENTLY tony.user_order_summary")
+
+
+def _summary_user_ids(user_ids: list) -> list:
+    """Drop duplicate user IDs (keeping the order) and enforce SUMMARY_MAX_USERS."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > SUMMARY_MAX_USERS:
+        raise ValueError(f"At most {SUMMARY_MAX_USERS} users per call, got {len(user_ids)}")
+    return user_ids
+
+
+def _summary_query_stmt(user_ids: list):
+    """Query computing the summary numbers of several users with one GROUP BY over orders."""
+    return (
+        select(
+            Orders.user_id,
+            func.count(Orders.id).label("order_count"),
+            # SUM of a BIGINT is NUMERIC in PostgreSQL; cast back so we get an int, not a Decimal
+            cast(func.coalesce(
+                func.sum(Orders.total_amount_cents).filter(Orders.status != "cancelled"), 0
+            ), BigInteger).label("lifetime_spend_cents"),
+            func.max(Orders.created_at).label("last_order_at")
+        )
+        .where(Orders.user_id.in_(user_ids))
+        .group_by(Orders.user_id)
+    )
+
+
+def _summary_view_stmt(user_ids: list):
+    """Query reading several users' rows from the user_order_summary view."""
+    view = user_order_summary_view
+    return select(
+        view.c.user_id, view.c.order_count, view.c.lifetime_spend_cents,
+        view.c.last_order_at, view.c.refreshed_at
+    ).where(view.c.user_id.in_(user_ids))
+
+
+def _summary_refreshed_at(db, rows: list) -> Optional[datetime]:
+    """When the view was refreshed (every view row carries the same refreshed_at)."""
+    if rows:
+        return rows[0].refreshed_at
+    # None of the users is in the view (yet): look at any row
+    return db.scalar(select(user_order_summary_view.c.refreshed_at).limit(1))
+
+
+def _summary_is_stale(refreshed_at: Optional[datetime]) -> bool:
+    """Whether an on-read refresh is due (ORDER_SUMMARY_REFRESH=on-read only)."""
+    if ORDER_SUMMARY_REFRESH != "on-read" or refreshed_at is None:
+        return False
+    return datetime.now(timezone.utc) - refreshed_at > timedelta(seconds=ORDER_SUMMARY_MAX_AGE_SECONDS)
+
+
+def _summary_response(user_ids: list, rows: list, refreshed_at: Optional[datetime]) -> dict:
+    """Build the user_order_summary() result; users without a row get zeros."""
+    by_user = {row.user_id: row for row in rows}
+    summaries = []
+    for user_id in user_ids:
+        row = by_user.get(user_id)
+        summaries.append({
+            "user_id": user_id,
+            "order_count": row.order_count if row else 0,
+            "lifetime_spend_cents": row.lifetime_spend_cents if row else 0,
+            "last_order_at": row.last_order_at if row else None
+        })
+    return {
+        "summaries": summaries,
+        "refreshed_at": refreshed_at
+    }
+
+
+def export_orders(after_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Stream every order (with its items), one dictionary per order.
+    
+    Unlike list_orders(), this is a generator: it reads from a server-side
+    cursor (yield_per) in batches of `batch_size` rows, so memory use stays
+    flat however big the table is, and the first order is yielded as soon as
+    the first batch arrives instead of after the whole table has been read.
+    
+    Orders and items are read in one query ordered by order ID; consecutive rows
+    of the same order are grouped back together. Only IDs are exported (no user
+    or product names) to keep the stream cheap - join them on the receiving side.
+    
+    Args:
+        after_id: Only export orders with an ID greater than this (resume a dump)
+        batch_size: Rows fetched from the server per round trip
+    
+    Yields:
+        Order dictionaries:
+        {
+            "id": int,
+            "user_id": int,
+            "status": str,
+            "created_at": datetime,
+            "items": [{"id", "product_id", "quantity", "price_cents_at_purchase"}, ...],
+            "total_amount_cents": int,
+            "total_quantity": int
+        }
+    """
+    # Create a new database session
+    # It stays open until the generator is exhausted or closed
+    db = get_db()
+    
+    try:
+        # LEFT JOIN so orders without items are exported too
+        # Ordering by order ID lets PostgreSQL walk the primary key index and start
+        # returning rows right away (cursors are planned for fast first rows)
+        stmt = _export_orders_stmt(after_id)
+        
+        # yield_per: use a server-side cursor and fetch batch_size rows at a time
+        rows = db.execute(stmt, execution_options={"yield_per": batch_size})
+        
+        # Group consecutive rows that belong to the same order
+        for _, order_rows in groupby(rows, key=lambda row: row.id):
+            yield _export_order_dict(list(order_rows))
+    finally:
+        # Always close the session (also runs when the consumer stops early)
+        db.close()
+
+
+def _export_orders_stmt(after_id: Optional[int]):
+    """Query for export_orders(): orders LEFT JOIN items, ordered by order ID."""
+    stmt = (
+        select(
+            Orders.id, Orders.user_id, Orders.status, Orders.created_at,
+            OrderItems.id.label("item_id"), OrderItems.product_id,
+            OrderItems.quantity, OrderItems.price_cents_at_purchase
+        )
+        .outerjoin(OrderItems, OrderItems.order_id == Orders.id)
+        .order_by(Orders.id)
+    )
+    if after_id is not None:
+        stmt = stmt.where(Orders.id > after_id)
+    return stmt
+
+
+def _export_order_dict(order_rows: list) -> dict:
+    """Build one export_orders() dictionary from the rows of a single order."""
+    first = order_rows[0]
+    items = [
+        {
+            "id": row.item_id,
+            "product_id": row.product_id,
+            "quantity": row.quantity,
+            "price_cents_at_purchase": row.price_cents_at_purchase
+        }
+        for row in order_rows
+        if row.item_id is not None
+    ]
+    return {
+        "id": first.id,
+        "user_id": first.user_id,
+        "status": first.status,
+        "created_at": first.created_at,
+        "items": items,
+        "total_amount_cents": sum(item["price_cents_at_purchase"] for item in items),
+        "total_quantity": sum(item["quantity"] for item in items)
+    }
+
+
+def export_users(after_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Stream every user, one dictionary per user (same shape as list_users()).
+    
+    Reads from a server-side cursor in batches of `batch_size` rows; see export_orders().
+    """
+    db = get_db()
+    
+    try:
+        stmt = select(Users.id, Users.email, Users.full_name, Users.created_at).order_by(Users.id)
+        if after_id is not None:
+            stmt = stmt.where(Users.id > after_id)
+        
+        for row in db.execute(stmt, execution_options={"yield_per": batch_size}):
+            yield _user_dict(row)
+    finally:
+        db.close()
+
+
+def export_products(after_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Stream every product, one dictionary per product (same shape as list_products()).
+    
+    Reads from a server-side cursor in batches of `batch_size` rows; see export_orders().
+    """
+    db = get_db()
+    
+    try:
+        stmt = select(Products.id, Products.name, Products.price_cents).order_by(Products.id)
+        if after_id is not None:
+            stmt = stmt.where(Products.id > after_id)
+        
+        for row in db.execute(stmt, execution_options={"yield_per": batch_size}):
+            yield _product_dict(row)
     finally:
-        # Always close the session
         db.close()
 
+
+def _user_dict(user) -> dict:
+    """
+    Convert a user (ORM object or row with the same column names) to a dictionary.
+    
+    Every function returning users uses this, so they all have the same shape.
+    """
+    return {
+        "id": user.id,  # The user's ID (primary key)
+        "email": user.email,
+        "full_name": user.full_name,
+        # created_at stays a datetime: the APIs' JSON provider writes it as an
+        # ISO 8601 string (e.g., "2024-01-15T10:30:00+00:00"), see json_provider.py
+        "created_at": user.created_at
+    }
+
+
+def _product_dict(product) -> dict:
+    """Convert a product (ORM object or row) to a dictionary; price is in cents (249999 = $2499.99)."""
+    return {
+        "id": product.id,
+        "name": product.name,
+        "price_cents": product.price_cents
+    }
+
+
+def _order_dict(order, items: Optional[list]) -> dict:
+    """
+    Build a list_orders() order dictionary from an order header row and its item dictionaries.
+    
+    Args:
+        order: Row with id, user_id, full_name (the user's name), status, created_at,
+            updated_at, total_amount_cents, total_quantity (see _orders_page_stmt)
+        items: Item dictionaries of this order (see list_orders), or None to
+            leave out the "items" key (headers_only)
+    """
+    order_dict = {
+        "id": order.id,
+        "user_id": order.user_id,
+        "user_name": order.full_name,
+        "status": order.status,
+        "created_at": order.created_at,
+        # Last status change; pass it to transition_order_status() as the version
+        "updated_at": order.updated_at,
+        "items": items,
+        # Totals stored on the order by create_order (no need to sum up the items)
+        "total_amount_cents": order.total_amount_cents,
+        "total_quantity": order.total_quantity
+    }
+    if items is None:
+        del order_dict["items"]
+    return order_dict
+
+
+def _page_limit(limit: Optional[int]) -> int:
+    """Turn a requested page size into the one we will use (default, at least 1, at most MAX_PAGE_SIZE)."""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _split_page(rows: list, limit: int) -> tuple:
+    """
+    Split the `limit + 1` rows fetched by a keyset query into (page, next_cursor).
+    
+    If the extra row came back there is another page, and the cursor is the ID of
+    the last row on this page; otherwise next_cursor is None.
+    """
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def _check_count_mode(count: str):
+    """Raise ValueError for an unknown count mode."""
+    if count not in COUNT_MODES:
+        raise ValueError(f"count must be one of {COUNT_MODES}, got {count!r}")
+
+
+def _count_rows(db, model, count: Optional[str]) -> Optional[int]:
+    """
+    Count the rows of a whole table.
+    
+    Args:
+        db: Open database session
+        model: ORM model whose table to count
+        count: None (don't count), "exact" (COUNT(*)) or "estimate"
+            (pg_class.reltuples, maintained by VACUUM/ANALYZE)
+    
+    Returns:
+        Row count, or None if count is None
+    """
+    if count is None:
+        return None
+    _check_count_mode(count)
+    
+    if count == "estimate":
+        # reltuples is -1 (or 0 on older PostgreSQL) until the table has been
+        # analyzed; fall back to an exact count then, which is cheap for a new table
+        estimate = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)"),
+            {"table_name": model.__table__.fullname}
+        ).scalar()
+        if estimate is not None and estimate > 0:
+            return estimate
+    
+    return db.query(func.count()).select_from(model).scalar()
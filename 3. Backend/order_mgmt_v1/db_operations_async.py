@@ -0,0 +1,544 @@
+"""
+Async Database Operations Module
+
+Asyncio versions of the functions in db_operations.py, used by order_api_async.py.
+Each function has the same name, arguments (except the optional `db`
+session) and return value as its sync counterpart - only `await` is needed
+to call it:
+
+    result = await list_orders(user_id, limit=50)
+
+While a function waits for PostgreSQL, the event loop serves other requests,
+so one process can keep many requests in flight (a sync worker can only wait
+for one at a time).
+
+The response dictionaries are built by the same helpers as in db_operations
+(_user_dict, _order_dict, ...), and the queries are the same statements, so
+both APIs return identical JSON. See db_operations.py for the detailed
+explanation of each query; the comments here only cover what is different.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+from sqlalchemy import func, insert, select, text
+from database_async import get_async_db
+from product_cache import product_cache
+from models import Users, Products, Orders, OrderItems
+from db_operations import (
+    BULK_ORDER_CHUNK_SIZE, EXPORT_BATCH_SIZE, OPEN_ORDER_STATUSES, ORDER_SUMMARY_SOURCE,
+    SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT,
+    SUMMARY_REFRESH, SUMMARY_REFRESH_LOCK, SUMMARY_REFRESH_TRY_LOCK, user_order_summary_view,
+    _bulk_order_ids, _check_count_mode, _chunk_error, _export_order_dict, _export_orders_stmt, _group_items,
+    _decode_time_cursor, _order_dict, _order_items_stmt, _orders_by_product_stmt, _orders_by_status_response,
+    _orders_by_status_stmt, _orders_page_stmt, _page_limit, _prepare_bulk_orders,
+    _product_dict, _search_users_stmt, _split_page, _summary_is_stale, _summary_query_stmt,
+    _summary_response, _summary_user_ids, _summary_view_stmt, _user_dict,
+    _check_transition, _transition_batch_response, _transition_batch_stmt, _transition_current_stmt,
+    _transition_dict, _transition_order_ids, _transition_stmt,
+    _check_idempotency_key, _idempotency_claim_stmt, _idempotency_lookup_stmt, _idempotency_save_stmt,
+    _idempotent_replay, _order_request_hash,
+    _bump_table_version_stmt, _check_versioned_table, _table_version_stmt
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def create_user(email: str, full_name: str) -> dict:
+    """Create a new user (see db_operations.create_user)."""
+    async with get_async_db() as db:
+        new_user = Users(email=email, full_name=full_name, created_at=datetime.now(timezone.utc))
+        db.add(new_user)
+        await db.flush()
+        # Same transaction as the INSERT (see db_operations.get_table_version)
+        await db.execute(_bump_table_version_stmt("users"))
+        await db.commit()
+        # expire_on_commit=False keeps the attributes loaded, including the new ID
+        return _user_dict(new_user)
+
+
+async def create_product(name: str, price_cents: int) -> dict:
+    """Create a new product (see db_operations.create_product)."""
+    async with get_async_db() as db:
+        new_product = Products(name=name, price_cents=price_cents)
+        db.add(new_product)
+        await db.flush()
+        await db.execute(_bump_table_version_stmt("products"))
+        await db.commit()
+
+        # The catalog changed: drop cached product pages so the new product shows up
+        product_cache.invalidate()
+        return _product_dict(new_product)
+
+
+async def create_order(user_id: int, status: str, items: list) -> dict:
+    """
+    Create a new order with multiple items (see db_operations.create_order).
+
+    Same round trips as the sync version: one product lookup (skipped for cached
+    products), one INSERT for the order, one multi-row INSERT for the items.
+
+    Raises:
+        ValueError: If any of the product IDs does not exist
+    """
+    async with get_async_db() as db:
+        order = await _insert_order(db, user_id, status, items)
+        # Step 5: Commit order + items in one transaction
+        await db.commit()
+        return order
+
+
+async def _insert_order(db, user_id: int, status: str, items: list) -> dict:
+    """Insert an order and its items into `db` without committing (steps 1-4 of create_order)."""
+    # Step 1: Resolve the current price of every product in at most ONE query
+    product_ids = [item_data["product_id"] for item_data in items]
+    products = await _load_products(db, product_ids)
+    missing = set(product_ids) - products.keys()
+    if missing:
+        raise ValueError(f"Product(s) not found: {sorted(missing)}")
+
+    # Step 2: Build order item rows from the prices we already loaded
+    item_rows = []
+    items_list = []
+    for item_data in items:
+        product = products[item_data["product_id"]]
+        price_at_purchase = product["price_cents"] * item_data["quantity"]
+        item_rows.append({
+            "product_id": item_data["product_id"],
+            "quantity": item_data["quantity"],
+            "price_cents_at_purchase": price_at_purchase
+        })
+        items_list.append({
+            "product_id": item_data["product_id"],
+            "quantity": item_data["quantity"],
+            "price_cents_at_purchase": price_at_purchase,
+            "product_name": product["name"]
+        })
+    total_amount = sum(item["price_cents_at_purchase"] for item in items_list)
+    total_quantity = sum(item["quantity"] for item in items_list)
+
+    # Step 3: Create the order record with its totals (flush = INSERT ... RETURNING id)
+    created_at = datetime.now(timezone.utc)
+    new_order = Orders(user_id=user_id, status=status, created_at=created_at,
+                       total_amount_cents=total_amount, total_quantity=total_quantity)
+    db.add(new_order)
+    await db.flush()
+    for item_row in item_rows:
+        item_row["order_id"] = new_order.id
+
+    # Step 4: Insert all order items with ONE multi-row INSERT ... RETURNING id
+    # (none for an order without items - see create_order in db_operations.py)
+    item_ids = []
+    if item_rows:
+        item_ids = (await db.scalars(
+            insert(OrderItems).returning(OrderItems.id, sort_by_parameter_order=True),
+            item_rows
+        )).all()
+    for item_dict, item_id in zip(items_list, item_ids):
+        item_dict["id"] = item_id
+
+    return {
+        "id": new_order.id,
+        "user_id": user_id,
+        "status": status,
+        "created_at": created_at,
+        "items": items_list,
+        "total_amount_cents": total_amount,
+        "total_quantity": total_quantity
+    }
+
+
+async def create_order_idempotent(idempotency_key: str, user_id: int, status: str, items: list) -> dict:
+    """
+    Create an order at most once per idempotency key (see db_operations.create_order_idempotent).
+
+    The key check, the order and the stored response share one transaction,
+    committed once at the end; a repeated key costs one primary key lookup.
+    """
+    _check_idempotency_key(idempotency_key)
+    request_hash = _order_request_hash(user_id, status, items)
+    async with get_async_db() as db:
+        stored = (await db.execute(_idempotency_lookup_stmt(idempotency_key))).first()
+        if stored is None and await db.scalar(_idempotency_claim_stmt(idempotency_key, request_hash)) is None:
+            stored = (await db.execute(_idempotency_lookup_stmt(idempotency_key))).first()
+        if stored is not None:
+            return _idempotent_replay(stored, request_hash)
+
+        order = await _insert_order(db, user_id, status, items)
+        await db.execute(_idempotency_save_stmt(idempotency_key, order))
+        await db.commit()
+        return {"outcome": "created", "order": order}
+
+
+async def _load_products(db, product_ids) -> dict:
+    """Load several products through the product cache, skipping IDs that do not exist."""
+    async def query_products(missing_ids: set) -> dict:
+        rows = (await db.execute(
+            select(Products.id, Products.name, Products.price_cents).where(Products.id.in_(missing_ids))
+        )).all()
+        return {row.id: {"id": row.id, "name": row.name, "price_cents": row.price_cents} for row in rows}
+
+    return await product_cache.get_many_async(product_ids, query_products)
+
+
+async def create_orders_bulk(orders: list, chunk_size: int = BULK_ORDER_CHUNK_SIZE) -> dict:
+    """Create many orders at once, one transaction per chunk (see db_operations.create_orders_bulk)."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    results = [None] * len(orders)
+
+    async with get_async_db() as db:
+        # Step 1: Look up every distinct product and user ONCE for the whole call
+        user_ids, product_ids = _bulk_order_ids(orders)
+        products = await _load_products(db, product_ids)
+        known_users = set((await db.scalars(select(Users.id).where(Users.id.in_(user_ids)))).all()) \
+            if user_ids else set()
+        await db.rollback()  # End the read-only transaction before writing
+
+        # Step 2: Validate every order and pre-compute its item rows
+        valid = _prepare_bulk_orders(orders, products, known_users, results)
+
+        # Step 3: Write the valid orders chunk by chunk, one transaction per chunk
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            created_at = datetime.now(timezone.utc)
+            try:
+                order_ids = (await db.scalars(
+                    insert(Orders).returning(Orders.id, sort_by_parameter_order=True),
+                    [
+                        {
+                            "user_id": order_data["user_id"],
+                            "status": order_data["status"],
+                            "created_at": created_at,
+                            "total_amount_cents": total_amount,
+                            "total_quantity": total_quantity
+                        }
+                        for _, order_data, _, total_amount, total_quantity in chunk
+                    ]
+                )).all()
+                await db.execute(insert(OrderItems), [
+                    {"order_id": order_id, **item_row}
+                    for order_id, (_, _, item_rows, _, _) in zip(order_ids, chunk)
+                    for item_row in item_rows
+                ])
+                await db.commit()
+            except Exception as e:
+                # Roll back this chunk only and report every order in it as failed
+                await db.rollback()
+                for index, _, _, _, _ in chunk:
+                    results[index] = {"index": index, "ok": False, "error": _chunk_error(e)}
+                continue
+
+            for order_id, (index, _, item_rows, total_amount, total_quantity) in zip(order_ids, chunk):
+                results[index] = {
+                    "index": index,
+                    "ok": True,
+                    "id": order_id,
+                    "item_count": len(item_rows),
+                    "total_amount_cents": total_amount,
+                    "total_quantity": total_quantity
+                }
+
+    created = sum(1 for result in results if result["ok"])
+    return {
+        "results": results,
+        "created": created,
+        "failed": len(results) - created
+    }
+
+
+async def transition_order_status(order_id: int, from_status: str, to_status: str,
+                                  expected_updated_at: Optional[datetime] = None) -> dict:
+    """Change one order's status with a conditional UPDATE (see db_operations.transition_order_status)."""
+    _check_transition(from_status, to_status)
+    async with get_async_db() as db:
+        row = (await db.execute(_transition_stmt(order_id, from_status, to_status, expected_updated_at))).first()
+        if row is not None:
+            await db.commit()
+            return {"ok": True, "order": _transition_dict(row)}
+        current = (await db.execute(_transition_current_stmt(order_id))).first()
+        return {"ok": False, "order": _transition_dict(current) if current is not None else None}
+
+
+async def transition_orders_status(order_ids: list, from_status: str, to_status: str) -> dict:
+    """Change many orders' status in one statement (see db_operations.transition_orders_status)."""
+    _check_transition(from_status, to_status)
+    order_ids = _transition_order_ids(order_ids)
+    if not order_ids:
+        return {"updated": [], "skipped": []}
+    async with get_async_db() as db:
+        rows = (await db.execute(_transition_batch_stmt(order_ids, from_status, to_status))).all()
+        await db.commit()
+    return _transition_batch_response(order_ids, rows)
+
+
+async def list_users(after_id: Optional[int] = None, limit: Optional[int] = None,
+                     count: Optional[str] = None) -> dict:
+    """List users one page at a time, keyset pagination on the ID (see db_operations.list_users)."""
+    limit = _page_limit(limit)
+    async with get_async_db() as db:
+        stmt = select(Users.id, Users.email, Users.full_name, Users.created_at)
+        if after_id is not None:
+            stmt = stmt.where(Users.id > after_id)
+        users = (await db.execute(stmt.order_by(Users.id).limit(limit + 1))).all()
+        users, next_cursor = _split_page(users, limit)
+        return {
+            "users": [_user_dict(user) for user in users],
+            "next_cursor": next_cursor,
+            "total": await _count_rows(db, Users, count)
+        }
+
+
+async def get_user_by_name(full_name: str) -> Optional[dict]:
+    """Find a user by exact full name (see db_operations.get_user_by_name)."""
+    async with get_async_db() as db:
+        user = (await db.execute(
+            select(Users.id, Users.email, Users.full_name, Users.created_at)
+            .where(Users.full_name == full_name).order_by(Users.id).limit(1)
+        )).first()
+        return _user_dict(user) if user is not None else None
+
+
+async def get_user_by_email(email: str) -> Optional[dict]:
+    """Find a user by email address, ignoring case (see db_operations.get_user_by_email)."""
+    async with get_async_db() as db:
+        user = (await db.execute(
+            select(Users.id, Users.email, Users.full_name, Users.created_at)
+            .where(func.lower(Users.email) == email.lower()).order_by(Users.id).limit(1)
+        )).first()
+        return _user_dict(user) if user is not None else None
+
+
+async def search_users(prefix: str, limit: Optional[int] = None) -> dict:
+    """Find users whose full name or email starts with `prefix` (see db_operations.search_users)."""
+    limit = SEARCH_DEFAULT_LIMIT if limit is None else max(1, min(limit, SEARCH_MAX_LIMIT))
+    stmt = _search_users_stmt(prefix, limit)
+    if stmt is None:
+        return {"users": []}
+
+    async with get_async_db() as db:
+        rows = (await db.execute(stmt)).all()
+
+    rows = sorted(rows, key=lambda row: (row.full_name.lower(), row.id))[:limit]
+    return {"users": [_user_dict(row) for row in rows]}
+
+
+async def list_products(after_id: Optional[int] = None, limit: Optional[int] = None,
+                        count: Optional[str] = None, version: Optional[int] = None) -> dict:
+    """List products one page at a time, served from the product cache when possible (see db_operations.list_products)."""
+    limit = _page_limit(limit)
+    return await product_cache.get_or_load_async(
+        ("page", after_id, limit, count, version),
+        lambda: _list_products_uncached(after_id, limit, count)
+    )
+
+
+async def _list_products_uncached(after_id: Optional[int], limit: int, count: Optional[str]) -> dict:
+    """Query one page of products from the database (list_products() without the cache)."""
+    async with get_async_db() as db:
+        stmt = select(Products.id, Products.name, Products.price_cents)
+        if after_id is not None:
+            stmt = stmt.where(Products.id > after_id)
+        products = (await db.execute(stmt.order_by(Products.id).limit(limit + 1))).all()
+        products, next_cursor = _split_page(products, limit)
+        return {
+            "products": [_product_dict(product) for product in products],
+            "next_cursor": next_cursor,
+            "total": await _count_rows(db, Products, count)
+        }
+
+
+async def get_table_version(table_name: str) -> int:
+    """Change counter of the users or products table (see db_operations.get_table_version)."""
+    _check_versioned_table(table_name)
+    async with get_async_db() as db:
+        return (await db.scalar(_table_version_stmt(table_name))) or 0
+
+
+async def list_orders(user_id: int, after_id: Optional[int] = None, limit: Optional[int] = None,
+                      count: Optional[str] = None, headers_only: bool = False) -> dict:
+    """List one page of a user's orders, with or without their items (see db_operations.list_orders)."""
+    limit = _page_limit(limit)
+    async with get_async_db() as db:
+        # Step 1: One page of order headers (plus the user's name and the stored totals)
+        orders = (await db.execute(_orders_page_stmt(user_id, after_id, limit))).all()
+        orders, next_cursor = _split_page(orders, limit)
+
+        # Step 2: The items of ALL orders on this page in ONE query (skipped for headers_only)
+        items_by_order = {order.id: [] for order in orders}
+        if items_by_order and not headers_only:
+            item_rows = (await db.execute(_order_items_stmt(items_by_order.keys()))).all()
+            _group_items(items_by_order, item_rows)
+
+        # Count this user's orders only when asked to
+        total = None
+        if count is not None:
+            _check_count_mode(count)
+            total = await db.scalar(select(func.count(Orders.id)).where(Orders.user_id == user_id))
+
+        return {
+            "orders": [
+                _order_dict(order, None if headers_only else items_by_order[order.id])
+                for order in orders
+            ],
+            "next_cursor": next_cursor,
+            "total": total
+        }
+
+
+async def list_orders_by_product(product_id: int, after_id: Optional[int] = None, limit: Optional[int] = None,
+                                 count: Optional[str] = None) -> dict:
+    """List one page of the order headers containing a product (see db_operations.list_orders_by_product)."""
+    limit = _page_limit(limit)
+    async with get_async_db() as db:
+        rows = (await db.execute(_orders_by_product_stmt(product_id, after_id, limit))).all()
+        rows, next_cursor = _split_page(rows, limit)
+
+        total = None
+        if count is not None:
+            _check_count_mode(count)
+            total = await db.scalar(
+                select(func.count(func.distinct(OrderItems.order_id))).where(OrderItems.product_id == product_id)
+            )
+
+    orders_list = []
+    for row in rows:
+        order_dict = _order_dict(row, None)
+        order_dict["product_quantity"] = row.product_quantity
+        orders_list.append(order_dict)
+    return {"orders": orders_list, "next_cursor": next_cursor, "total": total}
+
+
+async def list_orders_by_status(statuses: tuple = OPEN_ORDER_STATUSES, created_after: Optional[datetime] = None,
+                                created_before: Optional[datetime] = None, after: Optional[str] = None,
+                                limit: Optional[int] = None) -> dict:
+    """List open orders by status and creation time, oldest first (see db_operations.list_orders_by_status)."""
+    statuses = tuple(dict.fromkeys(statuses))
+    if not statuses or any(status not in OPEN_ORDER_STATUSES for status in statuses):
+        raise ValueError(f"statuses must be a non-empty subset of {OPEN_ORDER_STATUSES}, got {statuses!r}")
+    limit = _page_limit(limit)
+    stmt = _orders_by_status_stmt(statuses, created_after, created_before, _decode_time_cursor(after), limit)
+    async with get_async_db() as db:
+        rows = (await db.execute(stmt)).all()
+    return _orders_by_status_response(rows, limit)
+
+
+async def user_order_summary(user_ids: list) -> dict:
+    """Order count, lifetime spend and last order date of several users in one query (see db_operations.user_order_summary)."""
+    user_ids = _summary_user_ids(user_ids)
+    if not user_ids:
+        return {"summaries": [], "refreshed_at": None}
+
+    async with get_async_db() as db:
+        refreshed_at = None
+        if ORDER_SUMMARY_SOURCE == "view":
+            rows = (await db.execute(_summary_view_stmt(user_ids))).all()
+            refreshed_at = await _summary_refreshed_at(db, rows)
+            if _summary_is_stale(refreshed_at):
+                # In the background, not on this request's second connection
+                # (see db_operations.user_order_summary)
+                _start_background_summary_refresh()
+        else:
+            rows = (await db.execute(_summary_query_stmt(user_ids))).all()
+
+    return _summary_response(user_ids, rows, refreshed_at)
+
+
+async def refresh_user_order_summary(wait: bool = True) -> bool:
+    """Recompute the user_order_summary view, one refresh at a time (see db_operations.refresh_user_order_summary)."""
+    async with get_async_db() as db:
+        if wait:
+            await db.execute(SUMMARY_REFRESH_LOCK)
+        elif not await db.scalar(SUMMARY_REFRESH_TRY_LOCK):
+            return False  # closing the session rolls back, which releases the lock
+        await db.execute(SUMMARY_REFRESH)
+        await db.commit()
+        return True
+
+
+# The running background refresh task (at most one per process)
+_summary_refresh_task: Optional[asyncio.Task] = None
+
+
+def _start_background_summary_refresh() -> bool:
+    """Start refresh_user_order_summary(wait=False) as a task unless one is running (see db_operations)."""
+    global _summary_refresh_task
+    if _summary_refresh_task is not None and not _summary_refresh_task.done():
+        return False
+    _summary_refresh_task = asyncio.create_task(refresh_user_order_summary(wait=False))
+    _summary_refresh_task.add_done_callback(_log_summary_refresh_error)
+    return True
+
+
+def _log_summary_refresh_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background refresh of user_order_summary failed", exc_info=task.exception())
+
+
+async def _summary_refreshed_at(db, rows: list):
+    """When the view was refreshed (see db_operations._summary_refreshed_at)."""
+    if rows:
+        return rows[0].refreshed_at
+    return await db.scalar(select(user_order_summary_view.c.refreshed_at).limit(1))
+
+
+async def export_orders(after_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """
+    Stream every order (with its items), one dictionary per order (see db_operations.export_orders).
+
+    An async generator: use `async for order in export_orders(): ...`.
+    db.stream() opens a server-side cursor and fetches batch_size rows at a time.
+    """
+    async with get_async_db() as db:
+        rows = await db.stream(_export_orders_stmt(after_id), execution_options={"yield_per": batch_size})
+
+        # Group consecutive rows that belong to the same order
+        # (itertools.groupby only works on regular iterators)
+        order_rows = []
+        async for row in rows:
+            if order_rows and row.id != order_rows[0].id:
+                yield _export_order_dict(order_rows)
+                order_rows = []
+            order_rows.append(row)
+        if order_rows:
+            yield _export_order_dict(order_rows)
+
+
+async def export_users(after_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Stream every user, one dictionary per user (see db_operations.export_users)."""
+    async with get_async_db() as db:
+        stmt = select(Users.id, Users.email, Users.full_name, Users.created_at).order_by(Users.id)
+        if after_id is not None:
+            stmt = stmt.where(Users.id > after_id)
+
+        async for row in await db.stream(stmt, execution_options={"yield_per": batch_size}):
+            yield _user_dict(row)
+
+
+async def export_products(after_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Stream every product, one dictionary per product (see db_operations.export_products)."""
+    async with get_async_db() as db:
+        stmt = select(Products.id, Products.name, Products.price_cents).order_by(Products.id)
+        if after_id is not None:
+            stmt = stmt.where(Products.id > after_id)
+
+        async for row in await db.stream(stmt, execution_options={"yield_per": batch_size}):
+            yield _product_dict(row)
+
+
+async def _count_rows(db, model, count: Optional[str]) -> Optional[int]:
+    """Count the rows of a whole table: None, "exact" or "estimate" (see db_operations._count_rows)."""
+    if count is None:
+        return None
+    _check_count_mode(count)
+
+    if count == "estimate":
+        estimate = await db.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)"),
+            {"table_name": model.__table__.fullname}
+        )
+        if estimate is not None and estimate > 0:
+            return estimate
+
+    return await db.scalar(select(func.count()).select_from(model))
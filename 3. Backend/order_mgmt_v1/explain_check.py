@@ -0,0 +1,247 @@
+"""
+Index regression check: EXPLAIN the main queries and fail on sequential scans
+
+Every access path of the app should be served by an index (see the index list
+in models.py / 2. Database/postgres.sql). On a small table PostgreSQL happily
+reads the whole table instead, so this check first makes sure the database is
+big enough for the planner to care, then EXPLAINs each query and fails if any
+plan contains a Seq Scan on orders or order_items.
+
+Steps:
+1. Seed: add generated users, products, orders and items until there are at
+   least --min-orders orders (skipped with --no-seed), then ANALYZE
+2. EXPLAIN (FORMAT JSON) each query in CHECKS, built by the same statement
+   helpers db_operations uses, with real IDs from the database
+3. Print the plan summary per query; exit code 1 if any query seq-scans a big table
+
+Usage:
+    python explain_check.py
+    python explain_check.py --min-orders 1000000
+    python explain_check.py --no-seed --verbose
+
+Note: seeding writes test data into the database configured in .env - point
+DATABASE_URL at a development database. Run it after changing an index or a
+query, and in CI against a seeded database.
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, literal, select, text
+
+from database import engine, session_scope
+from db_operations import (
+    DEFAULT_PAGE_SIZE,
+    bump_table_version,
+    _order_items_stmt,
+    _decode_time_cursor,
+    _encode_time_cursor,
+    _orders_by_product_stmt,
+    _orders_by_status_stmt,
+    _orders_page_stmt,
+    _summary_query_stmt
+)
+from models import Orders, OrderItems
+
+# Tables that must never be read with a Seq Scan by the checked queries
+LARGE_TABLES = ("orders", "order_items")
+
+# Seeded data shape: orders per user, items per order, number of products
+SEED_ORDERS_PER_USER = 20
+SEED_ITEMS_PER_ORDER = 3
+SEED_PRODUCTS = 1000
+
+
+# ============================================================================
+# Seeding
+# ============================================================================
+
+def seed(min_orders: int):
+    """Add generated rows (all in SQL, no round trip per row) until there are min_orders orders."""
+    with session_scope() as db:
+        order_count = db.scalar(select(func.count(Orders.id)))
+        missing = min_orders - order_count
+        if missing <= 0:
+            print(f"Seed: {order_count} orders already, nothing to add")
+            return
+
+        print(f"Seed: adding {missing} orders ({missing * SEED_ITEMS_PER_ORDER} items)...")
+        start = time.perf_counter()
+        params = {
+            "orders": missing,
+            "users": max(1, missing // SEED_ORDERS_PER_USER),
+            "products": SEED_PRODUCTS,
+            "items": SEED_ITEMS_PER_ORDER
+        }
+        first_order_id = db.scalar(select(func.coalesce(func.max(Orders.id), 0))) + 1
+
+        db.execute(text("""
+            INSERT INTO tony.products (name, price_cents)
+            SELECT 'Explain product ' || g, 100 + (g * 7919) % 100000
+            FROM generate_series(1, :products) g
+        """), params)
+        db.execute(text("""
+            INSERT INTO tony.users (email, full_name)
+            SELECT 'explain.' || b.base || '.' || g || '@example.com', 'Explain User ' || g
+            FROM generate_series(1, :users) g,
+                 (SELECT COALESCE(MAX(id), 0) AS base FROM tony.users) b
+        """), params)
+        # Most orders are history (shipped/cancelled), a few are still open (pending/paid),
+        # spread over two years - like a real shop after a while
+        db.execute(text("""
+            WITH u AS (SELECT array_agg(id) AS ids FROM tony.users)
+            INSERT INTO tony.orders (user_id, status, created_at)
+            SELECT u.ids[1 + floor(random() * array_length(u.ids, 1))::int],
+                   CASE WHEN r < 0.03 THEN 'pending' WHEN r < 0.08 THEN 'paid'
+                        WHEN r < 0.95 THEN 'shipped' ELSE 'cancelled' END,
+                   now() - random() * interval '730 days'
+            FROM u, (SELECT random() AS r FROM generate_series(1, :orders)) g
+        """), params)
+        db.execute(text("""
+            WITH p AS (SELECT array_agg(id) AS ids, array_agg(price_cents) AS prices FROM tony.products)
+            INSERT INTO tony.order_items (order_id, product_id, quantity, price_cents_at_purchase)
+            SELECT o.id, p.ids[x.k], x.q, p.prices[x.k] * x.q
+            FROM tony.orders o
+            CROSS JOIN generate_series(1, :items) i
+            CROSS JOIN p
+            CROSS JOIN LATERAL (
+                SELECT 1 + floor(random() * array_length(p.ids, 1))::int + i * 0 AS k,
+                       1 + floor(random() * 3)::int AS q
+            ) x
+            WHERE o.id >= :first_order_id
+        """), {**params, "first_order_id": first_order_id})
+        db.execute(text("""
+            UPDATE tony.orders o
+            SET total_amount_cents = t.amount, total_quantity = t.quantity
+            FROM (
+                SELECT order_id, SUM(price_cents_at_purchase) AS amount, SUM(quantity) AS quantity
+                FROM tony.order_items WHERE order_id >= :first_order_id GROUP BY order_id
+            ) t
+            WHERE o.id = t.order_id
+        """), {"first_order_id": first_order_id})
+        # New users and products: change the ETags of GET /users and GET /products
+        bump_table_version("users", db=db)
+        bump_table_version("products", db=db)
+    print(f"Seed: done in {time.perf_counter() - start:.1f}s")
+
+
+def analyze():
+    """Refresh the planner statistics (a freshly seeded table would otherwise look empty)."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table_name in ("users", "products", "orders", "order_items"):
+            conn.execute(text(f"ANALYZE tony.{table_name}"))
+
+
+# ============================================================================
+# Checked queries
+# ============================================================================
+
+def sample_ids(db) -> dict:
+    """Pick real IDs to plug into the queries: a busy user, a popular product, one page of orders."""
+    user_id = db.scalar(select(Orders.user_id).order_by(Orders.id.desc()).limit(1))
+    product_id = db.scalar(select(OrderItems.product_id).order_by(OrderItems.id.desc()).limit(1))
+    order_ids = db.scalars(
+        select(Orders.id).where(Orders.user_id == user_id).order_by(Orders.id).limit(DEFAULT_PAGE_SIZE)
+    ).all()
+    user_ids = db.scalars(select(Orders.user_id).order_by(Orders.id.desc()).limit(50)).all()
+    # Cursor pointing one year back (list_orders_by_status cursors are "<microseconds>:<id>")
+    time_cursor = _encode_time_cursor(datetime.now(timezone.utc) - timedelta(days=365), 0)
+    return {"user_id": user_id, "product_id": product_id, "order_ids": order_ids, "user_ids": user_ids,
+            "time_cursor": time_cursor}
+
+
+# Name -> function building the statement from sample_ids()
+# Add every new query on orders/order_items here
+CHECKS = {
+    # list_orders(): one page of a user's orders, then their items
+    "list_orders page": lambda ids: _orders_page_stmt(ids["user_id"], None, DEFAULT_PAGE_SIZE),
+    "list_orders items": lambda ids: _order_items_stmt(ids["order_ids"]),
+    # user_order_summary() with ORDER_SUMMARY_SOURCE=query
+    "user_order_summary": lambda ids: _summary_query_stmt(ids["user_ids"]),
+    # A user's orders of the last 30 days, newest first (order history by date)
+    "user orders by date": lambda ids: (
+        select(Orders.id, Orders.status, Orders.created_at)
+        .where(Orders.user_id == ids["user_id"], Orders.created_at >= func.now() - text("interval '30 days'"))
+        .order_by(Orders.created_at.desc())
+        .limit(DEFAULT_PAGE_SIZE)
+    ),
+    # list_orders_by_product(): orders containing a product (reverse lookup), first and later pages
+    "list_orders_by_product": lambda ids: _orders_by_product_stmt(ids["product_id"], None, DEFAULT_PAGE_SIZE),
+    "list_orders_by_product next": lambda ids: _orders_by_product_stmt(
+        ids["product_id"], ids["order_ids"][0], DEFAULT_PAGE_SIZE
+    ),
+    # What PostgreSQL runs for the order_items_product_id_fkey check when a product is deleted
+    "product delete FK check": lambda ids: (
+        select(literal(1)).select_from(OrderItems).where(OrderItems.product_id == ids["product_id"])
+    ),
+    # list_orders_by_status(): fulfillment backlog, paid orders older than 30 minutes
+    # (first page), and all open orders from a cursor onwards
+    "list_orders_by_status paid": lambda ids: _orders_by_status_stmt(
+        ("paid",), None, datetime.now(timezone.utc) - timedelta(minutes=30), None, DEFAULT_PAGE_SIZE
+    ),
+    "list_orders_by_status next": lambda ids: _orders_by_status_stmt(
+        ("pending", "paid"), None, None, _decode_time_cursor(ids["time_cursor"]), DEFAULT_PAGE_SIZE
+    ),
+}
+
+
+def plan_nodes(node: dict):
+    """Yield a plan node and all nodes below it."""
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(db, stmt) -> dict:
+    """EXPLAIN a statement (with its parameters inlined) and return the top plan node."""
+    sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+    return db.execute(text("EXPLAIN (FORMAT JSON) " + sql)).scalar()[0]["Plan"]
+
+
+def run_checks(verbose: bool) -> bool:
+    """EXPLAIN every query in CHECKS; print a line per query. Returns True if all use indexes."""
+    all_ok = True
+    with session_scope() as db:
+        ids = sample_ids(db)
+        if ids["user_id"] is None or ids["product_id"] is None:
+            sys.exit("No orders in the database - run without --no-seed first")
+
+        for name, build in CHECKS.items():
+            plan = explain(db, build(ids))
+            nodes = list(plan_nodes(plan))
+            seq_scans = [
+                node["Relation Name"] for node in nodes
+                if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES
+            ]
+            indexes = sorted({node["Index Name"] for node in nodes if "Index Name" in node})
+            ok = not seq_scans
+            all_ok = all_ok and ok
+            detail = f"Seq Scan on {', '.join(seq_scans)}" if seq_scans else f"indexes: {', '.join(indexes) or '-'}"
+            print(f"{'OK  ' if ok else 'FAIL'} {name:<28} cost {plan['Total Cost']:>10.1f}  {detail}")
+            if verbose or not ok:
+                print(json.dumps(plan, indent=2))
+    return all_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if the main queries plan a Seq Scan on orders/order_items")
+    parser.add_argument("--min-orders", type=int, default=200000,
+                        help="Seed generated data until there are at least this many orders")
+    parser.add_argument("--no-seed", action="store_true", help="Check the database as it is")
+    parser.add_argument("--verbose", action="store_true", help="Print every plan, not only failing ones")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        seed(args.min_orders)
+    analyze()
+
+    if not run_checks(args.verbose):
+        print("\nSome queries fall back to sequential scans - check the indexes in models.py")
+        sys.exit(1)
+    print("\nAll queries use indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Dataset generator: seed millions of users, products, orders and items with COPY
+
+Fills the tables of models.py with a realistic, repeatable dataset for
+reproducing scaling problems and for benchmarks:
+- users: --users, created at random moments of the --days before --until
+- products: --products, random prices; some are far more popular than others
+  (--product-skew)
+- orders: a skewed number per user - most users have a few orders, a few users
+  have hundreds (Pareto distribution with mean --orders-per-user, shape
+  --order-skew: lower = more skewed). Recent orders are mostly pending/paid,
+  older ones shipped or cancelled, like a real shop's history
+- order_items: 1 to 2 * --items-per-order - 1 items per order (mean
+  --items-per-order), priced like create_order() does (price * quantity);
+  the orders' total_amount_cents / total_quantity match their items
+
+How it loads:
+- Rows are streamed with PostgreSQL COPY (one statement per table and chunk,
+  no per-row INSERT parsing or round trips)
+- Users are split into chunks of CHUNK_USERS; a pool of --workers processes
+  loads chunks in parallel, each chunk in one transaction over its own
+  connection (users, then their orders, then the orders' items)
+- IDs are assigned here, not by the sequences: a first pass counts the orders
+  and items of every chunk, so each chunk knows its ID ranges up front and
+  order_items can reference orders without reading anything back. The
+  sequences are moved past the new IDs at the end
+- --drop-indexes drops the secondary indexes of the four tables first and
+  builds them once at the end (much faster than updating them row by row)
+
+Deterministic: every chunk draws from its own random generator seeded with
+(--seed, chunk number), so the same arguments give exactly the same rows -
+whatever --workers is. Timestamps are relative to --until, not to now.
+
+Usage:
+    python generate_dataset.py --users 10000 --truncate
+    # about 10M order_items: 1M users * 3.3 orders * 3 items
+    python generate_dataset.py --users 1000000 --products 50000 --orders-per-user 3.3 \\
+        --items-per-order 3 --workers 8 --truncate --drop-indexes
+
+Note: writes into the database configured in .env; --truncate first deletes
+ALL users, products, orders, order_items and stored idempotency keys - point
+DATABASE_URL at a development database. Run "python maintenance.py
+refresh-order-summary" afterwards if ORDER_SUMMARY_SOURCE=view.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, text
+from sqlalchemy.schema import CreateIndex
+
+from database import engine, session_scope
+from db_operations import bump_table_version
+from models import IdempotencyKeys, OrderItems, Orders, Products, Users
+
+# Users per chunk (one transaction and one unit of parallel work); part of the
+# random seeds, so changing it changes the generated data
+CHUNK_USERS = 5000
+
+# Loaded tables, in foreign key order, and the columns written by COPY
+TABLES = (Users, Products, Orders, OrderItems)
+USER_COLUMNS = ("id", "email", "full_name", "created_at")
+PRODUCT_COLUMNS = ("id", "name", "price_cents")
+ORDER_COLUMNS = ("id", "user_id", "status", "created_at", "updated_at", "total_amount_cents", "total_quantity")
+ORDER_ITEM_COLUMNS = ("id", "order_id", "product_id", "quantity", "price_cents_at_purchase")
+
+# Orders younger than this are still being processed (mostly pending/paid)
+OPEN_ORDER_AGE = timedelta(days=3)
+
+# Status of an order: (cumulative probability, status) for recent and for older orders
+RECENT_STATUSES = ((0.40, "pending"), (0.80, "paid"), (0.95, "shipped"), (1.0, "cancelled"))
+HISTORY_STATUSES = ((0.005, "pending"), (0.01, "paid"), (0.95, "shipped"), (1.0, "cancelled"))
+
+# Quantity of an order item: (cumulative probability, quantity)
+QUANTITIES = ((0.80, 1), (0.95, 2), (1.0, 3))
+
+
+# ============================================================================
+# Random data (pure functions of the settings and the chunk number)
+# ============================================================================
+
+def pick(rng: random.Random, table: tuple):
+    """Pick a value from a ((cumulative probability, value), ...) table."""
+    r = rng.random()
+    for probability, value in table:
+        if r < probability:
+            return value
+    return table[-1][1]
+
+
+def chunk_counts(settings: dict, chunk: int) -> list:
+    """
+    Number of items of every order of every user in a chunk.
+
+    Returns:
+        One list per user of the chunk, with the item count of each of the user's orders
+    """
+    rng = random.Random(f"{settings['seed']}:counts:{chunk}")
+    first_user = chunk * CHUNK_USERS
+    users = min(CHUNK_USERS, settings["users"] - first_user)
+    shape = settings["order_skew"]
+    # Pareto variates have mean shape / (shape - 1); scale them to the wanted mean
+    scale = settings["orders_per_user"] * (shape - 1) / shape
+    max_items = 2 * settings["items_per_order"] - 1
+
+    counts = []
+    for _ in range(users):
+        expected = scale * rng.paretovariate(shape)
+        # Round up with probability equal to the fraction, so the mean stays exact
+        orders = int(expected) + (rng.random() < expected - int(expected))
+        orders = min(orders, settings["max_orders_per_user"])
+        counts.append([rng.randint(1, max_items) for _ in range(orders)])
+    return counts
+
+
+def plan_chunk(chunk: int) -> tuple:
+    """First pass: (orders, items) of a chunk."""
+    counts = chunk_counts(_settings, chunk)
+    return sum(len(orders) for orders in counts), sum(sum(orders) for orders in counts)
+
+
+def product_prices(settings: dict) -> list:
+    """Price in cents of every generated product (index 0 = the first new product)."""
+    rng = random.Random(f"{settings['seed']}:products")
+    # Mostly cheap products, some expensive ones: $1 to about $2000
+    return [int(100 * rng.lognormvariate(3, 1.2)) % 200000 + 100 for _ in range(settings["products"])]
+
+
+def csv_rows(rows) -> io.StringIO:
+    """Turn rows (tuples) into a CSV buffer for COPY; None becomes an empty field (NULL)."""
+    buffer = io.StringIO()
+    buffer.writelines(
+        ",".join("" if value is None else str(value) for value in row) + "\n"
+        for row in rows
+    )
+    buffer.seek(0)
+    return buffer
+
+
+# ============================================================================
+# Loading
+# ============================================================================
+
+def copy_rows(cursor, model, columns: tuple, rows):
+    """COPY rows into a model's table (psycopg2 cursor)."""
+    cursor.copy_expert(
+        f"COPY {model.__table__.fullname} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        csv_rows(rows)
+    )
+
+
+def init_worker(settings: dict):
+    """Pool initializer: fresh connections (never share the parent's) and the product prices."""
+    global _settings, _prices
+    engine.dispose(close=False)
+    _settings = settings
+    _prices = product_prices(settings)
+
+
+def load_chunk(args: tuple) -> int:
+    """
+    Second pass: generate a chunk's users, orders and items and COPY them in one transaction.
+
+    Args:
+        args: (chunk number, ID of its first order, ID of its first item)
+
+    Returns:
+        Number of order items loaded
+    """
+    chunk, order_id, item_id = args
+    settings, prices = _settings, _prices
+    rng = random.Random(f"{settings['seed']}:values:{chunk}")
+    until = settings["until"]
+    window = settings["days"] * 86400
+    product_skew = settings["product_skew"]
+    first_product_id = settings["first_product_id"]
+
+    users, orders, items = [], [], []
+    for n, order_counts in enumerate(chunk_counts(settings, chunk)):
+        user_id = settings["first_user_id"] + chunk * CHUNK_USERS + n
+        user_created = until - timedelta(seconds=rng.random() * window)
+        users.append((user_id, f"gen.user.{user_id}@example.com", f"Generated User {user_id}",
+                      user_created.isoformat()))
+
+        for item_count in order_counts:
+            created_at = user_created + (until - user_created) * rng.random()
+            status = pick(rng, RECENT_STATUSES if until - created_at < OPEN_ORDER_AGE else HISTORY_STATUSES)
+            updated_at = None if status == "pending" else created_at + timedelta(hours=rng.random() * 48)
+            amount = quantity_total = 0
+            for _ in range(item_count):
+                # random() ** skew favours the first products: a few best sellers, a long tail
+                product = int(len(prices) * rng.random() ** product_skew)
+                quantity = pick(rng, QUANTITIES)
+                price = prices[product] * quantity
+                items.append((item_id, order_id, first_product_id + product, quantity, price))
+                item_id += 1
+                amount += price
+                quantity_total += quantity
+            orders.append((order_id, user_id, status, created_at.isoformat(),
+                           updated_at.isoformat() if updated_at else None, amount, quantity_total))
+            order_id += 1
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # Losing the last chunks in a server crash is fine for generated data
+        cursor.execute("SET LOCAL synchronous_commit TO off")
+        copy_rows(cursor, Users, USER_COLUMNS, users)
+        copy_rows(cursor, Orders, ORDER_COLUMNS, orders)
+        copy_rows(cursor, OrderItems, ORDER_ITEM_COLUMNS, items)
+        connection.commit()
+    finally:
+        connection.close()
+    return len(items)
+
+
+def load_products(settings: dict):
+    """COPY the products (one stream; there are far fewer products than items)."""
+    prices = product_prices(settings)
+    first_id = settings["first_product_id"]
+    connection = engine.raw_connection()
+    try:
+        copy_rows(connection.cursor(), Products, PRODUCT_COLUMNS, (
+            (first_id + n, f"Generated Product {first_id + n}", price) for n, price in enumerate(prices)
+        ))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def secondary_indexes() -> list:
+    """The indexes declared in models.py on the loaded tables (constraints are kept)."""
+    return [index for model in TABLES for index in sorted(model.__table__.indexes, key=lambda index: index.name)]
+
+
+def drop_indexes():
+    with engine.begin() as conn:
+        for index in secondary_indexes():
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.table.schema}.{index.name}"))
+
+
+def create_indexes():
+    """Build the indexes dropped by drop_indexes() (plain CREATE INDEX: nothing else is running)."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for index in secondary_indexes():
+            print(f"  {index.name}")
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def first_ids(truncate: bool) -> dict:
+    """Empty the tables (truncate) or find the first free ID of every table (append)."""
+    with session_scope() as db:
+        if truncate:
+            # Stored Idempotency-Key responses go too: they name order IDs that,
+            # after RESTART IDENTITY, belong to different generated orders
+            db.execute(text(
+                "TRUNCATE " + ", ".join(model.__table__.fullname for model in TABLES + (IdempotencyKeys,))
+                + " RESTART IDENTITY"
+            ))
+            return {model: 1 for model in TABLES}
+        return {model: db.scalar(select(func.coalesce(func.max(model.id), 0))) + 1 for model in TABLES}
+
+
+def finish():
+    """Move the ID sequences past the loaded rows, bump the ETag counters, refresh statistics."""
+    with session_scope() as db:
+        for model in TABLES:
+            table_name = model.__table__.fullname
+            db.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table_name}), false)"
+            ))
+        # GET /users and GET /products must not answer 304 for the old lists
+        bump_table_version("users", db=db)
+        bump_table_version("products", db=db)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for model in TABLES:
+            conn.execute(text(f"ANALYZE {model.__table__.fullname}"))
+
+
+# ============================================================================
+# MAIN ENTRY POINT
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a large, repeatable dataset with parallel COPY")
+    parser.add_argument("--users", type=int, default=10000, help="Users to create")
+    parser.add_argument("--products", type=int, default=1000, help="Products to create")
+    parser.add_argument("--orders-per-user", type=float, default=5, help="Mean number of orders per user")
+    parser.add_argument("--order-skew", type=float, default=1.5,
+                        help="Pareto shape of the orders per user (> 1; lower = a few users with many more orders)")
+    parser.add_argument("--max-orders-per-user", type=int, default=10000, help="Cap for the busiest users")
+    parser.add_argument("--items-per-order", type=int, default=3, help="Mean number of items per order")
+    parser.add_argument("--product-skew", type=float, default=2.0,
+                        help="Product popularity skew (1 = uniform; higher = more sales for the first products)")
+    parser.add_argument("--days", type=int, default=730, help="Time span of the generated history")
+    parser.add_argument("--until", type=datetime.fromisoformat, default=datetime(2025, 1, 1),
+                        help="End of the generated history (ISO date, UTC)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (same seed = same data)")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1),
+                        help="Parallel COPY streams (processes)")
+    parser.add_argument("--truncate", action="store_true",
+                        help="Delete ALL users, products, orders, items and idempotency keys first")
+    parser.add_argument("--drop-indexes", action="store_true",
+                        help="Drop secondary indexes during the load, rebuild them at the end")
+    args = parser.parse_args()
+    if args.order_skew <= 1:
+        parser.error("--order-skew must be greater than 1")
+    if args.items_per_order < 1 or args.products < 1:
+        parser.error("--items-per-order and --products must be at least 1")
+
+    start = time.perf_counter()
+    ids = first_ids(args.truncate)
+    settings = {
+        "seed": args.seed, "users": args.users, "products": args.products,
+        "orders_per_user": args.orders_per_user, "order_skew": args.order_skew,
+        "max_orders_per_user": args.max_orders_per_user, "items_per_order": args.items_per_order,
+        "product_skew": args.product_skew, "days": args.days,
+        "until": args.until.replace(tzinfo=args.until.tzinfo or timezone.utc),
+        "first_user_id": ids[Users], "first_product_id": ids[Products]
+    }
+    chunks = range((args.users + CHUNK_USERS - 1) // CHUNK_USERS)
+
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(settings,)) as pool:
+        # Pass 1: how many orders and items each chunk gets -> the chunk's first IDs
+        plan = pool.map(plan_chunk, chunks)
+        total_orders = sum(orders for orders, _ in plan)
+        total_items = sum(items for _, items in plan)
+        print(f"Plan: {args.users} users, {args.products} products, {total_orders} orders, "
+              f"{total_items} order items in {len(chunks)} chunks ({time.perf_counter() - start:.1f}s)")
+
+        if args.drop_indexes:
+            print("Dropping secondary indexes...")
+            drop_indexes()
+        load_products(settings)
+
+        # Pass 2: generate and COPY the chunks in parallel
+        tasks = []
+        order_id, item_id = ids[Orders], ids[OrderItems]
+        for chunk, (orders, items) in zip(chunks, plan):
+            tasks.append((chunk, order_id, item_id))
+            order_id += orders
+            item_id += items
+        load_start = time.perf_counter()
+        loaded = 0
+        for items in pool.imap_unordered(load_chunk, tasks):
+            loaded += items
+            elapsed = time.perf_counter() - load_start
+            print(f"\r  {loaded}/{total_items} order items ({loaded / elapsed:,.0f}/s)", end="", flush=True)
+        print()
+
+    if args.drop_indexes:
+        print("Building indexes...")
+        create_indexes()
+    finish()
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
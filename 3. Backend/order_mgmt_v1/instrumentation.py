@@ -0,0 +1,270 @@
+"""
+Request Instrumentation (opt-in)
+
+Answers "where did this slow request spend its time?" for the Flask apps
+(order_api.py, order_ui.py) without a profiler:
+
+- SQL: every statement sent through database.engine is timed (by the
+  cursor event listeners shared with metrics.py, see
+  database.on_statement_timed), together with the number of rows it
+  returned or changed
+- JSON: time spent in jsonify() (the app's JSON provider)
+- Templates: time spent rendering Jinja2 templates (order_ui.py)
+- Python: the rest of the request - ORM hydration, the dict-building loops
+  in db_operations, view code (total minus the above)
+
+Every response gets an X-Query-Count header (number of SQL statements the
+request ran) and a Server-Timing header (shown by browser dev tools):
+    X-Query-Count: 2
+    Server-Timing: sql;dur=3.1, json;dur=0.4, python;dur=1.2, total;dur=4.7
+A page whose X-Query-Count grows with the number of rows shown has an N+1
+query problem.
+
+Requests slower than SLOW_REQUEST_MS and statements slower than
+SLOW_QUERY_MS are logged as one JSON line each (logger "instrumentation",
+level WARNING, so they show up on stderr without any logging setup):
+    {"event": "slow_request", "method": "GET", "path": "/orders", "status": 200,
+     "total_ms": 812.4, "sql_ms": 790.2, "sql_count": 2, "sql_rows": 120, ...,
+     "top_statements": [{"fingerprint": "3f9c0a1b", "count": 1, "ms": 780.1,
+                         "sql": "SELECT ... WHERE orders.user_id = ? ..."}]}
+Statements are grouped by fingerprint: the SQL with every parameter and
+literal replaced by "?", so "the same query with other values" adds up to
+one entry (a high count is an N+1 loop).
+
+Configuration (environment variables, see .env.example):
+- INSTRUMENTATION: off (default) | on
+- SLOW_REQUEST_MS: log requests slower than this (default 500)
+- SLOW_QUERY_MS: log statements slower than this (default 100)
+
+When off, nothing is registered and requests pay nothing. When on, each
+statement costs two perf_counter() calls and a fingerprint (cached per SQL
+string).
+
+Usage (before database.init_app, so the commit at the end of the request
+is part of the measured time):
+    import instrumentation
+    instrumentation.init_app(app)
+
+Note: for streamed responses (the /export/*.ndjson endpoints) only the work
+done before the first byte is measured.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from functools import lru_cache
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+from database import on_statement_timed
+
+INSTRUMENTATION_MODES = ("off", "on")
+INSTRUMENTATION = os.getenv('INSTRUMENTATION', 'off')
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '500'))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+
+if INSTRUMENTATION not in INSTRUMENTATION_MODES:
+    raise ValueError(f"INSTRUMENTATION must be one of {INSTRUMENTATION_MODES}, got {INSTRUMENTATION!r}")
+
+# Statements listed in a slow_request line (the slowest fingerprints)
+SLOW_REQUEST_TOP_STATEMENTS = 5
+
+# Longest SQL text written to the log (the fingerprint hash identifies the full statement)
+LOGGED_SQL_LENGTH = 300
+
+logger = logging.getLogger("instrumentation")
+
+
+# ============================================================================
+# Statement fingerprints
+# ============================================================================
+
+# Applied in order; each pattern is replaced by the text next to it
+_FINGERPRINT_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),  # string literals
+    (re.compile(r"%\(\w+\)s|%s|\$\d+"), "?"),  # bound parameters (psycopg2 / asyncpg style)
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),  # numbers (e.g. literal LIMIT values)
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),  # IN (?, ?, ?) of any length
+    (re.compile(r"\s+"), " "),  # whitespace and newlines
+)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> tuple:
+    """
+    Normalize a SQL statement so that the same query with other values looks the same.
+
+    Returns:
+        Tuple of (short hash of the normalized SQL, normalized SQL)
+    """
+    normalized = statement
+    for pattern, replacement in _FINGERPRINT_PATTERNS:
+        normalized = pattern.sub(replacement, normalized)
+    normalized = normalized.strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:8], normalized
+
+
+# ============================================================================
+# Per-request counters
+# ============================================================================
+
+class RequestStats:
+    """Timings collected during one request (stored in flask.g)."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.sql_rows = 0
+        self.json_ms = 0.0
+        self.render_ms = 0.0
+        self.render_started = None
+        # fingerprint hash -> {"fingerprint", "count", "ms", "sql"}
+        self.statements = {}
+
+    def record_statement(self, statement: str, elapsed_ms: float, rows: int):
+        fingerprint_hash, normalized = fingerprint(statement)
+        self.sql_count += 1
+        self.sql_ms += elapsed_ms
+        self.sql_rows += max(rows, 0)  # -1 = unknown (e.g. server-side cursors)
+        entry = self.statements.setdefault(
+            fingerprint_hash, {"fingerprint": fingerprint_hash, "count": 0, "ms": 0.0, "sql": normalized}
+        )
+        entry["count"] += 1
+        entry["ms"] += elapsed_ms
+
+    def summary(self, total_ms: float) -> dict:
+        """Breakdown of the request time (everything not SQL/JSON/templates counts as python)."""
+        return {
+            "total_ms": round(total_ms, 2),
+            "sql_ms": round(self.sql_ms, 2),
+            "sql_count": self.sql_count,
+            "sql_rows": self.sql_rows,
+            "json_ms": round(self.json_ms, 2),
+            "render_ms": round(self.render_ms, 2),
+            "python_ms": round(max(total_ms - self.sql_ms - self.json_ms - self.render_ms, 0.0), 2)
+        }
+
+    def top_statements(self) -> list:
+        """The slowest statement fingerprints of the request, with their counts."""
+        entries = sorted(self.statements.values(), key=lambda entry: entry["ms"], reverse=True)
+        return [
+            {**entry, "ms": round(entry["ms"], 2), "sql": entry["sql"][:LOGGED_SQL_LENGTH]}
+            for entry in entries[:SLOW_REQUEST_TOP_STATEMENTS]
+        ]
+
+
+def _current_stats():
+    """The RequestStats of the current request, or None outside an instrumented request."""
+    return g.get("instrumentation") if has_request_context() else None
+
+
+def _log(event_name: str, **fields):
+    logger.warning(json.dumps({"event": event_name, **fields}, default=str))
+
+
+# ============================================================================
+# SQL statements (timed by database.on_statement_timed)
+# ============================================================================
+
+def _record_statement(statement: str, cursor, elapsed: float):
+    """Add a statement to the request stats, and log it if it was slow (see database.on_statement_timed)."""
+    elapsed_ms = elapsed * 1000
+    rows = cursor.rowcount
+    stats = _current_stats()
+    if stats is not None:
+        stats.record_statement(statement, elapsed_ms, rows)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        fingerprint_hash, normalized = fingerprint(statement)
+        _log("slow_query", ms=round(elapsed_ms, 2), rows=rows, fingerprint=fingerprint_hash,
+             sql=normalized[:LOGGED_SQL_LENGTH],
+             path=request.path if has_request_context() else None)
+
+
+# ============================================================================
+# Flask integration
+# ============================================================================
+
+class _TimedJSONProvider:
+    """Wraps the app's JSON provider and adds the time spent in jsonify() to the request stats."""
+
+    def __init__(self, provider):
+        self._provider = provider
+
+    def __getattr__(self, name):
+        return getattr(self._provider, name)
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._provider.dumps(obj, **kwargs)
+        finally:
+            self._add_json_time(start)
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._provider.response(*args, **kwargs)
+        finally:
+            self._add_json_time(start)
+
+    @staticmethod
+    def _add_json_time(start: float):
+        stats = _current_stats()
+        if stats is not None:
+            stats.json_ms += (time.perf_counter() - start) * 1000
+
+
+def init_app(app, enabled: bool = None):
+    """
+    Instrument a Flask app (does nothing unless INSTRUMENTATION=on or enabled=True).
+
+    Call it before database.init_app(app): Flask runs after_request hooks in
+    reverse order, so the request's COMMIT is then included in the timing.
+
+    Args:
+        app: The Flask app
+        enabled: Override INSTRUMENTATION (None = use the environment variable)
+    """
+    if enabled is None:
+        enabled = INSTRUMENTATION == "on"
+    if not enabled:
+        return
+
+    on_statement_timed(_record_statement)
+    app.json = _TimedJSONProvider(app.json)
+
+    @app.before_request
+    def start_request_stats():
+        g.instrumentation = RequestStats()
+
+    @before_render_template.connect_via(app)
+    def start_render_timer(sender, template, context, **extra):
+        stats = _current_stats()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def stop_render_timer(sender, template, context, **extra):
+        stats = _current_stats()
+        if stats is not None and stats.render_started is not None:
+            stats.render_ms += (time.perf_counter() - stats.render_started) * 1000
+
+    @app.after_request
+    def report_request_stats(response):
+        stats = g.pop("instrumentation", None)
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - stats.start) * 1000
+        summary = stats.summary(total_ms)
+
+        response.headers["X-Query-Count"] = str(stats.sql_count)
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={summary[name + '_ms']}" for name in ("sql", "json", "render", "python", "total")
+        )
+        if total_ms >= SLOW_REQUEST_MS:
+            _log("slow_request", method=request.method, path=request.full_path.rstrip("?"),
+                 status=response.status_code, **summary, top_statements=stats.top_statements())
+        return response
@@ -0,0 +1,497 @@
+"""
+Load Test: replay a mix of the Postman collection's requests against the API
+
+The requests are read from Order_Mgmt_v1_API.postman_collection.json (method,
+path, query string, headers and JSON body), so the load test sends what the
+collection documents. Before each request the IDs and other values that would
+collide or always hit the same row are replaced (the choice of endpoints and
+IDs follows --seed, so runs send the same sequence):
+- user_id / product_id (query string or body): a random existing ID, taken
+  from GET /users and GET /products when the test starts
+- q (Search Users): two random letters
+- email (Create User): a unique address
+- {{$guid}} (Idempotency-Key): a new UUID
+
+Endpoints (names for --mix):
+- users, search_users, products                         catalog reads
+- orders, orders_by_product, orders_by_status           order reads
+- create_user, create_product, create_order             writes
+(The bulk, transition and export requests are left out: they need order IDs
+and timestamps from earlier responses, or read the whole table per request.)
+
+Load models:
+- closed (--concurrency N, the default): N clients each send a request, wait
+  for the response, and send the next one. Throughput is whatever the server
+  sustains; latency is the service time of each request.
+- open (--rate R): requests are sent on a fixed schedule, R per second, over
+  up to --concurrency keep-alive connections, whether or not earlier ones have
+  been answered - like real users, who do not wait for each other.
+
+Coordinated omission: in the closed model a slow response also delays the
+requests the client would have sent meanwhile, so the stall is recorded once
+instead of once per waiting user, and the percentiles look better than what
+users see. In the open model latency is measured from the time the request
+was *scheduled* to be sent (not from when a connection was free to send it),
+which corrects for that; the table also shows the uncorrected p99 ("svc p99",
+send to response) for comparison. Requests still unanswered --timeout seconds
+after their scheduled time count as errors.
+
+Errors are connection failures, timeouts and responses with a status of 400
+or more. Error responses are included in the latency percentiles (a fast 500
+is still a response the user waited for); failures without a response are
+only counted.
+
+Usage:
+    python loadtest.py                                          # closed model, 50 clients, sync server
+    python loadtest.py --rate 200 --duration 30                 # open model, 200 req/s
+    python loadtest.py --mix "orders=70,create_order=20,products=10" --rate 100
+    python loadtest.py --server async --workers 1 --rate 300
+    python loadtest.py --url http://localhost:8021 --rate 50    # an app that is already running
+    python loadtest.py --rate 200 --output loadtest.json
+
+Note: starting the server needs gunicorn or hypercorn (see requirements.txt)
+and the .env of the app (DATABASE_URL). The writes really create users,
+products and orders - point DATABASE_URL at a development database. The load
+generator runs on the same machine as the server and shares its CPUs; if the
+report shows a large "client lag", the generator could not keep up with
+--rate and the numbers measure it as much as the API.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+import uuid
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+from bench_async_api import HOST, start_server, stop_server
+from bench_common import summarize
+
+COLLECTION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Order_Mgmt_v1_API.postman_collection.json")
+
+# --mix name -> Postman request name
+ENDPOINTS = {
+    "users": "List All Users",
+    "search_users": "Search Users",
+    "products": "List All Products",
+    "orders": "List Orders for User",
+    "orders_by_product": "List Orders by Product",
+    "orders_by_status": "List Orders by Status (Backlog)",
+    "create_user": "Create User",
+    "create_product": "Create Product",
+    "create_order": "Create Order",
+}
+
+DEFAULT_MIX = "orders=70,create_order=20,products=10"
+
+
+# ============================================================================
+# Requests (from the Postman collection)
+# ============================================================================
+
+def load_collection(path: str = COLLECTION) -> dict:
+    """
+    Read the Postman requests used by ENDPOINTS.
+
+    Returns:
+        Dictionary of --mix name -> {"method", "path", "query", "headers", "body"}
+    """
+    with open(path) as f:
+        collection = json.load(f)
+
+    by_name = {}
+    folders = [collection["item"]]
+    while folders:
+        for item in folders.pop():
+            if "item" in item:
+                folders.append(item["item"])  # a folder
+            else:
+                by_name[item["name"]] = item["request"]
+
+    templates = {}
+    for name, postman_name in ENDPOINTS.items():
+        request = by_name[postman_name]
+        url = request["url"]
+        body = request.get("body", {}).get("raw")
+        templates[name] = {
+            "method": request["method"],
+            "path": "/" + "/".join(url["path"]),
+            "query": [(param["key"], param["value"]) for param in url.get("query", [])
+                      if not param.get("disabled")],
+            "headers": {header["key"]: header["value"] for header in request.get("header", [])
+                        if not header.get("disabled")},
+            "body": json.loads(body) if body else None
+        }
+    return templates
+
+
+def parse_mix(mix: str) -> dict:
+    """Parse "orders=70,create_order=20,products=10" into {name: weight}."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r} in --mix (choose from: {', '.join(ENDPOINTS)})")
+        weights[name] = float(weight)
+    if sum(weights.values()) <= 0:
+        raise ValueError("--mix weights must add up to more than 0")
+    return weights
+
+
+def fill(key: str, value, rng: random.Random, ids: dict):
+    """The value to send for one query parameter or body field."""
+    if key == "user_id":
+        return rng.choice(ids["users"])
+    if key == "product_id":
+        return rng.choice(ids["products"])
+    if key == "q":
+        return rng.choice("abcdefghijklmnopqrstuvwxyz") + rng.choice("aeiou")
+    if key == "email":
+        return f"loadtest-{uuid.uuid4()}@example.com"  # unique across runs, not only within one
+    if isinstance(value, dict):
+        return {k: fill(k, v, rng, ids) for k, v in value.items()}
+    if isinstance(value, list):
+        return [fill(key, v, rng, ids) for v in value]
+    return value
+
+
+def render(template: dict, rng: random.Random, ids: dict) -> tuple:
+    """
+    Turn a request template into one concrete request.
+
+    Returns:
+        (method, target, headers, body bytes or None)
+    """
+    query = [(key, fill(key, value, rng, ids)) for key, value in template["query"]]
+    target = template["path"] + ("?" + urlencode(query) if query else "")
+    headers = {
+        key: str(uuid.uuid4()) if value == "{{$guid}}" else value
+        for key, value in template["headers"].items()
+    }
+    body = None
+    if template["body"] is not None:
+        body = json.dumps(fill("", template["body"], rng, ids)).encode()
+    return template["method"], target, headers, body
+
+
+def fetch_ids(base_url: str, sample: int) -> dict:
+    """Collect up to `sample` user and product IDs from the API (following next_cursor)."""
+    ids = {}
+    for table in ("users", "products"):
+        ids[table] = []
+        url = f"{base_url}/{table}?limit=500"
+        while len(ids[table]) < sample:
+            page = json.load(urllib.request.urlopen(url, timeout=30))
+            ids[table].extend(row["id"] for row in page[table])
+            if not page.get("next_cursor"):
+                break
+            url = f"{base_url}/{table}?limit=500&after_id={page['next_cursor']}"
+        if not ids[table]:
+            sys.exit(f"No {table} in the database - create some first (see generate_dataset.py)")
+    return ids
+
+
+# ============================================================================
+# HTTP client (minimal HTTP/1.1 keep-alive client on asyncio streams)
+# ============================================================================
+
+async def http_request(conn: dict, host: str, port: int, method: str, target: str,
+                       headers: dict, body: bytes) -> int:
+    """
+    Send one request over the connection `conn` (reconnecting if needed) and read the response.
+
+    Returns:
+        The HTTP status code
+    """
+    if conn.get("writer") is None:
+        conn["reader"], conn["writer"] = await asyncio.open_connection(host, port)
+    reader, writer = conn["reader"], conn["writer"]
+
+    head = f"{method} {target} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: keep-alive\r\n"
+    for name, value in headers.items():
+        head += f"{name}: {value}\r\n"
+    if body is not None:
+        head += f"Content-Length: {len(body)}\r\n"
+    writer.write(head.encode() + b"\r\n" + (body or b""))
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = None
+    chunked = False
+    keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        name, value = name.lower(), value.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding" and "chunked" in value:
+            chunked = True
+        elif name == "connection" and value == "close":
+            keep_alive = False
+
+    if status in (204, 304) or method == "HEAD":
+        pass  # no body
+    elif chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)  # chunk + CRLF
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()  # body ends when the server closes the connection
+        keep_alive = False
+
+    if not keep_alive:
+        close_connection(conn)
+    return status
+
+
+def close_connection(conn: dict):
+    """Close the connection's socket (if open); the next http_request() reconnects."""
+    if conn.get("writer") is not None:
+        conn["writer"].close()
+    conn["writer"] = None
+
+
+# ============================================================================
+# Load models
+# ============================================================================
+
+class Results:
+    """Latencies and errors per endpoint."""
+
+    def __init__(self, names):
+        self.requests = Counter()
+        self.latency_ms = {name: [] for name in names}  # scheduled (open) or sent (closed) -> response
+        self.service_ms = {name: [] for name in names}  # sent -> response
+        self.errors = {name: Counter() for name in names}  # status code or failure -> count
+        self.client_lag_ms = 0.0  # open model: how late the generator was for its own schedule
+
+    def response(self, name: str, status: int, scheduled: float, sent: float):
+        """Record a response (an error if the status is 400 or more)."""
+        now = time.perf_counter()
+        self.requests[name] += 1
+        self.latency_ms[name].append((now - scheduled) * 1000)
+        self.service_ms[name].append((now - sent) * 1000)
+        if status >= 400:
+            self.errors[name][status] += 1
+
+    def failure(self, name: str, kind: str):
+        """Record a request that got no response (timeout, connection error)."""
+        self.requests[name] += 1
+        self.errors[name][kind] += 1
+
+
+async def send(name: str, request: tuple, conn: dict, target: tuple, results: Results, scheduled: float,
+               timeout: float):
+    """Send one request, bounded by `timeout` seconds after `scheduled`, and record the outcome."""
+    sent = time.perf_counter()
+    remaining = scheduled + timeout - sent
+    if remaining <= 0:
+        results.failure(name, "timeout")  # waited too long for a free connection, never sent
+        return
+    try:
+        status = await asyncio.wait_for(http_request(conn, *target, *request), remaining)
+    except asyncio.TimeoutError:
+        results.failure(name, "timeout")
+        close_connection(conn)  # the response may still arrive; do not reuse the connection
+        return
+    except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+        results.failure(name, e.__class__.__name__)
+        close_connection(conn)
+        return
+    results.response(name, status, scheduled, sent)
+
+
+async def closed_model(target: tuple, templates: dict, weights: dict, ids: dict, concurrency: int,
+                       duration: float, timeout: float, seed: int) -> Results:
+    """`concurrency` clients sending back to back for `duration` seconds."""
+    names, shares = list(weights), list(weights.values())
+    results = Results(names)
+    stop_at = time.perf_counter() + duration
+
+    async def client(client_seed: int):
+        rng = random.Random(client_seed)
+        conn = {}
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, shares)[0]
+            now = time.perf_counter()
+            await send(name, render(templates[name], rng, ids), conn, target, results, now, timeout)
+        close_connection(conn)
+
+    await asyncio.gather(*(client(seed * 100_000 + n) for n in range(concurrency)))
+    return results
+
+
+async def open_model(target: tuple, templates: dict, weights: dict, ids: dict, rate: float, connections: int,
+                     duration: float, timeout: float, seed: int) -> Results:
+    """
+    Send `rate` requests per second for `duration` seconds over up to `connections` connections.
+
+    Request i is scheduled at start + i / rate. Latency is measured from that
+    time, so waiting for a free connection (because the server is slow to
+    answer the earlier requests) counts as latency too.
+    """
+    names, shares = list(weights), list(weights.values())
+    results = Results(names)
+    rng = random.Random(seed)
+    idle = asyncio.Queue()
+    for _ in range(connections):
+        idle.put_nowait({})
+
+    async def scheduled_send(name: str, request: tuple, scheduled: float):
+        conn = await idle.get()
+        try:
+            await send(name, request, conn, target, results, scheduled, timeout)
+        finally:
+            idle.put_nowait(conn)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(rate * duration)):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            results.client_lag_ms = max(results.client_lag_ms, -delay * 1000)
+        name = rng.choices(names, shares)[0]
+        tasks.append(asyncio.create_task(scheduled_send(name, render(templates[name], rng, ids), scheduled)))
+    await asyncio.gather(*tasks)
+
+    while not idle.empty():
+        close_connection(idle.get_nowait())
+    return results
+
+
+# ============================================================================
+# Report
+# ============================================================================
+
+def report(results: Results, duration: float) -> dict:
+    """Throughput, error rate and latency percentiles per endpoint (and "all")."""
+    rows = {}
+    groups = [(name, [name]) for name in results.latency_ms] + [("all", list(results.latency_ms))]
+    for label, names in groups:
+        latency = [ms for name in names for ms in results.latency_ms[name]]
+        service = [ms for name in names for ms in results.service_ms[name]]
+        errors = Counter()
+        for name in names:
+            errors.update(results.errors[name])
+        requests = sum(results.requests[name] for name in names)
+        rows[label] = {
+            "requests": requests,
+            "rps": len(latency) / duration,
+            "errors": sum(errors.values()),
+            "error_rate": sum(errors.values()) / requests if requests else 0.0,
+            "error_kinds": {str(kind): count for kind, count in errors.items()},
+            **summarize(latency),
+            "service_p99_ms": summarize(service)["p99_ms"]
+        }
+    return rows
+
+
+def print_report(rows: dict):
+    print(f"{'endpoint':<20}{'requests':>9}{'req/s':>9}{'errors':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'max ms':>9}{'svc p99':>9}")
+    for label, row in rows.items():
+        print(f"{label:<20}{row['requests']:>9}{row['rps']:>9.1f}{row['error_rate']:>9.1%}{row['p50_ms']:>9.1f}"
+              f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}{row['service_p99_ms']:>9.1f}")
+    for label, row in rows.items():
+        if label != "all" and row["error_kinds"]:
+            print(f"  {label} errors: " + ", ".join(f"{kind} x{count}" for kind, count in row["error_kinds"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a mix of the Postman collection's requests under load")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"Comma-separated endpoint=weight (default: {DEFAULT_MIX}); endpoints: "
+                             + ", ".join(ENDPOINTS))
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Open model: requests per second (latency corrected for coordinated omission)")
+    parser.add_argument("--concurrency", type=int, default=50,
+                        help="Closed model: concurrent clients; open model: maximum open connections")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of the same load before measuring")
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds before a request counts as an error")
+    parser.add_argument("--url", default=None, help="Test an app that is already running (e.g. http://localhost:8021)")
+    parser.add_argument("--server", choices=("sync", "async"), default="sync",
+                        help="Server to start when --url is not given (gunicorn order_api / hypercorn order_api_async)")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes of the started server")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker (sync server)")
+    parser.add_argument("--port", type=int, default=8090, help="Port of the started server")
+    parser.add_argument("--sample-ids", type=int, default=2000, help="User/product IDs to pick requests from")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the request sequence")
+    parser.add_argument("--output", default=None, help="Also save the results as JSON to this file")
+    args = parser.parse_args()
+
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    templates = load_collection()
+
+    process = None
+    if args.url is None:
+        process = start_server(args.server, args.port, args.workers, args.threads)
+        base_url = f"http://{HOST}:{args.port}"
+    else:
+        base_url = args.url.rstrip("/")
+    url = urlsplit(base_url)
+    target = (url.hostname, url.port or 80)
+
+    try:
+        ids = fetch_ids(base_url, args.sample_ids)
+
+        def run(duration: float, seed: int) -> Results:
+            if args.rate is None:
+                return asyncio.run(closed_model(target, templates, weights, ids, args.concurrency, duration,
+                                                args.timeout, seed))
+            return asyncio.run(open_model(target, templates, weights, ids, args.rate, args.concurrency, duration,
+                                          args.timeout, seed))
+
+        if args.warmup > 0:
+            run(args.warmup, args.seed + 1)
+        results = run(args.duration, args.seed)
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    if args.rate is None:
+        print(f"Closed model: {args.concurrency} clients for {args.duration:.0f}s against {base_url} "
+              f"(latency = service time, NOT corrected for coordinated omission)")
+    else:
+        print(f"Open model: {args.rate:.0f} req/s for {args.duration:.0f}s over up to {args.concurrency} connections "
+              f"against {base_url} (latency from the scheduled send time); client lag max "
+              f"{results.client_lag_ms:.1f} ms")
+    rows = report(results, args.duration)
+    print_report(rows)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "mix": weights,
+                "model": "closed" if args.rate is None else "open",
+                "rate": args.rate,
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "url": base_url,
+                "server": None if args.url else {"kind": args.server, "workers": args.workers, "threads": args.threads},
+                "client_lag_ms": round(results.client_lag_ms, 3),
+                "endpoints": rows
+            }, f, indent=2)
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Maintenance jobs
+
+One-off and periodic database jobs that are run by hand (or from cron),
+not by the web apps.
+
+Jobs:
+- create-tables: create the tables declared in models.py that the database
+  does not have yet (e.g. table_versions in a database created before it)
+- backfill-order-totals: fill orders.total_amount_cents / total_quantity from
+  order_items for orders created before these columns existed
+- refresh-order-summary: recompute the user_order_summary materialized view
+  (creates it first if it does not exist); run it from cron when
+  ORDER_SUMMARY_SOURCE=view and ORDER_SUMMARY_REFRESH=manual
+- create-indexes: create the indexes declared in models.py that the database
+  does not have yet, without blocking writes, and drop the ones they replace
+- gc-idempotency-keys: delete expired Idempotency-Key responses in small
+  batches (creates the idempotency_keys table first if it does not exist);
+  run it from cron, e.g. hourly
+
+Usage:
+    python maintenance.py create-tables
+    python maintenance.py backfill-order-totals
+    python maintenance.py backfill-order-totals --batch-size 5000
+    python maintenance.py refresh-order-summary
+    python maintenance.py create-indexes
+    python maintenance.py gc-idempotency-keys --batch-size 1000
+
+Note: jobs run against the database configured in .env.
+"""
+import argparse
+import time
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+from database import engine, session_scope
+from db_operations import refresh_user_order_summary
+from models import Base, IdempotencyKeys, Orders
+
+# Orders updated per transaction by backfill-order-totals
+BACKFILL_BATCH_SIZE = 1000
+
+# Expired idempotency keys deleted per transaction by gc-idempotency-keys
+IDEMPOTENCY_GC_BATCH_SIZE = 1000
+
+
+# ============================================================================
+# create-tables
+# ============================================================================
+
+def create_tables():
+    """
+    Create every table declared in models.py that does not exist yet.
+
+    Existing tables are left as they are (no columns are added or changed -
+    see backfill-order-totals for that kind of upgrade). Run it after
+    updating the code of a database created by an older version.
+    """
+    inspector = inspect(engine)
+    # sorted_tables: tables before the ones whose foreign keys point at them
+    for table in Base.metadata.sorted_tables:
+        if inspector.has_table(table.name, schema=table.schema):
+            continue
+        print(f"  {table.schema}.{table.name}")
+        table.create(engine)
+
+
+# ============================================================================
+# backfill-order-totals
+# ============================================================================
+
+# Add the columns if this database was created before they existed
+# (IF NOT EXISTS makes it safe to run again; the DEFAULT fills existing rows with 0)
+ADD_ORDER_TOTAL_COLUMNS = text("""
+    ALTER TABLE tony.orders
+        ADD COLUMN IF NOT EXISTS total_amount_cents BIGINT NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS total_quantity INTEGER NOT NULL DEFAULT 0
+""")
+
+# Recompute the totals of the orders with from_id <= id < to_id from their items
+# Only rows whose totals actually change are written (IS DISTINCT FROM), so a
+# re-run touches nothing. Orders without items keep their totals of 0.
+UPDATE_ORDER_TOTALS = text("""
+    UPDATE tony.orders o
+    SET total_amount_cents = t.total_amount_cents,
+        total_quantity = t.total_quantity
+    FROM (
+        SELECT order_id,
+               SUM(price_cents_at_purchase) AS total_amount_cents,
+               SUM(quantity) AS total_quantity
+        FROM tony.order_items
+        WHERE order_id >= :from_id AND order_id < :to_id
+        GROUP BY order_id
+    ) t
+    WHERE o.id = t.order_id
+      AND (o.total_amount_cents, o.total_quantity) IS DISTINCT FROM (t.total_amount_cents, t.total_quantity)
+""")
+
+
+def backfill_order_totals(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    Fill the stored totals of every order from its order items.
+
+    Works through the orders in ID ranges of `batch_size` and commits after
+    each range, so every transaction is short: row locks are held only briefly
+    (the apps keep running) and an interrupted run can simply be started again.
+    Each range reads its items through the order_items(order_id, product_id) index.
+
+    New orders get their totals from create_order(), so the backfill is needed
+    only once, after adding the columns to an existing database.
+
+    Args:
+        batch_size: Order IDs per transaction
+
+    Returns:
+        Number of orders whose totals were changed
+    """
+    with session_scope() as db:
+        db.execute(ADD_ORDER_TOTAL_COLUMNS)
+        max_id = db.scalar(select(func.max(Orders.id)))
+
+    updated = 0
+    if max_id is None:
+        return updated
+
+    for from_id in range(1, max_id + 1, batch_size):
+        # One transaction per range (session_scope commits at the end of the block)
+        with session_scope() as db:
+            result = db.execute(UPDATE_ORDER_TOTALS, {"from_id": from_id, "to_id": from_id + batch_size})
+            updated += result.rowcount
+        print(f"  orders {from_id}..{min(from_id + batch_size - 1, max_id)}: {updated} updated so far")
+    return updated
+
+
+# ============================================================================
+# refresh-order-summary
+# ============================================================================
+
+# Same definition as in 2. Database/postgres.sql, for databases created before the view existed
+CREATE_ORDER_SUMMARY_VIEW = text("""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS tony.user_order_summary AS
+    SELECT u.id AS user_id,
+           COUNT(o.id) AS order_count,
+           COALESCE(SUM(o.total_amount_cents) FILTER (WHERE o.status <> 'cancelled'), 0)::bigint
+               AS lifetime_spend_cents,
+           MAX(o.created_at) AS last_order_at,
+           now() AS refreshed_at
+    FROM tony.users u
+    LEFT JOIN tony.orders o ON o.user_id = u.id
+    GROUP BY u.id
+""")
+CREATE_ORDER_SUMMARY_INDEX = text("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_user_order_summary_user_id
+    ON tony.user_order_summary(user_id)
+""")
+
+
+def refresh_order_summary():
+    """
+    Create the user_order_summary view if needed, then refresh it.
+
+    The refresh itself is db_operations.refresh_user_order_summary() - the same
+    one used by ORDER_SUMMARY_REFRESH=on-read - waiting for a refresh that is
+    already running instead of skipping.
+    """
+    with session_scope() as db:
+        db.execute(CREATE_ORDER_SUMMARY_VIEW)
+        db.execute(CREATE_ORDER_SUMMARY_INDEX)
+    refresh_user_order_summary(wait=True)
+
+
+# ============================================================================
+# create-indexes
+# ============================================================================
+
+# Indexes made redundant by a composite index that starts with the same column(s)
+REPLACED_INDEXES = (
+    "tony.idx_orders_user_id",  # -> idx_orders_user_id_id (user_id, id)
+    "tony.idx_order_items_order_id",  # -> idx_order_items_order_id_product_id (order_id, product_id)
+)
+
+
+def create_indexes(drop_replaced: bool = True):
+    """
+    Create every index declared in models.py that does not exist yet.
+
+    CREATE INDEX CONCURRENTLY builds the index without locking out writes, so
+    it can run while the apps are serving orders (it takes longer, and must
+    run outside a transaction - hence the AUTOCOMMIT connection).
+
+    If a concurrent build fails, PostgreSQL leaves an INVALID index behind
+    that IF NOT EXISTS would skip; drop it by hand and run this again.
+
+    Args:
+        drop_replaced: Also drop the REPLACED_INDEXES (after the new ones exist)
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspect(conn).has_table(table.name, schema=table.schema):
+                # e.g. idempotency_keys before create-tables / gc-idempotency-keys created it
+                print(f"  skip {table.schema}.{table.name} (table does not exist)")
+                continue
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                ddl = str(CreateIndex(index, if_not_exists=True).compile(engine))
+                print(f"  {index.name}")
+                conn.execute(text(ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)))
+        if drop_replaced:
+            for name in REPLACED_INDEXES:
+                print(f"  drop {name}")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        # Fresh statistics, so the planner knows about the new indexes right away
+        conn.execute(text("ANALYZE tony.orders"))
+        conn.execute(text("ANALYZE tony.order_items"))
+
+
+# ============================================================================
+# gc-idempotency-keys
+# ============================================================================
+
+# Delete up to :batch_size expired keys, oldest first, found through
+# idx_idempotency_keys_expires_at. SKIP LOCKED: keys that a request is taking
+# over right now (see db_operations._idempotency_claim_stmt) are left for the
+# next run instead of making the job wait.
+DELETE_EXPIRED_IDEMPOTENCY_KEYS = text("""
+    DELETE FROM tony.idempotency_keys
+    WHERE key IN (
+        SELECT key FROM tony.idempotency_keys
+        WHERE expires_at <= now()
+        ORDER BY expires_at
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+""")
+
+
+def gc_idempotency_keys(batch_size: int = IDEMPOTENCY_GC_BATCH_SIZE) -> int:
+    """
+    Delete the idempotency keys that have expired.
+
+    Expired keys are never replayed anyway (create_order_idempotent() treats
+    them as new); deleting them keeps the table - and its primary key index,
+    which every POST /orders with an Idempotency-Key reads - as small as the
+    keys of the last IDEMPOTENCY_KEY_TTL_SECONDS.
+
+    Deletes `batch_size` keys per transaction until none are left, so a big
+    backlog never turns into one long transaction holding many row locks.
+
+    Args:
+        batch_size: Keys deleted per transaction
+
+    Returns:
+        Number of keys deleted
+    """
+    # Databases created before the table existed
+    IdempotencyKeys.__table__.create(engine, checkfirst=True)
+
+    deleted = 0
+    while True:
+        # One transaction per batch (session_scope commits at the end of the block)
+        with session_scope() as db:
+            count = db.execute(DELETE_EXPIRED_IDEMPOTENCY_KEYS, {"batch_size": batch_size}).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+        print(f"  {deleted} deleted so far")
+
+
+# ============================================================================
+# MAIN ENTRY POINT
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Database maintenance jobs")
+    jobs = parser.add_subparsers(dest="job", required=True)
+
+    jobs.add_parser("create-tables", help="Create the tables declared in models.py that do not exist yet")
+
+    backfill = jobs.add_parser("backfill-order-totals",
+                               help="Fill orders.total_amount_cents / total_quantity from order_items")
+    backfill.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE,
+                          help="Order IDs per transaction")
+    jobs.add_parser("refresh-order-summary", help="Recompute the user_order_summary materialized view")
+    indexes = jobs.add_parser("create-indexes", help="Create the indexes declared in models.py (CONCURRENTLY)")
+    indexes.add_argument("--keep-replaced", action="store_true",
+                         help="Don't drop the indexes replaced by composite ones")
+    gc = jobs.add_parser("gc-idempotency-keys", help="Delete expired Idempotency-Key responses")
+    gc.add_argument("--batch-size", type=int, default=IDEMPOTENCY_GC_BATCH_SIZE,
+                    help="Keys deleted per transaction")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.job == "create-tables":
+        create_tables()
+        print("Tables are up to date")
+    elif args.job == "backfill-order-totals":
+        updated = backfill_order_totals(args.batch_size)
+        print(f"Backfilled totals of {updated} orders")
+    elif args.job == "refresh-order-summary":
+        refresh_order_summary()
+        print("Refreshed tony.user_order_summary")
+    elif args.job == "create-indexes":
+        create_indexes(drop_replaced=not args.keep_replaced)
+        print("Indexes are up to date")
+    elif args.job == "gc-idempotency-keys":
+        deleted = gc_idempotency_keys(args.batch_size)
+        print(f"Deleted {deleted} expired idempotency keys")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Prometheus Metrics
+
+Counters and histograms for order_api.py and order_ui.py, served in the
+Prometheus text format on GET /metrics (see init_app):
+
+- http_request_duration_seconds{app, method, route, status}: request latency
+  (route is the URL rule, e.g. "/orders/by-product", so IDs in the path or
+  query string don't create new series)
+- db_operation_duration_seconds{operation}: time of each db_operations
+  function call (SQL + building the response dicts)
+- db_query_duration_seconds{operation}: time of each SQL statement, labelled
+  with the db_operations function that ran it ("other" outside of one)
+- orders_created_total / order_items_created_total: orders and items written
+- db_pool_*: connection pool gauges (database.engine.pool) and the pool
+  telemetry counters of database.pool_telemetry
+
+Cheap enough to leave on: every thread records into its own dictionaries
+(no lock, no shared state); a scrape adds up all threads' numbers, plus the
+total of the threads that have ended.
+
+Multi-process servers (gunicorn with several workers): every worker has its
+own numbers, and a scrape reaches only one of them. Set METRICS_DIR to a
+directory shared by the workers (empty it when the server starts): each
+worker then writes its numbers to METRICS_DIR/metrics_<pid>.json every
+METRICS_FLUSH_SECONDS, and /metrics adds up the files of all workers.
+Counters of workers that have exited are kept (so totals don't drop); pool
+gauges are reported per pid and only for workers that are still running.
+
+Configuration (environment variables, see .env.example):
+- METRICS: on (default) | off
+- METRICS_DIR: shared directory for multi-process servers (unset = this process only)
+- METRICS_FLUSH_SECONDS: how often a worker writes its file (default 5)
+
+Usage:
+    import metrics
+    metrics.init_app(app)  # adds GET /metrics
+
+    @metrics.track_operation
+    def list_orders(...): ...
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import weakref
+
+from flask import Response, g, request
+
+from database import POOL_WAIT_BUCKETS_MS, engine, on_statement_timed, pool_telemetry
+
+METRICS_MODES = ("on", "off")
+METRICS = os.getenv('METRICS', 'on')
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+if METRICS not in METRICS_MODES:
+    raise ValueError(f"METRICS must be one of {METRICS_MODES}, got {METRICS!r}")
+
+# Histogram bucket upper bounds (seconds)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# name -> (type, help text, histogram buckets)
+METRIC_DEFINITIONS = {
+    "http_request_duration_seconds": ("histogram", "HTTP request latency", REQUEST_BUCKETS),
+    "db_operation_duration_seconds": ("histogram", "Duration of db_operations function calls", DB_BUCKETS),
+    "db_query_duration_seconds": ("histogram", "Duration of SQL statements, by db_operations function", DB_BUCKETS),
+    "orders_created_total": ("counter", "Orders written", None),
+    "order_items_created_total": ("counter", "Order items written", None),
+    "db_pool_checkouts_total": ("counter", "Connections handed out by the pool", None),
+    "db_pool_wait_timeouts_total": ("counter", "Checkouts that gave up waiting for a connection", None),
+    "db_pool_pre_ping_failures_total": ("counter", "Pre-pings that found a dead connection", None),
+    "db_pool_checkout_wait_seconds": ("histogram", "Time a checkout waited for a connection",
+                                      tuple(bound / 1000 for bound in POOL_WAIT_BUCKETS_MS)),
+    "db_pool_size": ("gauge", "Connections kept open by the pool", None),
+    "db_pool_checked_out": ("gauge", "Connections in use", None),
+    "db_pool_checked_in": ("gauge", "Idle connections in the pool", None),
+    "db_pool_overflow": ("gauge", "Connections opened beyond the pool size", None),
+}
+
+# db_operations function running in the current thread/task (label of db_query_duration_seconds)
+_current_operation = contextvars.ContextVar("metrics_operation", default="other")
+
+
+class Metrics:
+    """
+    Lock-free counters and histograms.
+
+    Each thread gets its own dictionary (threading.local), so recording a
+    value never waits for another thread; only a thread's first recording
+    takes a lock, to register its dictionary for snapshot().
+
+    When a thread ends (Werkzeug's development server starts one per
+    request), its dictionary is added into a shared total and unregistered,
+    so the number of dictionaries stays at the number of live threads.
+
+    Keys are (metric name, labels as a sorted tuple of (name, value) pairs);
+    a counter's value is a number, a histogram's is a list of per-bucket
+    counts followed by [sum, count].
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._stores = {}  # id of the thread's holder -> its dictionary (live threads only)
+        self._retired = {}  # numbers of the threads that have ended
+        self._lock = threading.Lock()
+
+    def _store(self) -> dict:
+        store = getattr(self._local, "store", None)
+        if store is None:
+            # The holder lives in the thread's threading.local, which is
+            # cleared when the thread ends; that runs _retire()
+            holder = self._local.holder = _StoreHolder()
+            store = self._local.store = {}
+            with self._lock:
+                self._stores[id(holder)] = store
+            weakref.finalize(holder, self._retire, id(holder))
+        return store
+
+    def _retire(self, holder_id: int):
+        """Move an ended thread's numbers into the shared total."""
+        with self._lock:
+            store = self._stores.pop(holder_id)
+            for key, value in store.items():
+                _merge(self._retired, key, value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add `value` to a counter."""
+        store = self._store()
+        key = (name, tuple(sorted(labels.items())))
+        store[key] = store.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one value in a histogram."""
+        buckets = METRIC_DEFINITIONS[name][2]
+        store = self._store()
+        key = (name, tuple(sorted(labels.items())))
+        counts = store.get(key)
+        if counts is None:
+            counts = store[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[len(buckets)] += 1  # +Inf bucket
+        counts[-2] += value
+        counts[-1] += 1
+
+    def snapshot(self) -> dict:
+        """Add up the numbers of all threads: {(name, labels): counter value or histogram list}."""
+        # Live stores and retired total are read under the same lock, so a
+        # thread ending meanwhile is counted exactly once
+        with self._lock:
+            stores = list(self._stores.values())
+            merged = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self._retired.items()}
+        for store in stores:
+            # dict.copy() and list() run without releasing the GIL, so they
+            # see a consistent copy while the owning thread keeps recording
+            for key, value in store.copy().items():
+                _merge(merged, key, list(value) if isinstance(value, list) else value)
+        return merged
+
+
+class _StoreHolder:
+    """Per-thread object whose finalization tells Metrics the thread has ended."""
+
+
+metrics = Metrics()
+
+
+def _merge(merged: dict, key, value):
+    """Add a counter value or histogram list into `merged`."""
+    current = merged.get(key)
+    if current is None:
+        merged[key] = value
+    elif isinstance(current, list):
+        merged[key] = [a + b for a, b in zip(current, value)]
+    else:
+        merged[key] = current + value
+
+
+def track_operation(function):
+    """
+    Decorator for db_operations functions: time each call, and label the SQL
+    statements it runs with its name (db_query_duration_seconds{operation}).
+    """
+    if METRICS == "off":
+        return function
+    operation = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current_operation.set(operation)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.observe("db_operation_duration_seconds", time.perf_counter() - start, operation=operation)
+            _current_operation.reset(token)
+
+    return wrapper
+
+
+def count_orders_created(orders: int, items: int):
+    """Count orders and order items written (called by db_operations once they are committed)."""
+    metrics.inc("orders_created_total", orders)
+    metrics.inc("order_items_created_total", items)
+
+
+# ============================================================================
+# SQL statement timing
+# ============================================================================
+
+def _record_statement(statement: str, cursor, elapsed: float):
+    metrics.observe("db_query_duration_seconds", elapsed, operation=_current_operation.get())
+
+
+if METRICS == "on":
+    on_statement_timed(_record_statement)
+
+
+# ============================================================================
+# Pool numbers (read at scrape/flush time, nothing recorded per checkout here)
+# ============================================================================
+
+def _pool_values() -> dict:
+    """This process's pool gauges and telemetry counters, as snapshot() entries."""
+    pool = engine.pool
+    telemetry = pool_telemetry.snapshot()
+    pid = (("pid", str(os.getpid())),)
+    wait_counts = telemetry["wait_histogram"] + [telemetry["wait_total_ms"] / 1000, telemetry["checkouts"]]
+    values = {
+        ("db_pool_checkouts_total", ()): telemetry["checkouts"],
+        ("db_pool_wait_timeouts_total", ()): telemetry["wait_timeouts"],
+        ("db_pool_pre_ping_failures_total", ()): telemetry["pre_ping_failures"],
+        ("db_pool_checkout_wait_seconds", ()): wait_counts,
+    }
+    values.update({
+        ("db_pool_size", pid): pool.size(),
+        ("db_pool_checked_out", pid): pool.checkedout(),
+        ("db_pool_checked_in", pid): pool.checkedin(),
+        ("db_pool_overflow", pid): pool.overflow(),
+    })
+    return values
+
+
+def _process_values() -> dict:
+    """Everything this process reports: recorded metrics plus pool numbers."""
+    values = metrics.snapshot()
+    values.update(_pool_values())
+    return values
+
+
+# ============================================================================
+# Multi-process (METRICS_DIR)
+# ============================================================================
+
+_flusher_pid = None
+
+
+def _metrics_file(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"metrics_{pid}.json")
+
+
+def _flush():
+    """Write this process's numbers to its file in METRICS_DIR (atomically, via rename)."""
+    path = _metrics_file(os.getpid())
+    rows = [[name, list(labels), value] for (name, labels), value in _process_values().items()]
+    with open(path + ".tmp", "w") as f:
+        json.dump(rows, f)
+    os.replace(path + ".tmp", path)
+
+
+def _start_flusher():
+    """Start the background thread writing this process's file (once per process, after fork)."""
+    global _flusher_pid
+    if METRICS_DIR is None or _flusher_pid == os.getpid():
+        return
+    _flusher_pid = os.getpid()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+    def flush_forever():
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            _flush()
+
+    threading.Thread(target=flush_forever, name="metrics-flusher", daemon=True).start()
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _all_processes_values() -> dict:
+    """Add up the files of every process in METRICS_DIR (this one's written fresh first)."""
+    _flush()
+    merged = {}
+    for file_name in os.listdir(METRICS_DIR):
+        if not (file_name.startswith("metrics_") and file_name.endswith(".json")):
+            continue
+        pid = int(file_name[len("metrics_"):-len(".json")])
+        try:
+            with open(os.path.join(METRICS_DIR, file_name)) as f:
+                rows = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue  # replaced or removed while we were reading it
+        running = _is_running(pid)
+        for name, labels, value in rows:
+            if METRIC_DEFINITIONS[name][0] == "gauge" and not running:
+                continue
+            _merge(merged, (name, tuple(tuple(label) for label in labels)), value)
+    return merged
+
+
+# ============================================================================
+# Prometheus text format
+# ============================================================================
+
+def _format_labels(labels) -> str:
+    """{name="value",...} with backslashes, quotes and newlines escaped as the format requires."""
+    if not labels:
+        return ""
+    escaped = (
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render(values: dict) -> str:
+    """Format snapshot() entries in the Prometheus text exposition format."""
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRIC_DEFINITIONS.items():
+        series = sorted((labels, value) for (key_name, labels), value in values.items() if key_name == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in series:
+            if metric_type != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), value[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# ============================================================================
+# Flask integration
+# ============================================================================
+
+def init_app(app):
+    """Record request latency for a Flask app and add GET /metrics (does nothing if METRICS=off)."""
+    if METRICS == "off":
+        return
+
+    @app.before_request
+    def start_request_timer():
+        _start_flusher()
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_duration(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            metrics.observe(
+                "http_request_duration_seconds", time.perf_counter() - start,
+                app=app.name, method=request.method,
+                route=request.url_rule.rule if request.url_rule is not None else "unmatched",
+                status=str(response.status_code)
+            )
+        return response
+
+    def metrics_endpoint():
+        values = _all_processes_values() if METRICS_DIR is not None else _process_values()
+        return Response(render(values), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint, methods=["GET"])
@@ -2,6 +2,7 @@ from typing import Optional
 import datetime
 
 from sqlalchemy import BigInteger, CheckConstraint, DateTime, ForeignKeyConstraint, Index, Integer, PrimaryKeyConstraint, Text, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 class Base(DeclarativeBase):
@@ -28,6 +29,9 @@ class Users(Base):
     __table_args__ = (
         PrimaryKeyConstraint('id', name='users_pkey'),
         UniqueConstraint('email', name='users_email_key'),
+        Index('idx_users_full_name', 'full_name'),
+        Index('idx_users_lower_email', text('lower(email) text_pattern_ops')),
+        Index('idx_users_lower_full_name', text('lower(full_name) text_pattern_ops')),
         {'schema': 'tony'}
     )
 
@@ -45,7 +49,10 @@ class Orders(Base):
         CheckConstraint("status = ANY (ARRAY['pending'::text, 'paid'::text, 'shipped'::text, 'cancelled'::text])", name='orders_status_check'),
         ForeignKeyConstraint(['user_id'], ['tony.users.id'], name='orders_user_id_fkey'),
         PrimaryKeyConstraint('id', name='orders_pkey'),
-        Index('idx_orders_user_id', 'user_id'),
+        Index('idx_orders_user_id_id', 'user_id', 'id'),
+        Index('idx_orders_user_id_created_at', 'user_id', 'created_at'),
+        Index('idx_orders_open_status_created_at', 'status', 'created_at', 'id',
+              postgresql_where=text("status = ANY (ARRAY['pending'::text, 'paid'::text])")),
         {'schema': 'tony'}
     )
 
@@ -54,6 +61,8 @@ class Orders(Base):
     status: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True), server_default=text('now()'))
     updated_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True))
+    total_amount_cents: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text('0'))
+    total_quantity: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
 
     user: Mapped['Users'] = relationship('Users', back_populates='orders')
     order_items: Mapped[list['OrderItems']] = relationship('OrderItems', back_populates='order')
@@ -66,7 +75,8 @@ class OrderItems(Base):
         ForeignKeyConstraint(['order_id'], ['tony.orders.id'], name='order_items_order_id_fkey'),
         ForeignKeyConstraint(['product_id'], ['tony.products.id'], name='order_items_product_id_fkey'),
         PrimaryKeyConstraint('id', name='order_items_pkey'),
-        Index('idx_order_items_order_id', 'order_id'),
+        Index('idx_order_items_order_id_product_id', 'order_id', 'product_id'),
+        Index('idx_order_items_product_id_order_id', 'product_id', 'order_id'),
         {'schema': 'tony'}
     )
 
@@ -78,3 +88,30 @@ class OrderItems(Base):
 
     order: Mapped['Orders'] = relationship('Orders', back_populates='order_items')
     product: Mapped['Products'] = relationship('Products', back_populates='order_items')
+
+
+class IdempotencyKeys(Base):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        PrimaryKeyConstraint('key', name='idempotency_keys_pkey'),
+        Index('idx_idempotency_keys_expires_at', 'expires_at'),
+        {'schema': 'tony'}
+    )
+
+    key: Mapped[str] = mapped_column(Text, primary_key=True)
+    request_hash: Mapped[str] = mapped_column(Text, nullable=False)
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), nullable=False)
+    response: Mapped[Optional[dict]] = mapped_column(JSONB)
+    created_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True), server_default=text('now()'))
+
+
+class TableVersions(Base):
+    __tablename__ = 'table_versions'
+    __table_args__ = (
+        PrimaryKeyConstraint('table_name', name='table_versions_pkey'),
+        {'schema': 'tony'}
+    )
+
+    table_name: Mapped[str] = mapped_column(Text, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text('0'))
+    changed_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True), server_default=text('now()'))
@@ -7,74 +7,216 @@ This is a minimal implementation for learning purposes - no error handling.
 Endpoints:
 - POST /users - Create a new user
 - POST /products - Create a new product
-- POST /orders - Create a new order
-- GET /users - List all users
-- GET /products - List all products
-- GET /orders?user_id=X - List orders for a specific user
+- POST /orders - Create a new order (send an Idempotency-Key header to make retries safe)
+- POST /orders/bulk - Create many orders in one request
+- POST /orders/transition - Change an order's status (only if it still has the expected status/version)
+- POST /orders/transition/bulk - Change the status of many orders in one statement
+- GET /export/orders.ndjson - Stream all orders (with items), one JSON object per line
+- GET /export/users.ndjson - Stream all users, one JSON object per line
+- GET /export/products.ndjson - Stream all products, one JSON object per line
+- GET /admin/product-cache - Product cache hit/miss counters
+- GET /admin/pool - Database connection pool state and counters
+- GET /metrics - Prometheus metrics (request latency, DB time, orders created, pool usage)
+- GET /users - List users (paginated)
+- GET /users/search?q=X - Users whose name or email starts with X (typeahead)
+- GET /users/order-summary?user_ids=1,2,3 - Order count, lifetime spend and last order date per user
+- GET /products - List products (paginated)
+- GET /orders?user_id=X - List orders for a specific user (paginated)
+- GET /orders/by-product?product_id=X - List orders containing a product (paginated)
+- GET /orders/by-status?status=paid&older_than_minutes=N - Open orders by status and age (fulfillment backlog)
+
+List endpoints use keyset pagination:
+- ?limit=N - page size (server caps it at MAX_PAGE_SIZE)
+- ?after_id=X - pass the previous response's next_cursor to get the next page
+- ?count=exact|estimate - also return "total" (off by default, counting is slow on big tables)
+
+GET /users and GET /products answer conditional requests: the response has an
+ETag, and a client that sends it back in If-None-Match gets 304 Not Modified
+(empty body) as long as the table has not changed - checked with one primary
+key lookup, without reading the list.
 """
 
-from flask import Flask, request, jsonify
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, Response, request, jsonify
 from db_operations import (
     create_user,
     create_product,
     create_order,
+    create_order_idempotent,
+    create_orders_bulk,
+    BULK_ORDER_CHUNK_SIZE,
     list_users,
+    get_table_version,
+    search_users,
     list_products,
-    list_orders
+    list_orders,
+    list_orders_by_product,
+    list_orders_by_status,
+    OPEN_ORDER_STATUSES,
+    transition_order_status,
+    transition_orders_status,
+    user_order_summary,
+    export_orders,
+    export_users,
+    export_products
 )
+import instrumentation
+import json_provider
+import metrics
+from product_cache import product_cache
+from database import init_app, pool_stats, request_db
 
 # Create Flask application instance
 app = Flask(__name__)
+# JSON serializer for the responses (JSON_SERIALIZER=stdlib|orjson, see json_provider.py);
+# it also writes the datetimes in the db_operations results as ISO 8601 strings
+json_provider.init_app(app)
+# Opt-in SQL/JSON timing, X-Query-Count header and slow request log
+# (INSTRUMENTATION=on, see instrumentation.py); registered first so the
+# request's commit is included in the measured time
+instrumentation.init_app(app)
+# Request latency histograms and GET /metrics (METRICS=on by default, see metrics.py)
+metrics.init_app(app)
+# One database session per request, committed after the view returns
+# (see database.init_app); endpoints pass it on as db=request_db()
+init_app(app)
 
 
 # ============================================================================
 # LIST ENDPOINTS (GET)
 # ============================================================================
 
+def _page_args() -> dict:
+    """
+    Read the keyset pagination query parameters shared by all list endpoints.
+    
+    Returns: keyword arguments for list_users / list_products / list_orders
+    """
+    return {
+        "after_id": request.args.get('after_id', type=int),
+        "limit": request.args.get('limit', type=int),
+        "count": request.args.get('count')
+    }
+
+
+def _conditional_list(table_name: str, load_page) -> Response:
+    """
+    Answer a list request for a table with a change counter (ETag / If-None-Match).
+    
+    The ETag is the table's version (see db_operations.get_table_version), e.g.
+    W/"users-42". If the client already has that version, the answer is 304
+    Not Modified and load_page is never called: an unchanged poll costs one
+    primary key lookup instead of the list query and its serialization. The
+    ETag is weak because "total" with count=estimate can drift without a change.
+    
+    Args:
+        table_name: "users" or "products"
+        load_page: Function(version) returning the list result to send
+    
+    Returns: The 304 or 200 response, with ETag and Cache-Control headers
+    """
+    version = get_table_version(table_name, db=request_db())
+    etag = f"{table_name}-{version}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(load_page(version))
+    response.set_etag(etag, weak=True)
+    # Clients may keep the response, but must check it (If-None-Match) before using it again
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.route('/users', methods=['GET'])
 def api_list_users():
     """
-    List all users in the database.
+    List users in the database, one page at a time.
     
-    Query parameters: None
+    Query parameters:
+    - after_id (optional): next_cursor from the previous page
+    - limit (optional): Page size (default 100, max 500)
+    - count (optional): "exact" or "estimate" to include the total user count
+    
+    Headers:
+    - If-None-Match (optional): ETag of a previous response; 304 (no body) if
+      no user has been added since
     
-    Returns: JSON object with list of users and total count
+    Returns: JSON object with one page of users, the cursor for the next page
+    (null on the last page) and the total count (null unless requested)
     {
         "users": [...],
-        "total": 5
+        "next_cursor": 100,
+        "total": null
     }
     
     Example curl:
-    curl -X GET http://localhost:8021/users
+    curl -X GET "http://localhost:8021/users?limit=50"
+    curl -X GET "http://localhost:8021/users?after_id=100&limit=50&count=estimate"
+    curl -i -X GET "http://localhost:8021/users?limit=50" -H 'If-None-Match: W/"users-42"'
+    """
+    # Call database operation function with the pagination parameters,
+    # unless the client's copy is still current (see _conditional_list)
+    return _conditional_list("users", lambda version: list_users(**_page_args(), db=request_db()))
+
+
+@app.route('/users/search', methods=['GET'])
+def api_search_users():
     """
-    # Call database operation function (no parameters needed)
-    result = list_users()
+    Find users whose full name or email starts with a prefix (case-insensitive).
     
-    # Return result as JSON response
+    Meant for typeahead pickers: instead of downloading every user, the client
+    sends what has been typed so far and gets a short list of matches.
+    
+    Query parameters:
+    - q (required): Prefix of the full name or email
+    - limit (optional): Maximum number of matches (default 10, max 50)
+    
+    Returns: JSON object with the matching users, ordered by name
+    {
+        "users": [{"id": 1, "email": "john@example.com", "full_name": "John Doe"}]
+    }
+    
+    Example curl:
+    curl -X GET "http://localhost:8021/users/search?q=jo"
+    """
+    result = search_users(request.args.get('q', ''), limit=request.args.get('limit', type=int), db=request_db())
     return jsonify(result), 200
 
 
 @app.route('/products', methods=['GET'])
 def api_list_products():
     """
-    List all products in the database.
+    List products in the database, one page at a time.
+    
+    Query parameters:
+    - after_id (optional): next_cursor from the previous page
+    - limit (optional): Page size (default 100, max 500)
+    - count (optional): "exact" or "estimate" to include the total product count
     
-    Query parameters: None
+    Headers:
+    - If-None-Match (optional): ETag of a previous response; 304 (no body) if
+      no product has been added since
     
-    Returns: JSON object with list of products and total count
+    Returns: JSON object with one page of products, the cursor for the next page
+    and the total count (null unless requested)
     {
         "products": [...],
+        "next_cursor": null,
         "total": 10
     }
     
     Example curl:
     curl -X GET http://localhost:8021/products
+    curl -X GET "http://localhost:8021/products?count=exact"
+    curl -i -X GET http://localhost:8021/products -H 'If-None-Match: W/"products-7"'
     """
-    # Call database operation function (no parameters needed)
-    result = list_products()
-    
-    # Return result as JSON response
-    return jsonify(result), 200
+    # Call database operation function with the pagination parameters, unless the
+    # client's copy is still current; the version keeps the product cache in step
+    # with the ETag (see list_products)
+    return _conditional_list(
+        "products", lambda version: list_products(**_page_args(), version=version, db=request_db())
+    )
 
 
 @app.route('/orders', methods=['GET'])
@@ -84,29 +226,155 @@ def api_list_orders():
     
     Query parameters:
     - user_id (required): The ID of the user whose orders to retrieve
+    - after_id (optional): next_cursor from the previous page
+    - limit (optional): Page size (default 100, max 500)
+    - count (optional): "exact" or "estimate" to include the user's order count
+    - headers_only (optional): "1" or "true" to return the orders without their
+      items (totals included; order_items is not read at all)
     
     Example: GET /orders?user_id=1
     
-    Returns: JSON object with list of orders and total count
+    Returns: JSON object with one page of orders, the cursor for the next page
+    and the total count (null unless requested)
     {
         "orders": [...],
+        "next_cursor": null,
         "total": 3
     }
     
     Example curl:
     curl -X GET "http://localhost:8021/orders?user_id=1"
+    curl -X GET "http://localhost:8021/orders?user_id=1&after_id=42&limit=20"
+    curl -X GET "http://localhost:8021/orders?user_id=1&headers_only=1"
     """
     # Get user_id from query parameters
     # request.args is a dictionary of query parameters
     user_id = request.args.get('user_id', type=int)
+    headers_only = request.args.get('headers_only', '').lower() in ('1', 'true')
     
-    # Call database operation function with user_id
-    result = list_orders(user_id)
+    # Call database operation function with user_id and the pagination parameters
+    result = list_orders(user_id, **_page_args(), headers_only=headers_only, db=request_db())
     
     # Return result as JSON response
     return jsonify(result), 200
 
 
+@app.route('/orders/by-product', methods=['GET'])
+def api_list_orders_by_product():
+    """
+    List the orders that contain a product, one page at a time.
+    
+    For recalls and support ("who bought product 17"). Returns order headers
+    only (no items), plus how many of the product each order contains.
+    
+    Query parameters:
+    - product_id (required): The ID of the product
+    - after_id (optional): next_cursor from the previous page
+    - limit (optional): Page size (default 100, max 500)
+    - count (optional): "exact" or "estimate" to include the number of orders
+    
+    Returns: JSON object with one page of orders, the cursor for the next page
+    and the total count (null unless requested)
+    {
+        "orders": [{"id": 1, "user_id": 1, "user_name": "John Doe", "status": "paid",
+                    "created_at": "...", "total_amount_cents": 274998, "total_quantity": 2,
+                    "product_quantity": 1}],
+        "next_cursor": null,
+        "total": null
+    }
+    
+    Example curl:
+    curl -X GET "http://localhost:8021/orders/by-product?product_id=17"
+    """
+    product_id = request.args.get('product_id', type=int)
+    result = list_orders_by_product(product_id, **_page_args(), db=request_db())
+    return jsonify(result), 200
+
+
+def _status_filter_args() -> dict:
+    """
+    Read the query parameters of GET /orders/by-status.
+    
+    Returns: keyword arguments for list_orders_by_status
+    """
+    statuses = request.args.get('status')
+    created_after = request.args.get('created_after')
+    created_before = request.args.get('created_before')
+    older_than_minutes = request.args.get('older_than_minutes', type=int)
+    if older_than_minutes is not None:
+        created_before = datetime.now(timezone.utc) - timedelta(minutes=older_than_minutes)
+    elif created_before is not None:
+        created_before = datetime.fromisoformat(created_before)
+    return {
+        "statuses": tuple(statuses.split(',')) if statuses else OPEN_ORDER_STATUSES,
+        "created_after": datetime.fromisoformat(created_after) if created_after else None,
+        "created_before": created_before,
+        "after": request.args.get('after'),
+        "limit": request.args.get('limit', type=int)
+    }
+
+
+@app.route('/orders/by-status', methods=['GET'])
+def api_list_orders_by_status():
+    """
+    List open orders by status and creation time, oldest first (fulfillment backlog).
+    
+    Query parameters:
+    - status (optional): Comma-separated statuses, "pending" and/or "paid" (default both)
+    - older_than_minutes (optional): Only orders created more than N minutes ago
+    - created_after / created_before (optional): ISO timestamps, e.g. 2024-03-01T00:00:00Z
+      (created_before is ignored when older_than_minutes is given)
+    - after (optional): next_cursor from the previous page
+    - limit (optional): Page size (default 100, max 500)
+    
+    Returns: JSON object with one page of order headers (no items) and the
+    cursor for the next page (null on the last page)
+    {
+        "orders": [{"id": 9, "user_id": 4, "user_name": "Alice Brown", "status": "paid",
+                    "created_at": "...", "total_amount_cents": 9999, "total_quantity": 1}],
+        "next_cursor": "1708431300000000:9"
+    }
+    
+    Example curl:
+    curl -X GET "http://localhost:8021/orders/by-status?status=paid&older_than_minutes=30"
+    """
+    result = list_orders_by_status(**_status_filter_args(), db=request_db())
+    return jsonify(result), 200
+
+
+def _user_ids_arg() -> list:
+    """Read ?user_ids=1,2,3 as a list of ints."""
+    return [int(user_id) for user_id in request.args.get('user_ids', '').split(',') if user_id.strip()]
+
+
+@app.route('/users/order-summary', methods=['GET'])
+def api_user_order_summary():
+    """
+    Order count, lifetime spend and last order date of one or more users.
+    
+    For account dashboards: the numbers are computed by the database in one
+    query for the whole batch, instead of downloading every order with
+    GET /orders and adding them up on the client.
+    
+    Query parameters:
+    - user_ids (required): Comma-separated user IDs (at most 500)
+    
+    Returns: JSON object with one summary per user, in the requested order,
+    and when the numbers were computed (null = just now; a timestamp when
+    they come from the materialized view, see ORDER_SUMMARY_SOURCE)
+    {
+        "summaries": [{"user_id": 1, "order_count": 3, "lifetime_spend_cents": 274998,
+                       "last_order_at": "2024-03-01T10:00:00+00:00"}],
+        "refreshed_at": null
+    }
+    
+    Example curl:
+    curl -X GET "http://localhost:8021/users/order-summary?user_ids=1,2,3"
+    """
+    result = user_order_summary(_user_ids_arg(), db=request_db())
+    return jsonify(result), 200
+
+
 # ============================================================================
 # CREATE ENDPOINTS (POST)
 # ============================================================================
@@ -137,7 +405,7 @@ def api_create_user():
     full_name = data['full_name']
     
     # Call database operation function
-    result = create_user(email, full_name)
+    result = create_user(email, full_name, db=request_db())
     
     # Return result as JSON response
     return jsonify(result), 201
@@ -171,12 +439,20 @@ def api_create_product():
     price_cents = data['price_cents']
     
     # Call database operation function
-    result = create_product(name, price_cents)
+    result = create_product(name, price_cents, db=request_db())
     
     # Return result as JSON response
     return jsonify(result), 201
 
 
+def _idempotent_response(result: dict):
+    """Turn a create_order_idempotent() result into 201 (first time or replay) or 422 (key reused)."""
+    if result["outcome"] == "mismatch":
+        return jsonify({"error": "Idempotency-Key was already used with a different request"}), 422
+    replayed = "true" if result["outcome"] == "replayed" else "false"
+    return jsonify(result["order"]), 201, {"Idempotent-Replayed": replayed}
+
+
 @app.route('/orders', methods=['POST'])
 def api_create_order():
     """
@@ -198,11 +474,18 @@ def api_create_order():
         ]
     }
     
+    Optional header:
+    Idempotency-Key: <unique value per order, e.g. a UUID> - send the same key
+    again when retrying; the order is created only once, and repeats get the
+    first response back (with "Idempotent-Replayed: true"). Reusing a key
+    with a different body returns 422.
+    
     Returns: Created order data as JSON
     
     Example curl:
     curl -X POST http://localhost:8021/orders \
       -H "Content-Type: application/json" \
+      -H "Idempotency-Key: 6f1c2a9e-0d4b-4a57-9a43-2f0f3c1d8e11" \
       -d '{"user_id": 1, "status": "pending", "items": [{"product_id": 1, "quantity": 2}, {"product_id": 2, "quantity": 1}]}'
     """
     # Get JSON data from request body
@@ -213,13 +496,282 @@ def api_create_order():
     status = data['status']
     items = data['items']  # List of items with product_id and quantity
     
+    # With an Idempotency-Key, a retried request gets the stored response
+    # instead of creating the order a second time
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None:
+        result = create_order_idempotent(idempotency_key, user_id, status, items, db=request_db())
+        return _idempotent_response(result)
+    
     # Call database operation function
-    result = create_order(user_id, status, items)
+    result = create_order(user_id, status, items, db=request_db())
     
     # Return result as JSON response
     return jsonify(result), 201
 
 
+@app.route('/orders/bulk', methods=['POST'])
+def api_create_orders_bulk():
+    """
+    Create many orders in one request (bulk ingestion).
+    
+    Orders are written in chunks; each chunk is one transaction. A bad order
+    is reported in its result entry instead of failing the whole request.
+    
+    Query parameters:
+    - chunk_size (optional): Orders per transaction (default 1000)
+    
+    Request body (JSON):
+    {
+        "orders": [
+            {"user_id": 1, "status": "paid", "items": [{"product_id": 1, "quantity": 2}]},
+            {"user_id": 2, "status": "pending", "items": [{"product_id": 3, "quantity": 1}]}
+        ]
+    }
+    
+    Returns: One result per order, in request order
+    {
+        "results": [
+            {"index": 0, "ok": true, "id": 101, "item_count": 1, "total_amount_cents": 499998, "total_quantity": 2},
+            {"index": 1, "ok": false, "error": "Product not found: 3"}
+        ],
+        "created": 1,
+        "failed": 1
+    }
+    
+    Example curl:
+    curl -X POST "http://localhost:8021/orders/bulk?chunk_size=500" \
+      -H "Content-Type: application/json" \
+      -d '{"orders": [{"user_id": 1, "status": "paid", "items": [{"product_id": 1, "quantity": 2}]}]}'
+    """
+    # Get JSON data from request body
+    data = request.get_json()
+    orders = data['orders']
+    
+    # Chunk size is optional; fall back to the module default
+    chunk_size = request.args.get('chunk_size', default=BULK_ORDER_CHUNK_SIZE, type=int)
+    
+    # Call database operation function
+    # No request_db() here: each chunk commits on its own, so orders reported
+    # as created are already saved even if a later chunk fails
+    result = create_orders_bulk(orders, chunk_size=chunk_size)
+    
+    # Return result as JSON response
+    return jsonify(result), 200
+
+
+@app.route('/orders/transition', methods=['POST'])
+def api_transition_order_status():
+    """
+    Change the status of one order, if nobody changed it in the meantime.
+    
+    The status only changes if the order still has from_status (and, if given,
+    the updated_at the client last saw - e.g. from GET /orders). Allowed
+    changes: pending -> paid/cancelled, paid -> shipped/cancelled.
+    
+    Request body (JSON):
+    {
+        "order_id": 42,
+        "from_status": "paid",
+        "to_status": "shipped",
+        "expected_updated_at": "2024-03-01T10:00:00.123456+00:00"   (optional)
+    }
+    
+    Returns:
+    - 200 with the changed order: {"ok": true, "order": {"id": 42, "status": "shipped", "updated_at": "..."}}
+    - 409 if the order has changed: {"ok": false, "order": <current id/status/updated_at>}
+    - 404 if there is no such order: {"ok": false, "order": null}
+    
+    Example curl:
+    curl -X POST http://localhost:8021/orders/transition \
+      -H "Content-Type: application/json" \
+      -d '{"order_id": 42, "from_status": "paid", "to_status": "shipped"}'
+    """
+    data = request.get_json()
+    expected_updated_at = data.get('expected_updated_at')
+    result = transition_order_status(
+        data['order_id'], data['from_status'], data['to_status'],
+        expected_updated_at=datetime.fromisoformat(expected_updated_at) if expected_updated_at else None,
+        db=request_db()
+    )
+    if result["ok"]:
+        return jsonify(result), 200
+    return jsonify(result), 404 if result["order"] is None else 409
+
+
+@app.route('/orders/transition/bulk', methods=['POST'])
+def api_transition_orders_status():
+    """
+    Change the status of many orders in one statement (at most 10000).
+    
+    Orders that no longer have from_status are skipped, not failed.
+    
+    Request body (JSON):
+    {"order_ids": [1, 2, 3], "from_status": "paid", "to_status": "shipped"}
+    
+    Returns:
+    {
+        "updated": [{"id": 1, "status": "shipped", "updated_at": "..."}, ...],
+        "skipped": [3]
+    }
+    
+    Example curl:
+    curl -X POST http://localhost:8021/orders/transition/bulk \
+      -H "Content-Type: application/json" \
+      -d '{"order_ids": [1, 2, 3], "from_status": "paid", "to_status": "shipped"}'
+    """
+    data = request.get_json()
+    result = transition_orders_status(data['order_ids'], data['from_status'], data['to_status'], db=request_db())
+    return jsonify(result), 200
+
+
+# ============================================================================
+# EXPORT ENDPOINTS (streaming NDJSON)
+# ============================================================================
+
+# Lines are sent to the client in chunks of roughly this many bytes
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _ndjson_response(rows) -> Response:
+    """
+    Turn a generator of dictionaries into a streaming NDJSON response.
+    
+    NDJSON ("newline-delimited JSON") is one JSON object per line. Flask sends
+    each chunk yielded by generate() as soon as it is ready, so the response
+    starts right away and is never held in memory as a whole.
+    """
+    def generate():
+        buffer = []
+        size = 0
+        try:
+            for row in rows:
+                line = app.json.dumps(row) + "\n"
+                buffer.append(line)
+                size += len(line)
+                if size >= EXPORT_CHUNK_BYTES:
+                    yield "".join(buffer)
+                    buffer = []
+                    size = 0
+            if buffer:
+                yield "".join(buffer)
+        finally:
+            # If the client disconnects, Flask closes this generator; close the
+            # database generator too so its session is released right away
+            rows.close()
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/export/orders.ndjson', methods=['GET'])
+def api_export_orders():
+    """
+    Stream all orders with their items as NDJSON (one order per line).
+    
+    Reads from a server-side cursor, so memory stays flat and the first line
+    arrives immediately regardless of table size.
+    
+    Query parameters:
+    - after_id (optional): Only export orders with an ID greater than this
+      (use the last exported ID to resume an interrupted dump)
+    
+    Returns: application/x-ndjson stream, one line per order:
+    {"id": 1, "user_id": 1, "status": "paid", "created_at": "...", "items": [...], "total_amount_cents": 274998, "total_quantity": 2}
+    
+    Example curl:
+    curl -X GET http://localhost:8021/export/orders.ndjson -o orders.ndjson
+    """
+    return _ndjson_response(export_orders(after_id=request.args.get('after_id', type=int)))
+
+
+@app.route('/export/users.ndjson', methods=['GET'])
+def api_export_users():
+    """
+    Stream all users as NDJSON (one user per line).
+    
+    Query parameters:
+    - after_id (optional): Only export users with an ID greater than this
+    
+    Example curl:
+    curl -X GET http://localhost:8021/export/users.ndjson -o users.ndjson
+    """
+    return _ndjson_response(export_users(after_id=request.args.get('after_id', type=int)))
+
+
+@app.route('/export/products.ndjson', methods=['GET'])
+def api_export_products():
+    """
+    Stream all products as NDJSON (one product per line).
+    
+    Query parameters:
+    - after_id (optional): Only export products with an ID greater than this
+    
+    Example curl:
+    curl -X GET http://localhost:8021/export/products.ndjson -o products.ndjson
+    """
+    return _ndjson_response(export_products(after_id=request.args.get('after_id', type=int)))
+
+
+# ============================================================================
+# ADMIN ENDPOINTS
+# ============================================================================
+
+@app.route('/admin/product-cache', methods=['GET'])
+def api_product_cache_stats():
+    """
+    Show product cache counters for this worker process.
+    
+    Returns:
+    {
+        "enabled": true,
+        "ttl_seconds": 60.0,
+        "hits": 1520,
+        "misses": 12,
+        "hit_ratio": 0.9922,
+        "invalidations": 1,
+        "entries": 14
+    }
+    
+    Example curl:
+    curl -X GET http://localhost:8021/admin/product-cache
+    """
+    return jsonify(product_cache.stats()), 200
+
+
+@app.route('/admin/pool', methods=['GET'])
+def api_pool_stats():
+    """
+    Show the database connection pool of this worker process.
+    
+    Use it to size DB_POOL_SIZE / DB_MAX_OVERFLOW: every worker process can open
+    up to max_connections connections, and all workers together must stay below
+    PostgreSQL's max_connections. Waits in the higher histogram buckets or any
+    wait_timeouts mean requests are queuing for a connection (pool too small).
+    
+    Returns:
+    {
+        "pid": 4242,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "max_connections": 15,
+        "checked_out": 1,
+        "checked_in": 4,
+        "overflow": 0,
+        "checkouts": 1200,
+        "wait_timeouts": 0,
+        "wait_ms": {"avg": 0.05, "max": 12.5, "histogram": [{"le_ms": 1, "count": 1195}, ..., {"le_ms": null, "count": 0}]},
+        "pre_ping": "idle",
+        "pre_pings": 14,
+        "pre_ping_failures": 1,
+        ...
+    }
+    
+    Example curl:
+    curl -X GET http://localhost:8021/admin/pool
+    """
+    return jsonify(pool_stats()), 200
+
+
 # ============================================================================
 # MAIN ENTRY POINT
 # ============================================================================
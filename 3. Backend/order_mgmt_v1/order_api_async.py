@@ -0,0 +1,281 @@
+"""
+Order Management API (async)
+
+The same REST endpoints as order_api.py, served by an asyncio app:
+- Quart (the asyncio re-implementation of Flask, same routing and request API)
+- db_operations_async (async SQLAlchemy + asyncpg) instead of db_operations
+
+Why: in order_api.py every worker thread sits idle while it waits for
+PostgreSQL, so throughput is limited by how many workers/threads we run (and
+each one costs memory). Here one process keeps many requests in flight: while
+one request waits for the database, the event loop runs the others.
+
+Responses are identical to order_api.py (same functions, same JSON shapes),
+so clients can switch between the two without changes.
+
+Endpoints: see order_api.py (all of them, with the same parameters).
+
+Run with an ASGI server, e.g.:
+    hypercorn order_api_async:app --bind 0.0.0.0:8023
+or for development:
+    python order_api_async.py
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from quart import Quart, Response, request, jsonify
+from db_operations_async import (
+    create_user,
+    create_product,
+    create_order,
+    create_order_idempotent,
+    create_orders_bulk,
+    BULK_ORDER_CHUNK_SIZE,
+    list_users,
+    get_table_version,
+    search_users,
+    list_products,
+    list_orders,
+    list_orders_by_product,
+    list_orders_by_status,
+    transition_order_status,
+    transition_orders_status,
+    user_order_summary,
+    export_orders,
+    export_users,
+    export_products
+)
+from db_operations import OPEN_ORDER_STATUSES
+import json_provider
+from product_cache import product_cache
+
+# Create Quart application instance
+app = Quart(__name__)
+# Same JSON serializer as order_api.py (JSON_SERIALIZER, see json_provider.py),
+# so both APIs write datetimes as ISO 8601 strings
+json_provider.init_app(app)
+
+
+# ============================================================================
+# LIST ENDPOINTS (GET)
+# ============================================================================
+
+def _page_args() -> dict:
+    """Read the keyset pagination query parameters (after_id, limit, count), see order_api.py."""
+    return {
+        "after_id": request.args.get('after_id', type=int),
+        "limit": request.args.get('limit', type=int),
+        "count": request.args.get('count')
+    }
+
+
+async def _conditional_list(table_name: str, load_page) -> Response:
+    """ETag / If-None-Match for a list: 304 without calling load_page(version) if unchanged (see order_api._conditional_list)."""
+    version = await get_table_version(table_name)
+    etag = f"{table_name}-{version}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response("", status=304)
+    else:
+        response = jsonify(await load_page(version))
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/users', methods=['GET'])
+async def api_list_users():
+    """List users, one page at a time; 304 if If-None-Match is current (see order_api.api_list_users)."""
+    return await _conditional_list("users", lambda version: list_users(**_page_args()))
+
+
+@app.route('/users/search', methods=['GET'])
+async def api_search_users():
+    """Find users whose full name or email starts with ?q= (see order_api.api_search_users)."""
+    result = await search_users(request.args.get('q', ''), limit=request.args.get('limit', type=int))
+    return jsonify(result), 200
+
+
+@app.route('/products', methods=['GET'])
+async def api_list_products():
+    """List products, one page at a time; 304 if If-None-Match is current (see order_api.api_list_products)."""
+    return await _conditional_list("products", lambda version: list_products(**_page_args(), version=version))
+
+
+@app.route('/orders', methods=['GET'])
+async def api_list_orders():
+    """List one page of orders for ?user_id= (see order_api.api_list_orders)."""
+    user_id = request.args.get('user_id', type=int)
+    headers_only = request.args.get('headers_only', '').lower() in ('1', 'true')
+    return jsonify(await list_orders(user_id, **_page_args(), headers_only=headers_only)), 200
+
+
+@app.route('/orders/by-product', methods=['GET'])
+async def api_list_orders_by_product():
+    """List one page of the orders containing ?product_id= (see order_api.api_list_orders_by_product)."""
+    product_id = request.args.get('product_id', type=int)
+    return jsonify(await list_orders_by_product(product_id, **_page_args())), 200
+
+
+@app.route('/orders/by-status', methods=['GET'])
+async def api_list_orders_by_status():
+    """List open orders by ?status= and age, oldest first (see order_api.api_list_orders_by_status)."""
+    statuses = request.args.get('status')
+    created_after = request.args.get('created_after')
+    created_before = request.args.get('created_before')
+    older_than_minutes = request.args.get('older_than_minutes', type=int)
+    if older_than_minutes is not None:
+        created_before = datetime.now(timezone.utc) - timedelta(minutes=older_than_minutes)
+    elif created_before is not None:
+        created_before = datetime.fromisoformat(created_before)
+    result = await list_orders_by_status(
+        statuses=tuple(statuses.split(',')) if statuses else OPEN_ORDER_STATUSES,
+        created_after=datetime.fromisoformat(created_after) if created_after else None,
+        created_before=created_before,
+        after=request.args.get('after'),
+        limit=request.args.get('limit', type=int)
+    )
+    return jsonify(result), 200
+
+
+@app.route('/users/order-summary', methods=['GET'])
+async def api_user_order_summary():
+    """Order count, lifetime spend and last order date for ?user_ids=1,2,3 (see order_api.api_user_order_summary)."""
+    user_ids = [int(user_id) for user_id in request.args.get('user_ids', '').split(',') if user_id.strip()]
+    return jsonify(await user_order_summary(user_ids)), 200
+
+
+# ============================================================================
+# CREATE ENDPOINTS (POST)
+# ============================================================================
+
+@app.route('/users', methods=['POST'])
+async def api_create_user():
+    """Create a new user from {"email", "full_name"} (see order_api.api_create_user)."""
+    # Reading the body is async in Quart: it may still be arriving from the client
+    data = await request.get_json()
+    return jsonify(await create_user(data['email'], data['full_name'])), 201
+
+
+@app.route('/products', methods=['POST'])
+async def api_create_product():
+    """Create a new product from {"name", "price_cents"} (see order_api.api_create_product)."""
+    data = await request.get_json()
+    return jsonify(await create_product(data['name'], data['price_cents'])), 201
+
+
+@app.route('/orders', methods=['POST'])
+async def api_create_order():
+    """Create a new order from {"user_id", "status", "items"}, honouring Idempotency-Key (see order_api.api_create_order)."""
+    data = await request.get_json()
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is None:
+        return jsonify(await create_order(data['user_id'], data['status'], data['items'])), 201
+
+    result = await create_order_idempotent(idempotency_key, data['user_id'], data['status'], data['items'])
+    if result["outcome"] == "mismatch":
+        return jsonify({"error": "Idempotency-Key was already used with a different request"}), 422
+    replayed = "true" if result["outcome"] == "replayed" else "false"
+    return jsonify(result["order"]), 201, {"Idempotent-Replayed": replayed}
+
+
+@app.route('/orders/bulk', methods=['POST'])
+async def api_create_orders_bulk():
+    """Create many orders in one request, ?chunk_size= per transaction (see order_api.api_create_orders_bulk)."""
+    data = await request.get_json()
+    chunk_size = request.args.get('chunk_size', default=BULK_ORDER_CHUNK_SIZE, type=int)
+    return jsonify(await create_orders_bulk(data['orders'], chunk_size=chunk_size)), 200
+
+
+@app.route('/orders/transition', methods=['POST'])
+async def api_transition_order_status():
+    """Change one order's status if it is unchanged (see order_api.api_transition_order_status)."""
+    data = await request.get_json()
+    expected_updated_at = data.get('expected_updated_at')
+    result = await transition_order_status(
+        data['order_id'], data['from_status'], data['to_status'],
+        expected_updated_at=datetime.fromisoformat(expected_updated_at) if expected_updated_at else None
+    )
+    if result["ok"]:
+        return jsonify(result), 200
+    return jsonify(result), 404 if result["order"] is None else 409
+
+
+@app.route('/orders/transition/bulk', methods=['POST'])
+async def api_transition_orders_status():
+    """Change the status of many orders in one statement (see order_api.api_transition_orders_status)."""
+    data = await request.get_json()
+    return jsonify(await transition_orders_status(data['order_ids'], data['from_status'], data['to_status'])), 200
+
+
+# ============================================================================
+# EXPORT ENDPOINTS (streaming NDJSON)
+# ============================================================================
+
+# Lines are sent to the client in chunks of roughly this many bytes
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _ndjson_response(rows) -> Response:
+    """
+    Turn an async generator of dictionaries into a streaming NDJSON response.
+
+    Same output as order_api._ndjson_response; the database rows are read with
+    `async for`, so a slow client does not block the other requests.
+    """
+    async def generate():
+        buffer = []
+        size = 0
+        try:
+            async for row in rows:
+                line = app.json.dumps(row) + "\n"
+                buffer.append(line)
+                size += len(line)
+                if size >= EXPORT_CHUNK_BYTES:
+                    yield "".join(buffer).encode()
+                    buffer = []
+                    size = 0
+            if buffer:
+                yield "".join(buffer).encode()
+        finally:
+            # Release the database session right away if the client disconnects
+            await rows.aclose()
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/export/orders.ndjson', methods=['GET'])
+async def api_export_orders():
+    """Stream all orders with their items as NDJSON (see order_api.api_export_orders)."""
+    return _ndjson_response(export_orders(after_id=request.args.get('after_id', type=int)))
+
+
+@app.route('/export/users.ndjson', methods=['GET'])
+async def api_export_users():
+    """Stream all users as NDJSON (see order_api.api_export_users)."""
+    return _ndjson_response(export_users(after_id=request.args.get('after_id', type=int)))
+
+
+@app.route('/export/products.ndjson', methods=['GET'])
+async def api_export_products():
+    """Stream all products as NDJSON (see order_api.api_export_products)."""
+    return _ndjson_response(export_products(after_id=request.args.get('after_id', type=int)))
+
+
+# ============================================================================
+# ADMIN ENDPOINTS
+# ============================================================================
+
+@app.route('/admin/product-cache', methods=['GET'])
+async def api_product_cache_stats():
+    """Show product cache counters for this worker process (see order_api.api_product_cache_stats)."""
+    return jsonify(product_cache.stats()), 200
+
+
+# ============================================================================
+# MAIN ENTRY POINT
+# ============================================================================
+
+if __name__ == '__main__':
+    # Run the Quart development server (use hypercorn for benchmarks/production)
+    # port=8023: next to order_api.py (8021) and order_ui.py (8022), so all three can run together
+    app.run(debug=True, host='0.0.0.0', port=8023)
@@ -8,14 +8,63 @@ Core Concepts:
 4. Data is passed to templates via render_template() second parameter
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from db_operations import list_users, create_user, list_products, list_orders, create_product, create_order
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from db_operations import (
+    list_users, create_user, list_products, list_orders, create_product, create_order,
+    get_user_by_name, search_users, MAX_PAGE_SIZE
+)
+from database import init_app, request_db
+import instrumentation
+import json_provider
+import metrics
 
 # Create Flask application instance
 app = Flask(__name__)
 # Secret key is required to sign session cookie; without it session data cannot be trusted.
 # In production use a random value from env (e.g. os.environ.get('SECRET_KEY')).
 app.secret_key = 'secret-key-for-session-data'
+# JSON serializer for jsonify() (JSON_SERIALIZER, see json_provider.py); it also
+# writes the datetimes in the db_operations results as ISO 8601 strings
+json_provider.init_app(app)
+# Opt-in SQL/template timing, X-Query-Count header and slow request log
+# (INSTRUMENTATION=on, see instrumentation.py); registered before init_app so
+# the request's commit is included in the measured time
+instrumentation.init_app(app)
+# Request latency histograms and GET /metrics (METRICS=on by default, see metrics.py)
+metrics.init_app(app)
+# One database session per request: every db_operations call below passes
+# db=request_db(), so a page view uses one connection and one transaction,
+# committed after the view returns (see database.init_app)
+init_app(app)
+
+
+def fetch_all(list_function, key: str, **kwargs) -> list:
+    """
+    Walk every page of a paginated list function and return all rows.
+    
+    The db_operations list functions return one page at a time (see next_cursor);
+    this follows the cursor until the last page. Only use it for lists that are
+    meant to be shown in full, like dropdowns - list pages show one page at a time.
+    
+    Example: fetch_all(list_products, 'products')
+    """
+    rows = []
+    after_id = None
+    while True:
+        page = list_function(after_id=after_id, limit=MAX_PAGE_SIZE, **kwargs)
+        rows.extend(page[key])
+        after_id = page['next_cursor']
+        if after_id is None:
+            return rows
+
+
+@app.template_filter('isoformat')
+def isoformat_filter(value):
+    """
+    Show a timestamp as ISO 8601 ("2024-01-16T10:30:00+00:00"), like the API does.
+    db_operations returns datetime objects; printing one directly gives "2024-01-16 10:30:00+00:00".
+    """
+    return value.isoformat() if hasattr(value, 'isoformat') else value
 
 
 @app.context_processor
@@ -51,13 +100,13 @@ def index():
 @app.route('/login', methods=['POST'])
 def login():
     """
-    Login: look up user by full_name (using list_users), save to session, show success/failure message.
+    Login: look up user by full_name (using get_user_by_name), save to session, show success/failure message.
+    get_user_by_name() is a single indexed query, so login stays fast however many users there are.
     Session is server-side state keyed by a cookie; after login we store user_id and user_name
     so other routes and templates can know who is logged in without passing it in the URL.
     """
     user_name = request.form.get('user_name', '').strip()
-    users = list_users().get('users', [])
-    user = next((u for u in users if u['full_name'] == user_name), None) if user_name else None
+    user = get_user_by_name(user_name, db=request_db()) if user_name else None
     if user:
         # Store logged-in user in session; persisted in signed cookie, available on subsequent requests
         session['user_id'] = user['id']
@@ -78,6 +127,30 @@ def logout():
     return redirect(url_for('index'))
 
 
+# ============================================================================
+# User Search - JSON endpoint for the user picker (typeahead)
+# ============================================================================
+@app.route('/users/search')
+def search_users_json():
+    """
+    Return users whose name or email starts with ?q=, as JSON.
+    
+    The user picker on the Orders and Create Order pages (templates/_user_picker.html)
+    calls this while the user types, instead of the page embedding every user
+    in a <select>. Results are limited, so the response stays small.
+    
+    Example: /users/search?q=jo -> {"users": [{"id": 1, "full_name": "John Doe", ...}]}
+    """
+    return jsonify(search_users(request.args.get('q', ''), limit=request.args.get('limit', type=int), db=request_db()))
+
+
+def current_user_label():
+    """Text shown in the user picker for the logged-in user (or '' if nobody is logged in)."""
+    if session.get('user_id') and session.get('user_name'):
+        return f"{session['user_id']}: {session['user_name']}"
+    return ''
+
+
 # ============================================================================
 # Route 2: Users List - Demonstrates loops and conditionals
 # ============================================================================
@@ -87,21 +160,24 @@ def users_page():
     Users list page
     
     Workflow:
-    1. Get user data from database
+    1. Get one page of user data from database (?after_id=X picks the page)
     2. Pass data to template
     3. Template uses Jinja2 syntax to render HTML
     """
-    # Get user data from database
-    result = list_users()
-    users = result.get('users', [])  # List of users
-    total = result.get('total', 0)    # Total number of users
+    # Get one page of user data from database
+    # count='estimate' reads the row count from table statistics instead of COUNT(*)
+    after_id = request.args.get('after_id', type=int)
+    result = list_users(after_id=after_id, count='estimate', db=request_db())
+    users = result.get('users', [])  # List of users on this page
+    total = result.get('total', 0)    # Total number of users (estimated)
     
     # Render template with data
-    # In template, can use: {{ users }}, {{ total }}, {{ title }}
+    # In template, can use: {{ users }}, {{ total }}, {{ next_cursor }}, {{ title }}
     return render_template(
         'users.html',
         users=users,      # Variable passed to template
         total=total,        # Variable passed to template
+        next_cursor=result.get('next_cursor'),  # after_id for the "Next page" link
         title='Users List' # Variable passed to template
     )
 
@@ -130,11 +206,12 @@ def new_user():
         
         # Create user
         try:
-            result = create_user(email, full_name)
+            result = create_user(email, full_name, db=request_db())
             # flash() displays temporary messages (success/error notifications)
             flash(f'User {full_name} created successfully!', 'success')
             return redirect(url_for('users_page'))
         except Exception as e:
+            request_db().rollback()  # Don't commit a half-done write with the redirect
             flash(f'Error: {str(e)}', 'error')
             return redirect(url_for('new_user'))
 
@@ -153,21 +230,23 @@ def products_page():
     Products list page
     
     Workflow:
-    1. Get products data from database
+    1. Get one page of products data from database (?after_id=X picks the page)
     2. Pass data to template
     3. Template uses Jinja2 syntax to render HTML
     """
-    # Get products data from database
-    result = list_products()
-    products = result.get('products', [])  # List of products
-    total = result.get('total', 0)    # Total number of products
+    # Get one page of products data from database
+    after_id = request.args.get('after_id', type=int)
+    result = list_products(after_id=after_id, count='estimate', db=request_db())
+    products = result.get('products', [])  # List of products on this page
+    total = result.get('total', 0)    # Total number of products (estimated)
     
     # Render template with data
-    # In template, can use: {{ products }}, {{ total }}, {{ title }}
+    # In template, can use: {{ products }}, {{ total }}, {{ next_cursor }}, {{ title }}
     return render_template(
         'products.html',
         products=products,      # Variable passed to template
         total=total,        # Variable passed to template
+        next_cursor=result.get('next_cursor'),  # after_id for the "Next page" link
         title='Products List' # Variable passed to template
     )
 
@@ -192,10 +271,11 @@ def new_product():
 
         # Create product
         try:
-            result = create_product(name, int(float(price)*100))
+            result = create_product(name, int(float(price)*100), db=request_db())
             flash(f'Product {name} created successfully!', 'success')
             return redirect(url_for('products_page'))
         except Exception as e:
+            request_db().rollback()  # Don't commit a half-done write with the redirect
             flash(f'Error: {str(e)}', 'error')
             return redirect(url_for('new_product'))
 
@@ -212,44 +292,41 @@ def orders_page():
     Orders list page
     
     Workflow:
-    1. User selects a user from dropdown
+    1. User picks a user in the user picker (typeahead, see /users/search)
     2. Get orders data for selected user from database
     3. Pass data to template
     4. Template displays orders list
     """
-    # Get users for dropdown
-    users_result = list_users()
-    users = users_result.get('users', [])
-    
     # Handle POST request (user selection)
     if request.method == 'POST':
         user_id = request.form.get('user_id')
         
         if user_id:
             user_id = int(user_id)
-            # Get orders for selected user
-            result = list_orders(user_id)
+            # Get the first page of orders for selected user, plus the user's order count
+            result = list_orders(user_id, limit=MAX_PAGE_SIZE, count='exact', db=request_db())
             orders = result.get('orders', [])
             total = result.get('total', 0)
             
             return render_template(
                 'orders.html',
-                users=users,
                 orders=orders,
                 total=total,
+                has_more=result.get('next_cursor') is not None,
                 selected_user_id=user_id,
+                selected_user_label=request.form.get('user_search', ''),  # keep the picker text
                 title='Orders List'
             )
     
     # GET request: show user selection form; pre-select the logged-in user from session if any
-    # so the dropdown defaults to current user without requiring them to pick again
+    # so the picker defaults to current user without requiring them to pick again
     selected_user_id = session.get('user_id')
     return render_template(
         'orders.html',
-        users=users,
         orders=[],
         total=0,
         selected_user_id=selected_user_id,
+        selected_user_label=current_user_label(),
         title='Orders List'
     )
 
@@ -262,14 +339,11 @@ def new_order():
     Create new order form
     
     Workflow:
-    - GET request: Display form with user dropdown and products table
+    - GET request: Display form with user picker and products table
     - POST request: Handle form submission, create order with selected items
     """
-    # Get users and products for the form
-    users_result = list_users()
-    users = users_result.get('users', [])
-    products_result = list_products()
-    products = products_result.get('products', [])
+    # Get products for the form (users are searched on demand by the user picker)
+    products = fetch_all(list_products, 'products', db=request_db())
     
     # Handle POST request (form submission)
     if request.method == 'POST':
@@ -299,21 +373,22 @@ def new_order():
         
         # Create order
         try:
-            result = create_order(int(user_id), 'pending', items)
+            result = create_order(int(user_id), 'pending', items, db=request_db())
             flash(f'Order #{result["id"]} for user #{user_id} in {result["status"]} Status created successfully!', 'success')
             return redirect(url_for('orders_page'))
         except Exception as e:
+            request_db().rollback()  # Don't commit a half-done write with the redirect
             flash(f'Error: {str(e)}', 'error')
             return redirect(url_for('new_order'))
     
     # GET request: display form; pre-select logged-in user from session so Create Order
-    # form opens with the current user already selected in the dropdown
+    # form opens with the current user already selected in the user picker
     selected_user_id = session.get('user_id')
     return render_template(
         'new_order.html',
-        users=users,
         products=products,
         selected_user_id=selected_user_id,
+        selected_user_label=current_user_label(),
         title='Create Order'
     )
 
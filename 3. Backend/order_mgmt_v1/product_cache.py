@@ -0,0 +1,250 @@
+"""
+Product Catalog Cache
+
+The product catalog changes a few times a day but is read on every order
+page and every checkout. This module keeps recently read products in memory
+so most of those reads never reach the database.
+
+How it works (read-through cache):
+1. A caller asks the cache for a value and passes a "loader" function
+2. If the value is cached and not older than the TTL, it is returned (hit)
+3. Otherwise the loader queries the database, and the result is cached (miss)
+
+The cache is:
+- Bounded: at most PRODUCT_CACHE_MAX_ENTRIES entries, least recently used are evicted
+- Time-limited: entries expire after PRODUCT_CACHE_TTL_SECONDS (0 disables the cache)
+- Invalidated: db_operations.create_product() calls product_cache.invalidate() after commit
+
+Storage is pluggable (CacheBackend). LocalCacheBackend keeps entries in this
+process; with several worker processes each worker has its own copy, and
+invalidate() only clears the worker that created the product (the others
+catch up within the TTL). A shared backend (e.g. Redis) can implement the
+same four methods to share entries between workers.
+
+Cached values are shared between callers - treat them as read-only.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+# Configuration (environment variables, see .env.example)
+PRODUCT_CACHE_TTL_SECONDS = float(os.getenv('PRODUCT_CACHE_TTL_SECONDS', '60'))
+PRODUCT_CACHE_MAX_ENTRIES = int(os.getenv('PRODUCT_CACHE_MAX_ENTRIES', '10000'))
+
+
+class CacheBackend(ABC):
+    """
+    Storage interface used by ProductCache.
+
+    get() returns None for a missing or expired key, so None itself cannot be cached.
+    A backend that misses one of the methods fails when it is created.
+    """
+
+    @abstractmethod
+    def get(self, key: str):
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: float):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    In-process LRU cache with a per-entry expiry time.
+
+    Thread-safe (one lock around an OrderedDict). Pass a custom `clock`
+    function to control expiry without waiting (see cache_check.py).
+    """
+
+    def __init__(self, max_entries: int = PRODUCT_CACHE_MAX_ENTRIES, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            # Evict least recently used entries beyond the size limit
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ProductCache:
+    """
+    Read-through cache for products and product list pages.
+
+    Keys are prefixed with a generation number that invalidate() bumps, so a
+    slow read that started before an invalidation cannot put stale data back
+    under a key that is still in use.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None, ttl: float = PRODUCT_CACHE_TTL_SECONDS):
+        self.backend = backend if backend is not None else LocalCacheBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _key(self, *parts, generation: Optional[int] = None) -> str:
+        if generation is None:
+            generation = self._generation
+        return ":".join(["products", str(generation)] + [str(part) for part in parts])
+
+    def _count(self, hits: int = 0, misses: int = 0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_or_load(self, key_parts: tuple, loader: Callable[[], object]):
+        """
+        Return the cached value for `key_parts`, or call loader() and cache its result.
+
+        Example: product_cache.get_or_load(("page", after_id, limit), lambda: query_page(...))
+        """
+        if not self.enabled:
+            return loader()
+
+        key, value = self._lookup(key_parts)
+        if value is None:
+            value = loader()
+            self.backend.set(key, value, self.ttl)
+        return value
+
+    async def get_or_load_async(self, key_parts: tuple, loader: Callable[[], Awaitable]):
+        """get_or_load() for async code: loader() returns an awaitable (see db_operations_async)."""
+        if not self.enabled:
+            return await loader()
+
+        key, value = self._lookup(key_parts)
+        if value is None:
+            value = await loader()
+            self.backend.set(key, value, self.ttl)
+        return value
+
+    def get_many(self, product_ids, loader: Callable[[set], dict]) -> dict:
+        """
+        Return {product_id: product} for the given IDs.
+
+        Cached products are returned directly; all the others are loaded with ONE
+        call to loader(missing_ids), which must return {product_id: product}.
+        IDs that do not exist are simply absent from the result.
+        """
+        product_ids = set(product_ids)
+        if not self.enabled:
+            return loader(product_ids)
+
+        # Keys use the generation from before the load: if invalidate() runs
+        # while loader() reads the database, its rows go to the dropped generation
+        generation = self._generation
+        products, missing = self._lookup_many(product_ids, generation)
+        if missing:
+            products.update(self._store_many(loader(missing), generation))
+        return products
+
+    async def get_many_async(self, product_ids, loader: Callable[[set], Awaitable]) -> dict:
+        """get_many() for async code: loader(missing_ids) returns an awaitable."""
+        product_ids = set(product_ids)
+        if not self.enabled:
+            return await loader(product_ids)
+
+        generation = self._generation  # before the load, see get_many()
+        products, missing = self._lookup_many(product_ids, generation)
+        if missing:
+            products.update(self._store_many(await loader(missing), generation))
+        return products
+
+    def _lookup(self, key_parts: tuple) -> tuple:
+        """Return (key, cached value or None) and count the hit or miss."""
+        key = self._key(*key_parts)
+        value = self.backend.get(key)
+        if value is not None:
+            self._count(hits=1)
+        else:
+            self._count(misses=1)
+        return key, value
+
+    def _lookup_many(self, product_ids: set, generation: int) -> tuple:
+        """Return ({product_id: cached product}, set of IDs that are not cached)."""
+        products = {}
+        for product_id in product_ids:
+            product = self.backend.get(self._key("id", product_id, generation=generation))
+            if product is not None:
+                products[product_id] = product
+
+        missing = product_ids - products.keys()
+        self._count(hits=len(products), misses=len(missing))
+        return products, missing
+
+    def _store_many(self, loaded: dict, generation: int) -> dict:
+        """Cache every product of a {product_id: product} dictionary (under `generation`) and return it."""
+        for product_id, product in loaded.items():
+            self.backend.set(self._key("id", product_id, generation=generation), product, self.ttl)
+        return loaded
+
+    def invalidate(self):
+        """Drop everything cached (call after the catalog changes)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and settings, e.g. for an admin endpoint."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+            "entries": len(self.backend) if hasattr(self.backend, "__len__") else None
+        }
+
+
+# Shared cache instance used by db_operations
+product_cache = ProductCache()